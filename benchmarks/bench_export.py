@@ -0,0 +1,108 @@
+"""
+Compare the columnar CSV export engine to the previous row-by-row ones.
+
+Usage::
+
+    python -m benchmarks.bench_export --logs 100000 --fields 10
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+
+from benchmarks.utils import best_of, create_form_definition, create_form_logs, setup_django, test_database
+
+
+def get_original_exporter_class():
+    from django.utils.encoding import force_text
+    from form_designer import settings
+    from form_designer.contrib.exporters.csv_exporter import CsvExporter
+    from form_designer.templatetags.friendly import friendly
+
+    class OriginalCsvExporter(CsvExporter):
+        """
+        The original export engine, which loads the data of each form log separately.
+        """
+
+        def iter_rows(self, queryset):
+            fields = queryset[0].form_definition.get_field_dict()
+            yield [force_text(field.label or field.name) for field in fields.values()]
+            for entry in queryset:
+                row = [entry.created, entry.pk]
+                name_to_value = {d['name']: d['value'] for d in entry.data}
+                for field in fields:
+                    value = friendly(name_to_value.get(field), null_value=settings.CSV_EXPORT_NULL_VALUE)
+                    row.append(force_text(value, encoding=settings.CSV_EXPORT_ENCODING))
+                yield row
+
+    return OriginalCsvExporter
+
+
+def get_row_by_row_exporter_class():
+    from django.utils.encoding import force_text
+    from form_designer import settings
+    from form_designer.contrib.exporters.csv_exporter import CsvExporter
+    from form_designer.models import prefetch_form_data
+    from form_designer.templatetags.friendly import friendly
+    from form_designer.utils import chunked
+
+    class RowByRowCsvExporter(CsvExporter):
+        """
+        The export engine preceding the columnar one: every log's data is materialized as a list of
+        `FormValueDict`s and each cell is passed through `friendly()` and `force_text()`.
+        """
+
+        def iter_rows(self, queryset):
+            fields = queryset[0].form_definition.get_field_dict()
+            yield [force_text(field.label or field.name) for field in fields.values()]
+            entries = queryset.select_related('form_definition').iterator()
+            for chunk in chunked(entries, settings.EXPORT_CHUNK_SIZE):
+                for entry in prefetch_form_data(chunk):
+                    row = [entry.created, entry.pk]
+                    name_to_value = {d['name']: d['value'] for d in entry.data}
+                    for field in fields:
+                        value = friendly(name_to_value.get(field), null_value=settings.CSV_EXPORT_NULL_VALUE)
+                        row.append(force_text(value, encoding=settings.CSV_EXPORT_ENCODING))
+                    yield row
+
+    return RowByRowCsvExporter
+
+
+def consume(exporter_class, queryset):
+    from form_designer.models import FormLog
+    exporter_class.streaming = True
+    response = exporter_class(FormLog).export(None, queryset)
+    for _ in response.streaming_content:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--logs', type=int, default=10000)
+    parser.add_argument('--fields', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--skip-original', action='store_true', help='skip the slow original engine')
+    args = parser.parse_args()
+
+    setup_django()
+    from form_designer.contrib.exporters.csv_exporter import CsvExporter
+    from form_designer.models import FormLog
+
+    with test_database():
+        fd = create_form_definition(args.fields)
+        create_form_logs(fd, args.logs)
+        queryset = FormLog.objects.filter(form_definition=fd)
+        original = None
+        if not args.skip_original:
+            original = best_of(lambda: consume(get_original_exporter_class(), queryset), args.repeat)
+        row_by_row = best_of(lambda: consume(get_row_by_row_exporter_class(), queryset), args.repeat)
+        columnar = best_of(lambda: consume(CsvExporter, queryset), args.repeat)
+
+    print('CSV export of %d logs with %d fields' % (args.logs, args.fields))
+    if original is not None:
+        print('  original (per-log queries): %8.3f s  (%.1f x slower)' % (original, original / columnar))
+    print('  row-by-row, batch-loaded:   %8.3f s  (%.1f x slower)' % (row_by_row, row_by_row / columnar))
+    print('  columnar:                   %8.3f s' % columnar)
+
+
+if __name__ == '__main__':
+    main()
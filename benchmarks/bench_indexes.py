@@ -0,0 +1,125 @@
+"""
+Show the query plans and timings of the hot form definition, form log and form value lookups,
+with and without the indexes added in migrations 0009 and 0013.
+
+Usage::
+
+    python -m benchmarks.bench_indexes --values 1000000 --fields 10 --definitions 1000
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import datetime
+from collections import OrderedDict
+
+from benchmarks.utils import best_of, create_form_definition, create_form_logs, setup_django, test_database
+
+# The indexes are dropped and recreated with the schema editor, as migrating back would also drop later columns
+INDEXED_FIELDS = (('FormDefinition', 'public_hash'), ('FormLog', 'created'))
+INDEXED_TOGETHER_MODELS = ('FormLog', 'FormValue')
+
+
+def seed(n_definitions, n_fields, n_values):
+    from form_designer.models import FormDefinition
+    from form_designer.utils import get_random_hash
+    FormDefinition.objects.bulk_create([
+        FormDefinition(name='other-%d' % n, public_hash=get_random_hash(), private_hash=get_random_hash())
+        for n in range(n_definitions - 1)
+    ])
+    form_definition = create_form_definition(n_fields)
+    create_form_logs(form_definition, n_values // n_fields)
+    return form_definition
+
+
+def get_queries(form_definition):
+    from django.utils import timezone
+    from form_designer.models import FormDefinition, FormLog, FormValue
+    last_log = FormLog.objects.order_by('pk').last()
+    since = timezone.now() - datetime.timedelta(hours=1)
+    return [
+        ('definition by public hash', FormDefinition.objects.filter(public_hash=form_definition.public_hash)),
+        ('newest logs of a form', FormLog.objects.filter(form_definition=form_definition).order_by('-created')[:100]),
+        ('logs of a form by date', FormLog.objects.filter(form_definition=form_definition, created__gte=since)[:100]),
+        ('logs by date', FormLog.objects.filter(created__gte=since).order_by('-created')[:100]),
+        ('page of logs of a form', form_definition.logs.filter(pk__lt=last_log.pk).order_by('-pk')[:100]),
+        ('value of a log by name', FormValue.objects.filter(form_log=last_log, field_name='field_0')),
+    ]
+
+
+def explain(queryset):
+    from django.db import connections
+    connection = connections[queryset.db]
+    sql, params = queryset.query.sql_with_params()
+    prefix = ('EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN ')
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        return [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+
+
+def set_indexes(enabled):
+    """
+    Create or drop the indexes of migrations 0009 and 0013.
+    """
+    from django.apps import apps
+    from django.db import connection
+    with connection.schema_editor() as schema_editor:
+        for model_name, field_name in INDEXED_FIELDS:
+            model = apps.get_model('form_designer', model_name)
+            field = model._meta.get_field(field_name)
+            unindexed_field = field.clone()
+            unindexed_field.db_index = False
+            unindexed_field.set_attributes_from_name(field.name)
+            unindexed_field.model = model
+            if enabled:
+                schema_editor.alter_field(model, unindexed_field, field)
+            else:
+                schema_editor.alter_field(model, field, unindexed_field)
+        for model_name in INDEXED_TOGETHER_MODELS:
+            model = apps.get_model('form_designer', model_name)
+            index_together = model._meta.index_together
+            if enabled:
+                schema_editor.alter_index_together(model, (), index_together)
+            else:
+                schema_editor.alter_index_together(model, index_together, ())
+
+
+def run_queries(form_definition, repeat):
+    results = OrderedDict()
+    for name, queryset in get_queries(form_definition):
+        timing = best_of(lambda: list(queryset.all()), repeat)
+        results[name] = (timing, explain(queryset))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--values', type=int, default=1000000, help='number of form values to create')
+    parser.add_argument('--fields', type=int, default=10, help='number of fields per form log')
+    parser.add_argument('--definitions', type=int, default=1000, help='number of form definitions')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+
+    with test_database():
+        print('Seeding %d form values in %d form logs...' % (args.values, args.values // args.fields))
+        form_definition = seed(args.definitions, args.fields, args.values)
+        with_indexes = run_queries(form_definition, args.repeat)
+        set_indexes(False)
+        without_indexes = run_queries(form_definition, args.repeat)
+        set_indexes(True)
+
+    for name, (timing, plan) in with_indexes.items():
+        old_timing, old_plan = without_indexes[name]
+        print()
+        print('%s: %.2f ms without indexes, %.2f ms with indexes' % (name, old_timing * 1000, timing * 1000))
+        print('  plan without indexes:')
+        for line in old_plan:
+            print('    %s' % line)
+        print('  plan with indexes:')
+        for line in plan:
+            print('    %s' % line)
+
+
+if __name__ == '__main__':
+    main()
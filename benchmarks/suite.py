@@ -0,0 +1,214 @@
+"""
+Time the hot paths of form rendering, submission, logging, mailing and exporting, and record their
+query counts, for form definitions and log tables of different sizes.
+
+Results are written to a JSON file, which can be compared to a baseline from an earlier run::
+
+    python -m benchmarks.suite --output baseline.json
+    # ... change things ...
+    python -m benchmarks.suite --output results.json --baseline baseline.json
+
+The comparison exits with status 1 if any benchmark got slower than the tolerance allows, or now
+runs more queries. Sizes are configurable; e.g. for a million logged submissions::
+
+    python -m benchmarks.suite --fields 10 --logs 10000 1000000
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import datetime
+import json
+import platform
+import sys
+from collections import OrderedDict
+
+from benchmarks.utils import create_form_definition, create_form_logs, setup_django, test_database
+
+XLS_MAX_ROWS = 65535
+
+
+def measure(func, repeat, number=1):
+    """
+    Run `func` `number` times per repetition and return the best time per call in seconds,
+    as well as the number of queries one call runs.
+    """
+    import time
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    with CaptureQueriesContext(connection) as queries:
+        func()
+    timings = []
+    for _ in range(repeat):
+        start = time.time()
+        for _ in range(number):
+            func()
+        timings.append((time.time() - start) / number)
+    return {'seconds': min(timings), 'queries': len(queries)}
+
+
+def get_post_data(form_definition):
+    from benchmarks.utils import get_sample_value
+    data = {form_definition.submit_flag_name: 'true'}
+    for field in form_definition.get_field_dict().values():
+        value = get_sample_value(field.field_class, 1)
+        if value is True:
+            value = 'on'
+        if value is not False:
+            data[field.name] = value
+    return data
+
+
+def run_form_benchmarks(form_definition, args):
+    """
+    Benchmark the paths that handle a single form: rendering, submitting, logging and mailing.
+    """
+    from django.contrib.auth.models import AnonymousUser
+    from django.test import RequestFactory
+    from form_designer.email import build_form_mail
+    from form_designer.forms import DesignedForm
+    from form_designer.views import process_form
+
+    rf = RequestFactory()
+    post_data = get_post_data(form_definition)
+
+    def request(method, data=None):
+        request = getattr(rf, method)('/', data or {})
+        request.user = AnonymousUser()
+        return request
+
+    def submit():
+        return process_form(request('post', post_data), form_definition, push_messages=False, disable_redirection=True)
+
+    form = DesignedForm(form_definition, None, post_data)
+    assert form.is_valid(), form.errors
+    number = args.number
+    return OrderedDict([
+        ('designed_form', measure(lambda: DesignedForm(form_definition), args.repeat, number)),
+        ('process_form_get', measure(
+            lambda: process_form(request('get'), form_definition, push_messages=False), args.repeat, number
+        )),
+        ('process_form_post', measure(submit, args.repeat, number)),
+        ('log', measure(lambda: form_definition.log(form), args.repeat, number)),
+        ('build_form_mail', measure(lambda: build_form_mail(form_definition, form), args.repeat, number)),
+    ])
+
+
+def run_log_benchmarks(form_definition, args):
+    """
+    Benchmark the paths that read the logs of a form.
+    """
+    from form_designer.contrib.exporters.csv_exporter import CsvExporter
+    from form_designer.contrib.exporters.xls_exporter import XlsExporter
+    from form_designer.contrib.exporters.xlsx_exporter import XlsxExporter
+    from form_designer.models import FormLog
+
+    queryset = FormLog.objects.filter(form_definition=form_definition)
+    log_pk = queryset.order_by('pk').values_list('pk', flat=True)[0]
+
+    def get_data():
+        return FormLog.objects.get(pk=log_pk).data
+
+    def export(exporter_class):
+        response = exporter_class(FormLog).export(None, queryset)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+
+    results = OrderedDict([
+        ('get_data', measure(get_data, args.repeat, args.number)),
+        ('csv_export', measure(lambda: export(CsvExporter), args.repeat)),
+        ('xlsx_export', measure(lambda: export(XlsxExporter), args.repeat)),
+    ])
+    if XlsExporter.is_enabled() and queryset.count() <= XLS_MAX_ROWS:
+        results['xls_export'] = measure(lambda: export(XlsExporter), args.repeat)
+    return results
+
+
+def run(args):
+    from form_designer.models import FormLog
+    results = OrderedDict()
+    with test_database():
+        for n_fields in args.fields:
+            form_definition = create_form_definition(n_fields)
+            for name, result in run_form_benchmarks(form_definition, args).items():
+                results['%s[fields=%d]' % (name, n_fields)] = result
+            for n_logs in sorted(args.logs):
+                if n_logs * n_fields > args.max_values:
+                    print('Skipping %d logs with %d fields (see --max-values)' % (n_logs, n_fields), file=sys.stderr)
+                    continue
+                # the log table grows from one size to the next
+                n_existing = FormLog.objects.filter(form_definition=form_definition).count()
+                create_form_logs(form_definition, max(n_logs - n_existing, 0))
+                for name, result in run_log_benchmarks(form_definition, args).items():
+                    results['%s[fields=%d,logs=%d]' % (name, n_fields, n_logs)] = result
+                print('Done: %d fields, %d logs' % (n_fields, n_logs), file=sys.stderr)
+    return results
+
+
+def get_metadata(args):
+    import django
+    from django.db import connection
+    return OrderedDict([
+        ('created', datetime.datetime.utcnow().isoformat()),
+        ('python', platform.python_version()),
+        ('django', django.get_version()),
+        ('database', connection.vendor),
+        ('repeat', args.repeat),
+    ])
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print the changes against the baseline and return the names of the regressed benchmarks.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print('%-50s %10.6f s %6d queries  (new)' % (name, result['seconds'], result['queries']))
+            continue
+        ratio = result['seconds'] / base['seconds'] if base['seconds'] else 1
+        regressed = (ratio > 1 + tolerance or result['queries'] > base['queries'])
+        if regressed:
+            regressions.append(name)
+        print('%-50s %10.6f s %6d queries  %+6.1f%% time, %+d queries%s' % (
+            name, result['seconds'], result['queries'], (ratio - 1) * 100, result['queries'] - base['queries'],
+            ('  REGRESSION' if regressed else ''),
+        ))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--fields', type=int, nargs='+', default=[10, 100, 500], help='field counts of the definitions')
+    parser.add_argument('--logs', type=int, nargs='+', default=[10000], help='numbers of logged submissions')
+    parser.add_argument(
+        '--max-values', type=int, default=5000000,
+        help='skip log tables that would have more form values than this'
+    )
+    parser.add_argument('--repeat', type=int, default=3, help='repetitions per benchmark, the best one counts')
+    parser.add_argument('--number', type=int, default=20, help='calls per repetition for per-submission paths')
+    parser.add_argument('--output', help='file to write the results to, as JSON')
+    parser.add_argument('--baseline', help='results file to compare the results to')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown against the baseline')
+    args = parser.parse_args()
+
+    setup_django()
+    results = run(args)
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(OrderedDict([('meta', get_metadata(args)), ('results', results)]), outfile, indent=2)
+    if args.baseline:
+        with open(args.baseline) as infile:
+            baseline = json.load(infile)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print('%d regression(s) against %s' % (len(regressions), args.baseline))
+            sys.exit(1)
+    else:
+        for name, result in results.items():
+            print('%-50s %10.6f s %6d queries' % (name, result['seconds'], result['queries']))
+
+
+if __name__ == '__main__':
+    main()
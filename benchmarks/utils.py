@@ -0,0 +1,103 @@
+"""
+Helpers shared by the benchmark scripts.
+
+The benchmarks use the test project's settings (`dfd_tests.settings`) and run against a throwaway
+test database created with Django's test database machinery.
+"""
+from __future__ import print_function, unicode_literals
+
+import os
+import time
+from contextlib import contextmanager
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dfd_tests.settings')
+    import django
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    """
+    Create a test database for the duration of the block.
+    """
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def best_of(func, repeat=3):
+    """
+    Run `func` `repeat` times and return the best wall time in seconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def create_form_definition(n_fields, name=None):
+    from form_designer.models import FormDefinition, FormDefinitionField
+    field_classes = (
+        'django.forms.CharField',
+        'django.forms.IntegerField',
+        'django.forms.BooleanField',
+        'django.forms.EmailField',
+    )
+    fd = FormDefinition.objects.create(
+        name=name or 'bench-%d' % n_fields,
+        mail_to='test@example.com',
+        mail_subject='Benchmark {{ field_0 }}',
+    )
+    FormDefinitionField.objects.bulk_create([
+        FormDefinitionField(
+            form_definition=fd,
+            name='field_%d' % n,
+            label='Field %d' % n,
+            field_class=field_classes[n % len(field_classes)],
+            position=n,
+            required=False,
+        )
+        for n in range(n_fields)
+    ])
+    return fd
+
+
+def get_sample_value(field_class, n):
+    if field_class == 'django.forms.IntegerField':
+        return n
+    if field_class == 'django.forms.BooleanField':
+        return bool(n % 2)
+    if field_class == 'django.forms.EmailField':
+        return 'user%d@example.com' % n
+    return 'Value number %d' % n
+
+
+def create_form_logs(form_definition, n_logs, batch_size=500):
+    """
+    Insert `n_logs` form logs with a value for each field of the form definition.
+    """
+    from django.db import transaction
+    from form_designer.models import FormLog, FormValue
+    fields = list(form_definition.get_field_dict().values())
+    created = 0
+    while created < n_logs:
+        count = min(batch_size, n_logs - created)
+        with transaction.atomic():
+            logs = [FormLog.objects.create(form_definition=form_definition) for _ in range(count)]
+            FormValue.objects.bulk_create([
+                FormValue(form_log=log, field_name=field.name, value=get_sample_value(field.field_class, log.pk))
+                for log in logs
+                for field in fields
+            ], batch_size=batch_size)
+        created += count
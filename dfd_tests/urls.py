@@ -3,4 +3,5 @@ from django.contrib import admin
 
 urlpatterns = [
     url(r'^admin/', include(admin.site.urls)),
+    url(r'^forms/', include('form_designer.urls')),
 ]
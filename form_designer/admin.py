@@ -2,13 +2,16 @@ from __future__ import unicode_literals
 
 from django.conf.urls import url
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
 from django.http import Http404
 from django.utils.module_loading import import_string
 from django.utils.translation import ugettext_lazy as _
 
 from form_designer import settings
 from form_designer.forms import FormDefinitionFieldInlineForm, FormDefinitionForm
-from form_designer.models import FormDefinition, FormDefinitionField, FormLog
+from form_designer.models import (
+    SUMMARY_HTML_TEMPLATE, FormDefinition, FormDefinitionField, FormLog, OutboxMail, prefetch_form_data
+)
 
 
 class FormDefinitionFieldInline(admin.StackedInline):
@@ -30,8 +33,13 @@ class FormDefinitionAdmin(admin.ModelAdmin):
     save_as = True
     fieldsets = [
         (_('Basic'), {'fields': ['name', 'require_hash', 'method', 'action', 'title', 'body']}),
-        (_('Settings'), {'fields': ['allow_get_initial', 'log_data', 'success_redirect', 'success_clear', 'display_logged', 'save_uploaded_files'], 'classes': ['collapse']}),
-        (_('Mail form'), {'fields': ['mail_to', 'mail_from', 'mail_subject', 'mail_uploaded_files'], 'classes': ['collapse']}),
+        (_('Settings'), {'fields': [
+            'allow_get_initial', 'log_data', 'success_redirect', 'success_clear', 'display_logged',
+            'save_uploaded_files', 'max_upload_size', 'max_upload_total_size',
+        ], 'classes': ['collapse']}),
+        (_('Mail form'), {'fields': [
+            'mail_to', 'mail_from', 'mail_subject', 'mail_uploaded_files', 'mail_attachment_max_size',
+        ], 'classes': ['collapse']}),
         (_('Templates'), {'fields': ['html_default_template', 'message_template', 'form_template_name'], 'classes': ['collapse']}),
         (_('Messages'), {'fields': ['success_message', 'error_message', 'submit_label'], 'classes': ['collapse']}),
     ]
@@ -43,10 +51,19 @@ class FormDefinitionAdmin(admin.ModelAdmin):
     search_fields = ('name', 'title')
 
 
+class FormLogChangeList(ChangeList):
+    def get_results(self, request):
+        super(FormLogChangeList, self).get_results(request)
+        # Only logs whose summaries haven't been rendered yet show their data (see `FormLogAdmin.data_html`),
+        # so only theirs is loaded, in a batch.
+        prefetch_form_data([form_log for form_log in self.result_list if not form_log.summary_html])
+
+
 class FormLogAdmin(admin.ModelAdmin):
     list_display = ('form_no_link', 'created', 'id', 'created_by', 'data_html')
     list_filter = ('form_definition',)
     list_display_links = ()
+    list_select_related = ('form_definition',)
     date_hierarchy = 'created'
 
     exporter_classes = {}
@@ -60,6 +77,9 @@ class FormLogAdmin(admin.ModelAdmin):
     def get_exporter_classes(self):
         return self.__class__.exporter_classes_ordered
 
+    def get_changelist(self, request, **kwargs):
+        return FormLogChangeList
+
     def get_actions(self, request):
         actions = super(FormLogAdmin, self).get_actions(request)
 
@@ -87,7 +107,9 @@ class FormLogAdmin(admin.ModelAdmin):
         return urls + super(FormLogAdmin, self).get_urls()
 
     def data_html(self, obj):
-        return obj.form_definition.compile_message(obj.data, 'html/formdefinition/data_message.html')
+        if obj.summary_html:
+            return obj.summary_html
+        return obj.form_definition.compile_message(obj.data, SUMMARY_HTML_TEMPLATE)
     data_html.allow_tags = True
     data_html.short_description = _('Data')
 
@@ -134,5 +156,17 @@ class FormLogAdmin(admin.ModelAdmin):
         return super(FormLogAdmin, self).changelist_view(request, extra_context)
 
 
+class OutboxMailAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'form_definition', 'status', 'attempts', 'created', 'next_attempt_at', 'sent')
+    list_filter = ('status', 'form_definition')
+    readonly_fields = ('form_definition', 'attempts', 'created', 'sent', 'last_error')
+    fields = ('form_definition', 'status', 'attempts', 'created', 'next_attempt_at', 'sent', 'last_error')
+    date_hierarchy = 'created'
+
+    def has_add_permission(self, request):
+        return False
+
+
 admin.site.register(FormDefinition, FormDefinitionAdmin)
 admin.site.register(FormLog, FormLogAdmin)
+admin.site.register(OutboxMail, OutboxMailAdmin)
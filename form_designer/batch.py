@@ -0,0 +1,123 @@
+"""
+Processing of batches of submissions, e.g. from devices that collected them while offline.
+
+Every submission is validated with the form definition's form class like in `process_form`, but
+all valid ones are logged in one transaction, and their mails are queued or sent together.
+"""
+from __future__ import unicode_literals
+
+import logging
+
+from django.db import transaction
+from django.forms.forms import NON_FIELD_ERRORS
+from django.utils.encoding import force_text
+from django.utils.module_loading import import_string
+from django.utils.translation import ugettext as _
+
+from form_designer import metrics as app_metrics
+from form_designer import settings as app_settings
+from form_designer.email import build_form_mail, send_form_mails
+from form_designer.models import FormLog, OutboxMail, SubmissionPayload
+from form_designer.signals import designedform_error, designedform_submit, designedform_success
+
+logger = logging.getLogger('form_designer.batch')
+
+STATUS_OK = 'ok'
+STATUS_INVALID = 'invalid'
+
+
+def get_form_errors(form):
+    return dict(
+        (field_name, [force_text(error) for error in errors])
+        for field_name, errors in form.errors.items()
+    )
+
+
+def validate_batch(request, form_definition, items, form_class):
+    """
+    Validate the submissions and return their results, along with the payloads of the valid ones.
+    """
+    results = []
+    payloads = []
+    for item in items:
+        if not isinstance(item, dict):
+            results.append({
+                'status': STATUS_INVALID,
+                'errors': {NON_FIELD_ERRORS: [_('Expected an object of field names and values.')]},
+            })
+            continue
+        context = {}
+        form = form_class(form_definition, None, item)
+        designedform_submit.send(sender=process_batch, context=context,
+                                 form_definition=form_definition, request=request)
+        app_metrics.inc('form_designer_submissions_total', form=form_definition.name)
+        if form.is_valid():
+            payload = SubmissionPayload.from_form(form_definition, form)
+            payloads.append(payload)
+            results.append({'status': STATUS_OK})
+            designedform_success.send(sender=process_batch, context=context,
+                                      form_definition=form_definition, request=request, payload=payload)
+        else:
+            app_metrics.inc('form_designer_validation_errors_total', form=form_definition.name)
+            results.append({'status': STATUS_INVALID, 'errors': get_form_errors(form)})
+            designedform_error.send(sender=process_batch, context=context,
+                                    form_definition=form_definition, request=request)
+    return results, payloads
+
+
+def process_batch(request, form_definition, items, form_class=None):
+    """
+    Validate, log and mail a batch of submissions.
+
+    :param items: List of submissions, each a dict of field names and values
+    :return: A dict with the results of the submissions, in order, and the numbers of mails that were
+             queued, sent or could not be sent
+    """
+    if form_class is None:
+        form_class = import_string(app_settings.DESIGNED_FORM_CLASS)
+    results, payloads = validate_batch(request, form_definition, items, form_class)
+    valid_results = [result for result in results if result['status'] == STATUS_OK]
+    user = getattr(request, 'user', None)
+    created_by = (user if user is not None and user.is_authenticated() else None)
+    mail_messages = []
+    if form_definition.mail_to:
+        mail_messages = [build_form_mail(form_definition, None, payload=payload) for payload in payloads]
+    mails = {'queued': 0, 'sent': 0, 'failed': 0}
+
+    with transaction.atomic():
+        if form_definition.log_data and payloads:
+            form_logs = FormLog.objects.bulk_create_with_data(
+                form_definition, [list(payload.data) for payload in payloads], created_by=created_by
+            )
+            for result, form_log in zip(valid_results, form_logs):
+                result['id'] = form_log.pk
+        if mail_messages and app_settings.MAIL_OUTBOX:
+            OutboxMail.objects.bulk_create([
+                OutboxMail(form_definition=form_definition, message=message) for message in mail_messages
+            ])
+            mails['queued'] = len(mail_messages)
+
+    if mail_messages and not app_settings.MAIL_OUTBOX:
+        failures = send_form_mails(form_definition, mail_messages)
+        mails['sent'] = len(mail_messages) - len(failures)
+        if failures:
+            mails.update(queue_failed_mails(form_definition, failures))
+    return {'results': results, 'mails': mails}
+
+
+def queue_failed_mails(form_definition, failures):
+    """
+    Queue the mails that could not be sent in the outbox, to be retried by `send_queued_mail`.
+
+    The submissions are logged already, so failing to mail them must not fail the batch.
+    """
+    logger.warning(
+        'Could not send %d mails of a batch of %s submissions: %s',
+        len(failures), form_definition.name, failures[0][1],
+    )
+    try:
+        OutboxMail.objects.queue_failed(form_definition, failures)
+    except Exception:
+        logger.exception('Could not queue the unsent mails of a batch of %s submissions', form_definition.name)
+        return {'failed': len(failures)}
+    return {'queued': len(failures)}
@@ -0,0 +1,102 @@
+"""
+Compiled form classes for form definitions.
+
+Turning a `FormDefinition` into form fields means loading its field definitions, importing field and
+widget classes and parsing choices. The outcome only depends on the definition's content, so it is done
+once per definition version and kept in a bounded per-process cache. If a shared cache has been configured
+(`FORM_DESIGNER_CACHE_BACKEND`), the field definitions themselves are kept there too, so other processes
+can compile the form without querying the database.
+"""
+from __future__ import unicode_literals
+
+from django import forms
+from django.forms import widgets
+from django.utils.module_loading import import_string
+
+from form_designer import settings as app_settings
+from form_designer.utils import LRUCache, get_shared_cache
+
+_compiled_forms = LRUCache(app_settings.COMPILED_FORM_CACHE_SIZE)
+
+
+class CompiledForm(object):
+    """
+    The request-independent part of a designed form: the definition's fields, compiled into the
+    `base_fields` of a `forms.Form` subclass.
+
+    Instances are shared between threads and must be treated as read-only.
+    """
+
+    def __init__(self, form_definition, def_fields):
+        self.form_definition_id = form_definition.pk
+        self.version = form_definition.version
+        self.def_fields = tuple(def_fields)
+        self.submit_flag_name = form_definition.get_submit_flag_name(def_field.name for def_field in self.def_fields)
+        file_fields = []
+        attrs = {}
+        for def_field in self.def_fields:
+            field = build_form_field(def_field)
+            attrs[def_field.name] = field
+            if isinstance(field, forms.FileField):
+                file_fields.append(def_field)
+        attrs[self.submit_flag_name] = forms.BooleanField(required=False, initial=1, widget=widgets.HiddenInput)
+        self.file_fields = tuple(file_fields)
+        # The declarative metaclass orders `base_fields` by creation, i.e. by field position.
+        self.form_class = type(forms.Form)(str('CompiledForm'), (forms.Form,), attrs)
+
+    @property
+    def base_fields(self):
+        return self.form_class.base_fields
+
+
+def build_form_field(def_field):
+    """
+    Instantiate the form field described by a `FormDefinitionField`.
+    """
+    return import_string(def_field.field_class)(**def_field.get_form_field_init_args())
+
+
+def _get_fields_cache_key(form_definition):
+    return 'form_designer:fields:%s:%s' % (form_definition.pk, form_definition.version)
+
+
+def get_definition_fields(form_definition):
+    """
+    Get the field definitions of a form definition, using the shared cache if one is configured.
+
+    :rtype: list[form_designer.models.FormDefinitionField]
+    """
+    cache = get_shared_cache()
+    if cache is None:
+        return list(form_definition.formdefinitionfield_set.all())
+    key = _get_fields_cache_key(form_definition)
+    def_fields = cache.get(key)
+    if def_fields is None:
+        def_fields = list(form_definition.formdefinitionfield_set.all())
+        cache.set(key, def_fields, app_settings.CACHE_TIMEOUT)
+    return def_fields
+
+
+def get_compiled_form(form_definition, def_fields=None):
+    """
+    Get the compiled form for the current version of a form definition, compiling it if required.
+
+    :param def_fields: The definition's field definitions, if they have been loaded already
+    :rtype: CompiledForm
+    """
+    if form_definition.pk is None:
+        return CompiledForm(form_definition, ())
+    compiled_form = _compiled_forms.get(form_definition.pk)
+    if compiled_form is None or compiled_form.version != form_definition.version:
+        if def_fields is None:
+            def_fields = get_definition_fields(form_definition)
+        compiled_form = CompiledForm(form_definition, def_fields)
+        _compiled_forms.set(form_definition.pk, compiled_form)
+    return compiled_form
+
+
+def forget_compiled_form(form_definition_id):
+    """
+    Drop the compiled form of a form definition from this process's cache.
+    """
+    _compiled_forms.delete(form_definition_id)
@@ -1,9 +1,19 @@
+import time
+from collections import defaultdict
+
+from django.db import connections
 from django.db.models import Count
+from django.db.models.query import QuerySet
+from django.template.defaultfilters import yesno
+from django.utils import six
 from django.utils.encoding import force_text
 from django.utils.translation import ugettext_lazy as _
 
-from form_designer import settings
+from form_designer import metrics, settings
+from form_designer.models import FormDefinition, FormValue
 from form_designer.templatetags.friendly import friendly
+from form_designer.typed_values import decode_value
+from form_designer.utils import chunked
 
 
 class ExporterBase(object):
@@ -39,11 +49,146 @@ class ExporterBase(object):
         raise NotImplementedError()  # pragma: no cover
 
 
+def format_text(value):
+    if isinstance(value, six.text_type):
+        return value
+    if isinstance(value, (list, tuple, QuerySet)):
+        return format_list(value)
+    return force_text(value, encoding=settings.CSV_EXPORT_ENCODING)
+
+
+def format_list(value):
+    if not isinstance(value, (list, tuple, QuerySet)):
+        return format_text(value)
+    return ", ".join(force_text(item, encoding=settings.CSV_EXPORT_ENCODING) for item in value)
+
+
+class BooleanFormatter(object):
+
+    def __init__(self):
+        # Translate once per export instead of once per cell
+        self.yes = force_text(yesno(True))
+        self.no = force_text(yesno(False))
+
+    def __call__(self, value):
+        return (self.yes if value else self.no)
+
+
+def format_file(value):
+    return force_text(getattr(value, 'url', value), encoding=settings.CSV_EXPORT_ENCODING)
+
+
+def format_friendly(value):
+    return force_text(friendly(value), encoding=settings.CSV_EXPORT_ENCODING)
+
+
+# Formatters by field class. Classes are instantiated once per export.
+TEXT_FORMATTERS = {
+    'django.forms.CharField': format_text,
+    'django.forms.EmailField': format_text,
+    'django.forms.URLField': format_text,
+    'django.forms.IntegerField': format_text,
+    'django.forms.DecimalField': format_text,
+    'django.forms.BooleanField': BooleanFormatter,
+    'django.forms.DateField': format_text,
+    'django.forms.DateTimeField': format_text,
+    'django.forms.TimeField': format_text,
+    'django.forms.ChoiceField': format_text,
+    'django.forms.MultipleChoiceField': format_list,
+    'django.forms.ModelChoiceField': format_text,
+    'django.forms.ModelMultipleChoiceField': format_list,
+    'django.forms.RegexField': format_text,
+    'django.forms.FileField': format_file,
+}
+
+
+class ExportColumn(object):
+
+    def __init__(self, name, label, formatter):
+        self.name = name
+        self.label = label
+        self.formatter = formatter
+
+
 class FormLogExporterBase(ExporterBase):
+    # the header row, once it has been generated
+    header = None
 
     def export(self, request, queryset=None):
         self.init_response()
         self.init_writer()
+        for row in self.iter_rows(queryset):
+            self.writerow(row)
+        self.close()
+        return self.response
+
+    def get_formatter(self, field_class):
+        """
+        Get the callable that turns non-null values of fields of the given class into cells.
+        """
+        formatter = TEXT_FORMATTERS.get(field_class, format_friendly)
+        if isinstance(formatter, type):
+            formatter = formatter()
+        return formatter
+
+    def format_null(self):
+        return force_text(settings.CSV_EXPORT_NULL_VALUE)
+
+    def get_columns(self, form_definition):
+        return [
+            ExportColumn(field.name, field.label or field.name, self.get_formatter(field.field_class))
+            for field in form_definition.get_field_dict().values()
+        ]
+
+    def get_values(self, form_log_ids):
+        """
+        Get the values of the given form logs with a single query.
+
+        The rows are read with a plain cursor and every distinct stored value is only decoded once,
+        which matters as values like choices and booleans tend to repeat a lot.
+
+        :return: dict of form log ID -> dict of field name -> value
+        """
+        queryset = FormValue.objects.filter(form_log__in=form_log_ids).values_list(
+            'form_log_id', 'field_name', 'value_type', 'value_text', 'value_pickled'
+        )
+        sql, params = queryset.query.sql_with_params()
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        to_python = FormValue._meta.get_field('value_pickled').to_python
+        decoded = {}
+        values = defaultdict(dict)
+        for form_log_id, field_name, value_type, value_text, value_pickled in rows:
+            key = (value_type, value_text, value_pickled)
+            try:
+                value = decoded[key]
+            except KeyError:
+                if value_pickled is not None:
+                    value_pickled = to_python(value_pickled)
+                value = decoded[key] = decode_value(value_type, value_text, value_pickled)
+            values[form_log_id][field_name] = value
+        return values
+
+    def iter_rows(self, queryset):
+        """
+        Generate the rows of the export, and record how long it took to generate and write them.
+        """
+        start = time.time()
+        try:
+            for row in self.generate_rows(queryset):
+                yield row
+        finally:
+            metrics.observe('form_designer_export_seconds', time.time() - start, exporter=self.export_format())
+
+    def generate_rows(self, queryset):
+        """
+        Generate the header row (if enabled) and one row per form log.
+
+        Form logs are read with a database iterator, `settings.EXPORT_CHUNK_SIZE` at a time, and the
+        values of each chunk are fetched with one query and pivoted into rows, so memory use does
+        not depend on the size of the queryset.
+        """
         distinct_forms = queryset.aggregate(Count('form_definition', distinct=True))['form_definition__count']
 
         include_created = settings.CSV_EXPORT_INCLUDE_CREATED
@@ -51,42 +196,53 @@ class FormLogExporterBase(ExporterBase):
         include_header = settings.CSV_EXPORT_INCLUDE_HEADER and distinct_forms == 1
         include_form = settings.CSV_EXPORT_INCLUDE_FORM and distinct_forms > 1
 
-        if queryset.count():
-            fields = queryset[0].form_definition.get_field_dict()
-            field_order = list(fields.keys())
-            if include_header:
-                header = []
-                if include_form:
-                    header.append(_('Form'))
-                if include_created:
-                    header.append(_('Created'))
-                if include_pk:
-                    header.append(_('ID'))
-                # Form fields might have been changed and not match
-                # existing form logs anymore.
-                # Hence, use current form definition for header.
-                # for field in queryset[0].data:
-                #    header.append(field['label'] if field['label'] else field['key'])
-                for field_name, field in fields.items():
-                    header.append(field.label or field.name)
-
-                self.writerow([force_text(cell, encoding=settings.CSV_EXPORT_ENCODING) for cell in header])
-
-            for entry in queryset:
+        first_entry = queryset.select_related('form_definition').first()
+        if first_entry is None:
+            return
+        # Form fields might have been changed and not match
+        # existing form logs anymore.
+        # Hence, use current form definition for columns.
+        columns = self.get_columns(first_entry.form_definition)
+        if include_header:
+            header = self.get_header(columns, include_form, include_created, include_pk)
+            self.header = [force_text(cell, encoding=settings.CSV_EXPORT_ENCODING) for cell in header]
+            yield self.header
+        for row in self.generate_log_rows(queryset, columns, include_form, include_created, include_pk):
+            yield row
+
+    def get_header(self, columns, include_form, include_created, include_pk):
+        header = []
+        if include_form:
+            header.append(_('Form'))
+        if include_created:
+            header.append(_('Created'))
+        if include_pk:
+            header.append(_('ID'))
+        header.extend(column.label for column in columns)
+        return header
+
+    def generate_log_rows(self, queryset, columns, include_form, include_created, include_pk):
+        form_names = {}
+        if include_form:
+            form_names = dict(
+                (form_definition.pk, force_text(form_definition))
+                for form_definition in FormDefinition.objects.filter(pk__in=queryset.values('form_definition'))
+            )
+        null_value = self.format_null()
+        entries = queryset.values_list('pk', 'created', 'form_definition_id').iterator()
+        for chunk in chunked(entries, settings.EXPORT_CHUNK_SIZE):
+            values = self.get_values([pk for (pk, created, form_definition_id) in chunk])
+            for pk, created, form_definition_id in chunk:
                 row = []
                 if include_form:
-                    row.append(entry.form_definition)
+                    row.append(form_names[form_definition_id])
                 if include_created:
-                    row.append(entry.created)
+                    row.append(created)
                 if include_pk:
-                    row.append(entry.pk)
-                name_to_value = {d['name']: d['value'] for d in entry.data}
-                for field in field_order:
-                    value = friendly(name_to_value.get(field), null_value=settings.CSV_EXPORT_NULL_VALUE)
-                    value = force_text(value, encoding=settings.CSV_EXPORT_ENCODING)
-                    row.append(value)
+                    row.append(pk)
+                name_to_value = values.get(pk, {})
+                for column in columns:
+                    value = name_to_value.get(column.name)
+                    row.append(null_value if value is None else column.formatter(value))
 
-                self.writerow(row)
-
-        self.close()
-        return self.response
+                yield row
@@ -2,25 +2,38 @@ from __future__ import unicode_literals
 
 import csv
 
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils import six
 from django.utils.encoding import force_bytes
 
 from form_designer import settings
 from form_designer.contrib.exporters import FormLogExporterBase
+from form_designer.utils import chunked
+
+
+class Echo(object):
+    """
+    A file-like object that returns whatever is written to it, for streaming CSV writers' output.
+    """
+
+    def write(self, value):
+        return value
 
 
 class CsvExporter(FormLogExporterBase):
+    streaming = settings.CSV_EXPORT_STREAMING
 
     @staticmethod
     def export_format():
         return 'CSV'
 
     def init_writer(self):
-        self.writer = csv.writer(self.response, delimiter=settings.CSV_EXPORT_DELIMITER)
+        buffer = (Echo() if self.streaming else self.response)
+        self.writer = csv.writer(buffer, delimiter=settings.CSV_EXPORT_DELIMITER)
 
     def init_response(self):
-        self.response = HttpResponse(content_type='text/csv')
+        response_class = (StreamingHttpResponse if self.streaming else HttpResponse)
+        self.response = response_class(content_type='text/csv')
         self.response['Content-Disposition'] = (
             'attachment; filename=%s.csv' % self.model._meta.verbose_name_plural
         )
@@ -28,7 +41,19 @@ class CsvExporter(FormLogExporterBase):
     def writerow(self, row):
         if six.PY2:
             row = [force_bytes(value, encoding=settings.CSV_EXPORT_ENCODING) for value in row]
-        self.writer.writerow(row)
+        return self.writer.writerow(row)
 
     def export(self, request, queryset=None):
-        return super(CsvExporter, self).export(request, queryset)
+        if not self.streaming:
+            return super(CsvExporter, self).export(request, queryset)
+        self.init_response()
+        self.init_writer()
+        # The rows are only generated (and the form logs read) while the response is being sent.
+        self.response.streaming_content = self.iter_lines(queryset)
+        return self.response
+
+    def iter_lines(self, queryset):
+        # Sending lines in batches keeps the per-chunk overhead of the response low
+        charset = self.response.charset
+        for rows in chunked(self.iter_rows(queryset), 100):
+            yield b''.join(force_bytes(self.writerow(row), encoding=charset) for row in rows)
@@ -0,0 +1,283 @@
+from __future__ import unicode_literals
+
+import datetime
+import os
+import re
+import sys
+import tempfile
+import zipfile
+from decimal import Decimal
+from wsgiref.util import FileWrapper
+from xml.sax.saxutils import escape, quoteattr
+
+from django.http import StreamingHttpResponse
+from django.utils import six, timezone
+from django.utils.encoding import force_text
+
+from form_designer import settings
+from form_designer.contrib.exporters import FormLogExporterBase, format_text
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Characters that are not allowed in XML 1.0 documents
+ILLEGAL_XML_CHARS_RE = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+# Characters that are not allowed in sheet names
+ILLEGAL_SHEET_NAME_CHARS_RE = re.compile(r'[\[\]:*?/\\]')
+
+MAX_CELL_LENGTH = 32767
+EXCEL_EPOCH = datetime.datetime(1899, 12, 30)
+
+# Indexes of the cell formats defined in STYLES_XML
+DATE_STYLE = 1
+DATETIME_STYLE = 2
+TIME_STYLE = 3
+
+NUMBER_TYPES = six.integer_types + (float, Decimal)
+CELL_TYPES = NUMBER_TYPES + (bool, datetime.date, datetime.time)
+
+TYPED_FIELD_CLASSES = (
+    'django.forms.IntegerField',
+    'django.forms.DecimalField',
+    'django.forms.FloatField',
+    'django.forms.BooleanField',
+    'django.forms.NullBooleanField',
+    'django.forms.DateField',
+    'django.forms.DateTimeField',
+    'django.forms.TimeField',
+)
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PACKAGE_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+ROOT_RELS_XML = XML_DECLARATION + (
+    '<Relationships xmlns="%s">'
+    '<Relationship Id="rId1" Type="%s/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+) % (PACKAGE_REL_NS, REL_NS)
+
+STYLES_XML = XML_DECLARATION + (
+    '<styleSheet xmlns="%s">'
+    '<numFmts count="3">'
+    '<numFmt numFmtId="164" formatCode="yyyy-mm-dd"/>'
+    '<numFmt numFmtId="165" formatCode="yyyy-mm-dd hh:mm:ss"/>'
+    '<numFmt numFmtId="166" formatCode="hh:mm:ss"/>'
+    '</numFmts>'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="4">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="165" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="166" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '</cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+) % MAIN_NS
+
+SHEET_HEADER_XML = XML_DECLARATION + '<worksheet xmlns="%s"><sheetData>' % MAIN_NS
+SHEET_FOOTER_XML = '</sheetData></worksheet>'
+
+
+def keep_typed_value(value):
+    if isinstance(value, CELL_TYPES):
+        return value
+    return format_text(value)
+
+
+def to_excel_serial(value):
+    """
+    Convert a date, datetime or time into an Excel serial date number.
+    """
+    if isinstance(value, datetime.datetime):
+        if timezone.is_aware(value):
+            value = timezone.make_naive(value, timezone.get_current_timezone())
+        delta = value - EXCEL_EPOCH
+        return delta.days + (delta.seconds + delta.microseconds / 1E6) / 86400.0
+    if isinstance(value, datetime.date):
+        return (value - EXCEL_EPOCH.date()).days
+    return (value.hour * 3600 + value.minute * 60 + value.second + value.microsecond / 1E6) / 86400.0
+
+
+def render_cell(value):
+    if value is None or value == '':
+        return '<c/>'
+    if isinstance(value, bool):
+        return '<c t="b"><v>%d</v></c>' % value
+    if isinstance(value, NUMBER_TYPES):
+        if isinstance(value, float) and (value != value or value in (float('inf'), float('-inf'))):
+            return render_text_cell(repr(value))
+        return '<c><v>%s</v></c>' % (repr(value) if isinstance(value, float) else value)
+    if isinstance(value, datetime.datetime):
+        return '<c s="%d"><v>%r</v></c>' % (DATETIME_STYLE, to_excel_serial(value))
+    if isinstance(value, datetime.date):
+        return '<c s="%d"><v>%d</v></c>' % (DATE_STYLE, to_excel_serial(value))
+    if isinstance(value, datetime.time):
+        return '<c s="%d"><v>%r</v></c>' % (TIME_STYLE, to_excel_serial(value))
+    return render_text_cell(value)
+
+
+def render_text_cell(value):
+    value = ILLEGAL_XML_CHARS_RE.sub('', force_text(value))[:MAX_CELL_LENGTH]
+    return '<c t="inlineStr"><is><t xml:space="preserve">%s</t></is></c>' % escape(value)
+
+
+class ZipEntryWriter(object):
+    """
+    Write a zip archive member piece by piece.
+
+    The member is written to the archive directly where `zipfile` supports it (Python 3.6+),
+    and through a temporary file otherwise.
+    """
+
+    def __init__(self, zip_file, name):
+        self.zip_file = zip_file
+        self.name = name
+        if sys.version_info >= (3, 6):
+            self.file = zip_file.open(name, 'w', force_zip64=True)
+            self.temp_name = None
+        else:
+            fd, self.temp_name = tempfile.mkstemp(suffix='.xml')
+            self.file = os.fdopen(fd, 'wb')
+
+    def write(self, text):
+        self.file.write(text.encode('utf-8'))
+
+    def close(self):
+        self.file.close()
+        if self.temp_name:
+            try:
+                self.zip_file.write(self.temp_name, self.name)
+            finally:
+                os.remove(self.temp_name)
+
+
+class XlsxWorkbookWriter(object):
+    """
+    A minimal, write-only Office Open XML workbook writer.
+
+    Rows are rendered and compressed as they are written, so memory use does not depend on
+    the number of rows. Text is written as inline strings, which means there is no shared
+    string table to keep in memory. A new sheet is started whenever the current one is full.
+    """
+
+    def __init__(self, file, title, max_rows_per_sheet):
+        self.zip_file = zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED, allowZip64=True)
+        self.title = ILLEGAL_SHEET_NAME_CHARS_RE.sub('', title)[:25] or 'Sheet'
+        self.max_rows_per_sheet = max_rows_per_sheet
+        self.sheet_titles = []
+        self.sheet = None
+        self.rownum = 0
+
+    def add_sheet(self):
+        if self.sheet:
+            self.close_sheet()
+        self.sheet_titles.append(
+            self.title if not self.sheet_titles else '%s (%d)' % (self.title, len(self.sheet_titles) + 1)
+        )
+        self.sheet = ZipEntryWriter(self.zip_file, 'xl/worksheets/sheet%d.xml' % len(self.sheet_titles))
+        self.sheet.write(SHEET_HEADER_XML)
+        self.rownum = 0
+
+    def close_sheet(self):
+        self.sheet.write(SHEET_FOOTER_XML)
+        self.sheet.close()
+        self.sheet = None
+
+    @property
+    def sheet_is_full(self):
+        return self.sheet is None or self.rownum >= self.max_rows_per_sheet
+
+    def writerow(self, row):
+        self.rownum += 1
+        self.sheet.write('<row r="%d">%s</row>' % (self.rownum, ''.join(render_cell(value) for value in row)))
+
+    def writestr(self, name, text):
+        self.zip_file.writestr(name, text.encode('utf-8'))
+
+    def close(self):
+        if self.sheet is None and not self.sheet_titles:
+            self.add_sheet()
+        if self.sheet:
+            self.close_sheet()
+        n_sheets = len(self.sheet_titles)
+        self.writestr('[Content_Types].xml', XML_DECLARATION + (
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/styles.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+            '%s'
+            '</Types>'
+        ) % ''.join(
+            '<Override PartName="/xl/worksheets/sheet%d.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>' % n
+            for n in range(1, n_sheets + 1)
+        ))
+        self.writestr('_rels/.rels', ROOT_RELS_XML)
+        self.writestr('xl/workbook.xml', XML_DECLARATION + (
+            '<workbook xmlns="%s" xmlns:r="%s"><sheets>%s</sheets></workbook>'
+        ) % (MAIN_NS, REL_NS, ''.join(
+            '<sheet name=%s sheetId="%d" r:id="rId%d"/>' % (quoteattr(title), n, n)
+            for n, title in enumerate(self.sheet_titles, 1)
+        )))
+        self.writestr('xl/_rels/workbook.xml.rels', XML_DECLARATION + (
+            '<Relationships xmlns="%s">%s'
+            '<Relationship Id="rId%d" Type="%s/styles" Target="styles.xml"/>'
+            '</Relationships>'
+        ) % (PACKAGE_REL_NS, ''.join(
+            '<Relationship Id="rId%d" Type="%s/worksheet" Target="worksheets/sheet%d.xml"/>' % (n, REL_NS, n)
+            for n in range(1, n_sheets + 1)
+        ), n_sheets + 1, REL_NS))
+        self.writestr('xl/styles.xml', STYLES_XML)
+        self.zip_file.close()
+
+
+class XlsxExporter(FormLogExporterBase):
+    max_rows_per_sheet = settings.XLSX_EXPORT_MAX_ROWS_PER_SHEET
+
+    @staticmethod
+    def export_format():
+        return 'XLSX'
+
+    def get_formatter(self, field_class):
+        # Numbers, booleans and dates are written as typed cells
+        if field_class in TYPED_FIELD_CLASSES:
+            return keep_typed_value
+        return super(XlsxExporter, self).get_formatter(field_class)
+
+    def format_null(self):
+        return None
+
+    def init_writer(self):
+        self.file = tempfile.SpooledTemporaryFile(max_size=settings.XLSX_EXPORT_SPOOL_SIZE)
+        self.workbook = XlsxWorkbookWriter(
+            self.file,
+            title=force_text(self.model._meta.verbose_name_plural),
+            max_rows_per_sheet=self.max_rows_per_sheet,
+        )
+
+    def init_response(self):
+        self.response = StreamingHttpResponse(content_type=XLSX_CONTENT_TYPE)
+        self.response['Content-Disposition'] = 'attachment; filename=%s.xlsx' % (
+            self.model._meta.verbose_name_plural
+        )
+
+    def writerow(self, row):
+        if self.workbook.sheet_is_full:
+            self.workbook.add_sheet()
+            if self.header and row is not self.header:
+                self.workbook.writerow(self.header)
+        self.workbook.writerow(row)
+
+    def close(self):
+        self.workbook.close()
+        self.response['Content-Length'] = self.file.tell()
+        self.file.seek(0)
+        self.response.streaming_content = FileWrapper(self.file)
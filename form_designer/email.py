@@ -1,13 +1,23 @@
+import os
 import re
 
 import django
-from django.core.mail import EmailMessage
+from django.core.mail import EmailMessage, get_connection
+from django.core.mail.message import DEFAULT_ATTACHMENT_MIME_TYPE
+from django.utils import six
 from django.utils.encoding import force_text
+from django.utils.html import escape
+from django.utils.translation import ugettext as _
 
+from form_designer import metrics as app_metrics
+from form_designer import settings as app_settings
+from form_designer.uploads import get_download_url, get_storage, guess_content_type
 from form_designer.utils import string_template_replace
 
 DJANGO_18 = django.VERSION[:2] >= (1, 8)
 
+LIST_SEPARATOR_RE = re.compile(r'\s*[,;]+\s*')
+
 
 def _template_replace_list(input_str, context_dict):
     """
@@ -26,24 +36,27 @@ def _template_replace_list(input_str, context_dict):
     return [
         string_template_replace(email, context_dict)
         for email
-        in re.compile('\s*[,;]+\s*').split(force_text(input_str))
+        in LIST_SEPARATOR_RE.split(force_text(input_str))
     ]
 
 
-def build_form_mail(form_definition, form, files=None):
+def build_form_mail(form_definition, form, files=None, payload=None):
     """
     Build a form-submission email based on the given form definition and associated submitted form
 
     :param form_definition: Form definition object
     :param form: The freshly submitted form
-    :param files: Associated files
+    :param files: Associated files, as returned by `handle_uploaded_files`; defaults to the payload's files
+    :param payload: The submission's `SubmissionPayload`, if it has been built already
     :return: Django email message
     """
-    if not files:
-        files = []
-    form_data = form_definition.get_form_data(form)
-    message = form_definition.compile_message(form_data)
-    context_dict = form_definition.get_form_data_context(form_data)
+    if payload is None:
+        from form_designer.models import SubmissionPayload
+        payload = SubmissionPayload.from_form(form_definition, form, files)
+    if files is None:
+        files = payload.files
+    context_dict = payload.context
+    message = form_definition.compile_message(list(payload.data), context=context_dict)
 
     mail_to = _template_replace_list(form_definition.mail_to, context_dict)
 
@@ -77,8 +90,161 @@ def build_form_mail(form_definition, form, files=None):
     if form_definition.is_template_html:
         message.content_subtype = "html"
 
-    if form_definition.mail_uploaded_files:
-        for file_path in files:
-            message.attach_file(file_path)
+    if form_definition.mail_uploaded_files and files:
+        attach_files(message, form_definition, files)
 
     return message
+
+
+def attach_files(message, form_definition, files):
+    """
+    Attach the uploaded files to the message, except for those larger than the form definition's
+    maximum attachment size, which are linked to instead. This way, only files of a bounded size are
+    read into memory and encoded into the message.
+
+    :param files: `StoredUploadedFile`s, or paths of local files, which are always attached
+    """
+    max_size = form_definition.get_mail_attachment_max_size()
+    storage = get_storage()
+    linked_files = []
+    for stored_file in files:
+        if isinstance(stored_file, six.string_types):
+            message.attach_file(stored_file)
+        elif max_size is not None and storage.size(stored_file.name) > max_size:
+            linked_files.append(stored_file)
+        else:
+            attach_stored_file(message, storage, stored_file.name)
+    if linked_files:
+        if message.content_subtype == 'html':
+            message.body = insert_into_html_body(message.body, format_download_links(linked_files, html=True))
+        else:
+            message.body += format_download_links(linked_files)
+
+
+def insert_into_html_body(body, html):
+    """
+    Insert the HTML at the end of the body of the HTML document, or append it if there is no closing body tag.
+    """
+    index = body.lower().rfind('</body>')
+    if index == -1:
+        return body + html
+    return body[:index] + html + body[index:]
+
+
+def attach_stored_file(message, storage, name):
+    with storage.open(name) as infile:
+        content = infile.read()
+    mimetype = guess_content_type(name)
+    # like `EmailMessage.attach_file`, which needs text attachments as text on Python 3
+    if six.PY3 and mimetype.startswith('text/'):
+        try:
+            content = content.decode('utf-8')
+        except UnicodeDecodeError:
+            mimetype = DEFAULT_ATTACHMENT_MIME_TYPE
+    message.attach(os.path.basename(name), content, mimetype)
+
+
+def format_download_links(files, html=False):
+    intro = _('The following files were too large to be attached:')
+    links = [(os.path.basename(stored_file.name), get_download_url(stored_file.name)) for stored_file in files]
+    if html:
+        return '\n<p>%s</p>\n<ul>\n%s\n</ul>\n' % (escape(intro), '\n'.join(
+            '<li><a href="%s">%s</a></li>' % (escape(url), escape(name)) for name, url in links
+        ))
+    return '\n\n%s\n%s\n' % (intro, '\n'.join('%s: %s' % (name, url) for name, url in links))
+
+
+def send_form_mails(form_definition, messages):
+    """
+    Send several mails of the form definition over one connection. Each mail is sent on its own, so
+    the ones that have been delivered are known when another one fails.
+
+    :return: The messages that could not be sent, along with their errors
+    :rtype: list[tuple[EmailMessage, Exception]]
+    """
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as exc:
+        failures = [(message, exc) for message in messages]
+    else:
+        failures = []
+        try:
+            for message in messages:
+                try:
+                    connection.send_messages([message])
+                except Exception as exc:
+                    failures.append((message, exc))
+        finally:
+            connection.close()
+    if failures:
+        app_metrics.inc('form_designer_mails_failed_total', len(failures), form=form_definition.name)
+    if len(failures) < len(messages):
+        app_metrics.inc('form_designer_mails_sent_total', len(messages) - len(failures), form=form_definition.name)
+    return failures
+
+
+def count_mail(mail, metric_name):
+    form_name = (mail.form_definition.name if mail.form_definition else '')
+    app_metrics.inc(metric_name, form=form_name)
+
+
+def send_queued_mail(batch_size=None, limit=None):
+    """
+    Send the mails queued in the outbox.
+
+    Mails are claimed in batches, and each batch is sent over one connection. Failed mails are
+    rescheduled with exponential backoff until they run out of attempts.
+
+    :param batch_size: Number of mails to send per connection
+    :param limit: Maximum number of mails to process, or None to drain the outbox
+    :return: The numbers of sent and failed mails
+    :rtype: tuple[int, int]
+    """
+    from form_designer.models import OutboxMail
+    batch_size = batch_size or app_settings.MAIL_OUTBOX_BATCH_SIZE
+    n_sent = n_failed = 0
+    while limit is None or n_sent + n_failed < limit:
+        if limit is not None:
+            batch_size = min(batch_size, limit - n_sent - n_failed)
+        mails = OutboxMail.objects.claim(batch_size)
+        if not mails:
+            break
+        batch_sent, batch_failed = send_outbox_mails(mails)
+        n_sent += batch_sent
+        n_failed += batch_failed
+    app_metrics.flush()
+    return (n_sent, n_failed)
+
+
+def send_outbox_mails(mails):
+    """
+    Send claimed outbox mails over one connection, and record the outcome of each.
+
+    :return: The numbers of sent and failed mails
+    :rtype: tuple[int, int]
+    """
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as exc:
+        for mail in mails:
+            mail.mark_failed(exc)
+            count_mail(mail, 'form_designer_mails_failed_total')
+        return (0, len(mails))
+    n_sent = n_failed = 0
+    try:
+        for mail in mails:
+            try:
+                connection.send_messages([mail.message])
+            except Exception as exc:
+                mail.mark_failed(exc)
+                count_mail(mail, 'form_designer_mails_failed_total')
+                n_failed += 1
+            else:
+                mail.mark_sent()
+                count_mail(mail, 'form_designer_mails_sent_total')
+                n_sent += 1
+    finally:
+        connection.close()
+    return (n_sent, n_failed)
@@ -1,33 +1,49 @@
+import copy
 import os
 
 from django import forms
 from django.conf import settings as django_settings
-from django.forms import widgets
 from django.forms.widgets import Select
-from django.utils.module_loading import import_string
 from django.utils.translation import ugettext_lazy as _
 
 from form_designer import settings
+from form_designer.compiler import build_form_field, get_compiled_form
 from form_designer.models import FormDefinition, FormDefinitionField
 from form_designer.uploads import clean_files
 
 
+MULTIPLE_VALUE_FIELD_CLASSES = ('django.forms.MultipleChoiceField', 'django.forms.ModelMultipleChoiceField')
+
+
 class DesignedForm(forms.Form):
 
     def __init__(self, form_definition, initial_data=None, *args, **kwargs):
         super(DesignedForm, self).__init__(*args, **kwargs)
-        self.file_fields = []
-        for def_field in form_definition.formdefinitionfield_set.all():
-            self.add_defined_field(def_field, initial_data)
-        self.fields[form_definition.submit_flag_name] = forms.BooleanField(required=False, initial=1, widget=widgets.HiddenInput)
+        self.form_definition = form_definition
+        compiled_form = get_compiled_form(form_definition)
+        self.file_fields = list(compiled_form.file_fields)
+        self.fields.update(copy.deepcopy(compiled_form.base_fields))
+        if initial_data:
+            self.set_initial_data(compiled_form.def_fields, initial_data)
+
+    def set_initial_data(self, def_fields, initial_data):
+        # Initial values passed to the form explicitly take precedence over the ones from `initial_data`.
+        self.initial = dict(self.initial)
+        for def_field in def_fields:
+            if def_field.name not in initial_data or def_field.name in self.initial:
+                continue
+            if def_field.field_class not in MULTIPLE_VALUE_FIELD_CLASSES:
+                self.initial[def_field.name] = initial_data.get(def_field.name)
+            else:
+                self.initial[def_field.name] = initial_data.getlist(def_field.name)
 
     def add_defined_field(self, def_field, initial_data=None):
         if initial_data and def_field.name in initial_data:
-            if not def_field.field_class in ('django.forms.MultipleChoiceField', 'django.forms.ModelMultipleChoiceField'):
+            if def_field.field_class not in MULTIPLE_VALUE_FIELD_CLASSES:
                 def_field.initial = initial_data.get(def_field.name)
             else:
                 def_field.initial = initial_data.getlist(def_field.name)
-        field = import_string(def_field.field_class)(**def_field.get_form_field_init_args())
+        field = build_form_field(def_field)
         self.fields[def_field.name] = field
         if isinstance(field, forms.FileField):
             self.file_fields.append(def_field)
@@ -0,0 +1,171 @@
+"""
+Timing of the stages of form submissions.
+
+`process_form` measures the wall time and database query count of each stage of a submission
+(validation, file storage, logging and mailing) and reports them to the sinks configured in
+`FORM_DESIGNER_INSTRUMENTATION_SINKS`. A sink is any object with a `report` method taking the form
+definition, the list of `StageTiming`s and the submission's total time, like the ones below.
+Nothing is measured if no sinks are configured.
+"""
+from __future__ import unicode_literals
+
+import logging
+import time
+from contextlib import contextmanager
+
+from django.db import connections
+from django.db.backends.utils import CursorWrapper
+from django.utils.module_loading import import_string
+
+from form_designer import settings as app_settings
+
+logger = logging.getLogger('form_designer.instrumentation')
+slow_submission_logger = logging.getLogger('form_designer.slow_submissions')
+
+_sinks = None
+
+
+class StageTiming(object):
+
+    def __init__(self, name, seconds, queries):
+        self.name = name
+        self.seconds = seconds
+        self.queries = queries
+
+    def __str__(self):
+        return '%s %.3f s / %d queries' % (self.name, self.seconds, self.queries)
+
+
+def format_timings(form_definition, stages, total):
+    return 'Form %s submitted in %.3f s: %s' % (
+        form_definition.name, total, ', '.join('%s' % stage for stage in stages)
+    )
+
+
+class LoggingSink(object):
+    """
+    Log the timings of every submission to the `form_designer.instrumentation` logger, at DEBUG level.
+    """
+
+    def report(self, form_definition, stages, total):
+        logger.debug(format_timings(form_definition, stages, total))
+
+
+class SlowSubmissionSink(object):
+    """
+    Log submissions that take at least `FORM_DESIGNER_SLOW_SUBMISSION_THRESHOLD` seconds to the
+    `form_designer.slow_submissions` logger, at WARNING level.
+    """
+
+    def __init__(self, threshold=None):
+        self.threshold = (app_settings.SLOW_SUBMISSION_THRESHOLD if threshold is None else threshold)
+
+    def report(self, form_definition, stages, total):
+        if total >= self.threshold:
+            slow_submission_logger.warning(format_timings(form_definition, stages, total))
+
+
+class QueryCountingCursor(CursorWrapper):
+
+    def __init__(self, cursor, db, counter):
+        super(QueryCountingCursor, self).__init__(cursor, db)
+        self.counter = counter
+
+    def execute(self, sql, params=None):
+        self.counter.count += 1
+        return super(QueryCountingCursor, self).execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        self.counter.count += 1
+        return super(QueryCountingCursor, self).executemany(sql, param_list)
+
+
+class QueryCounter(object):
+    """
+    Count the queries run on this thread's database connections while the context is active.
+
+    Unlike `django.test.utils.CaptureQueriesContext`, this neither opens connections nor logs queries;
+    only the cursors the connections hand out in the meantime are wrapped.
+    """
+    cursor_factories = ('make_cursor', 'make_debug_cursor')
+
+    def __init__(self):
+        self.count = 0
+        self._exits = []
+
+    def __enter__(self):
+        for connection in connections.all():
+            if hasattr(connection, 'execute_wrapper'):  # Django 2.0+
+                wrapper_context = connection.execute_wrapper(self._count_execute)
+                wrapper_context.__enter__()
+                self._exits.append(lambda wrapper_context=wrapper_context: wrapper_context.__exit__(None, None, None))
+            else:
+                self._exits.append(self._wrap_cursors(connection))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        while self._exits:
+            self._exits.pop()()
+
+    def _count_execute(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    def _wrap_cursors(self, connection):
+        # Connections are thread-local, so their cursor factories can be replaced for the time being.
+        saved = dict((name, connection.__dict__.get(name)) for name in self.cursor_factories)
+        for name in self.cursor_factories:
+            make_cursor = getattr(connection, name)
+            setattr(connection, name, lambda cursor, make_cursor=make_cursor: QueryCountingCursor(
+                make_cursor(cursor), connection, self
+            ))
+
+        def restore():
+            for name, factory in saved.items():
+                if factory is None:
+                    delattr(connection, name)
+                else:
+                    setattr(connection, name, factory)
+        return restore
+
+
+def get_sinks():
+    global _sinks
+    if _sinks is None:
+        _sinks = [import_string(class_path)() for class_path in app_settings.INSTRUMENTATION_SINKS]
+    return _sinks
+
+
+class SubmissionTimer(object):
+    """
+    Measure the stages of one submission and report them to the sinks when it is finished.
+    """
+
+    def __init__(self, form_definition, sinks=None):
+        self.form_definition = form_definition
+        self.sinks = (get_sinks() if sinks is None else sinks)
+        self.stages = []
+        self.start = time.time()
+
+    @contextmanager
+    def stage(self, name):
+        if not self.sinks:
+            yield
+            return
+        query_counter = QueryCounter()
+        start = time.time()
+        try:
+            with query_counter:
+                yield
+        finally:
+            self.stages.append(StageTiming(name, time.time() - start, query_counter.count))
+
+    def finish(self):
+        if not self.sinks:
+            return
+        total = time.time() - self.start
+        for sink in self.sinks:
+            try:
+                sink.report(self.form_definition, self.stages, total)
+            except Exception:  # instrumentation must never break a submission
+                logger.exception('Instrumentation sink %r failed', sink)
@@ -0,0 +1,49 @@
+from __future__ import unicode_literals
+
+from optparse import make_option
+
+import django
+from django.core.management.base import BaseCommand
+
+from form_designer.models import FormLog
+
+CHUNK_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Renders the stored summaries of form logs that do not have them yet.'
+
+    if django.VERSION[:2] < (1, 8):  # no `add_arguments`
+        option_list = BaseCommand.option_list + (
+            make_option(
+                '--all', action='store_true', dest='all', default=False,
+                help='Render the summaries of all form logs, e.g. after changing the summary templates',
+            ),
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true', dest='all', default=False,
+            help='Render the summaries of all form logs, e.g. after changing the summary templates',
+        )
+
+    def handle(self, *args, **options):
+        queryset = FormLog.objects.all()
+        if not options.get('all'):
+            queryset = queryset.filter(summary_html='')
+        n_rendered = 0
+        last_pk = 0
+        while True:
+            chunk = list(queryset.filter(pk__gt=last_pk).with_data().order_by('pk')[:CHUNK_SIZE])
+            if not chunk:
+                break
+            for form_log in chunk:
+                form_log.render_summaries()
+                FormLog.objects.filter(pk=form_log.pk).update(
+                    summary_html=form_log.summary_html,
+                    summary_text=form_log.summary_text,
+                )
+            n_rendered += len(chunk)
+            last_pk = chunk[-1].pk
+        if int(options.get('verbosity', 1)) >= 1:
+            self.stdout.write('%d form log summaries rendered.' % n_rendered)
@@ -0,0 +1,30 @@
+from __future__ import unicode_literals
+
+from optparse import make_option
+
+import django
+from django.core.management.base import BaseCommand
+
+from form_designer.email import send_queued_mail
+
+
+class Command(BaseCommand):
+    help = 'Sends the form mails queued in the outbox (see FORM_DESIGNER_MAIL_OUTBOX).'
+
+    if django.VERSION[:2] < (1, 8):  # no `add_arguments`
+        option_list = BaseCommand.option_list + (
+            make_option('--batch-size', type='int', dest='batch_size', help='Number of mails to send per connection'),
+            make_option('--limit', type='int', dest='limit', help='Maximum number of mails to process'),
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, dest='batch_size', help='Number of mails to send per connection')
+        parser.add_argument('--limit', type=int, dest='limit', help='Maximum number of mails to process')
+
+    def handle(self, *args, **options):
+        n_sent, n_failed = send_queued_mail(
+            batch_size=options.get('batch_size'),
+            limit=options.get('limit'),
+        )
+        if int(options.get('verbosity', 1)) >= 1:
+            self.stdout.write('%d mail(s) sent, %d failed.' % (n_sent, n_failed))
@@ -0,0 +1,35 @@
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from form_designer.models import FormValue
+from form_designer.typed_values import (
+    VALUE_COLUMNS, VALUE_TYPE_LEGACY, VALUE_TYPE_MODEL, VALUE_TYPE_MODELS, VALUE_TYPE_PICKLE, get_value_type
+)
+
+CHUNK_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = (
+        'Replaces the model instances and querysets pickled in logged form values '
+        'with snapshots of their primary keys and labels.'
+    )
+
+    def handle(self, *args, **options):
+        queryset = FormValue.objects.filter(value_type__in=(VALUE_TYPE_PICKLE, VALUE_TYPE_LEGACY)).order_by('pk')
+        n_converted = 0
+        last_pk = 0
+        while True:
+            chunk = list(queryset.filter(pk__gt=last_pk)[:CHUNK_SIZE])
+            if not chunk:
+                break
+            for form_value in chunk:
+                value = form_value.value
+                if get_value_type(value) in (VALUE_TYPE_MODEL, VALUE_TYPE_MODELS):
+                    form_value.value = value
+                    form_value.save(update_fields=VALUE_COLUMNS)
+                    n_converted += 1
+            last_pk = chunk[-1].pk
+        if int(options.get('verbosity', 1)) >= 1:
+            self.stdout.write('%d value(s) converted.' % n_converted)
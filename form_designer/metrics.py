@@ -0,0 +1,311 @@
+"""
+Metrics about form traffic, exposed in the Prometheus text format.
+
+Every process counts submissions, validation errors, mails and uploaded bytes per form and keeps
+latency histograms in memory, which is cheap enough to do on every request. Every
+`FORM_DESIGNER_METRICS_FLUSH_INTERVAL` seconds, a process saves a snapshot of its metrics to the
+store configured in `FORM_DESIGNER_METRICS_STORE`. The `metrics` view adds up the snapshots of all
+processes, so it can be scraped from any of them. Nothing is collected if no store is configured.
+
+Snapshots that have not been replaced for `FORM_DESIGNER_METRICS_MAX_AGE` seconds are dropped, so the
+processes that have exited or been recycled do not pile up in the store.
+"""
+from __future__ import unicode_literals
+
+import bisect
+import json
+import logging
+import os
+import re
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from form_designer import settings as app_settings
+from form_designer.utils import get_shared_cache
+
+logger = logging.getLogger('form_designer.metrics')
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+COUNTER = 'counter'
+HISTOGRAM = 'histogram'
+
+METRICS = OrderedDict([
+    ('form_designer_submissions_total', (COUNTER, 'Form submissions.')),
+    ('form_designer_validation_errors_total', (COUNTER, 'Form submissions that failed validation.')),
+    ('form_designer_mails_sent_total', (COUNTER, 'Form mails sent.')),
+    ('form_designer_mails_failed_total', (COUNTER, 'Failed attempts to send form mails.')),
+    ('form_designer_upload_bytes_total', (COUNTER, 'Bytes of uploaded files stored.')),
+    ('form_designer_process_form_seconds', (HISTOGRAM, 'Time spent processing form requests.')),
+    ('form_designer_export_seconds', (HISTOGRAM, 'Time spent exporting form logs.')),
+])
+
+WORKER_ID_UNSAFE_CHARS_RE = re.compile(r'[^-\w.]')
+
+_collector = None
+
+
+class LocalMetricsStore(object):
+    """
+    Keep the snapshots in memory. Only suitable for deployments with a single process.
+    """
+
+    def __init__(self):
+        self.snapshots = {}
+
+    def save(self, worker_id, snapshot):
+        self.snapshots[worker_id] = snapshot
+
+    def load(self):
+        return list(self.snapshots.values())
+
+
+class CacheMetricsStore(object):
+    """
+    Keep the snapshots of all processes in the shared cache (see `FORM_DESIGNER_CACHE_BACKEND`).
+
+    The processes are listed under one more key. Should two processes register at the same time
+    and one of them get lost, it is registered again with its next snapshot. Snapshots expire after
+    `max_age` seconds, and the processes whose snapshots have expired are removed from the list.
+    """
+    key_prefix = 'form_designer:metrics:'
+
+    def __init__(self, max_age=None):
+        if get_shared_cache() is None:
+            raise ImproperlyConfigured('CacheMetricsStore requires FORM_DESIGNER_CACHE_BACKEND to be set.')
+        self.max_age = (app_settings.METRICS_MAX_AGE if max_age is None else max_age)
+
+    @property
+    def workers_key(self):
+        return self.key_prefix + 'workers'
+
+    def save(self, worker_id, snapshot):
+        cache = get_shared_cache()
+        cache.set(self.key_prefix + worker_id, snapshot, self.max_age)
+        workers = cache.get(self.workers_key) or []
+        if worker_id not in workers:
+            cache.set(self.workers_key, workers + [worker_id], None)
+
+    def load(self):
+        cache = get_shared_cache()
+        workers = cache.get(self.workers_key) or []
+        snapshots = cache.get_many([self.key_prefix + worker_id for worker_id in workers])
+        live_workers = [worker_id for worker_id in workers if self.key_prefix + worker_id in snapshots]
+        if len(live_workers) < len(workers):
+            cache.set(self.workers_key, live_workers, None)
+        return list(snapshots.values())
+
+
+class FileMetricsStore(object):
+    """
+    Keep the snapshot of each process in a JSON file in `FORM_DESIGNER_METRICS_DIRECTORY`.
+
+    Files are replaced atomically, so a snapshot is never read half-written. Files that have not been
+    replaced for `max_age` seconds are removed.
+    """
+
+    def __init__(self, directory=None, max_age=None):
+        self.directory = directory or app_settings.METRICS_DIRECTORY
+        if not self.directory:
+            raise ImproperlyConfigured('FileMetricsStore requires FORM_DESIGNER_METRICS_DIRECTORY to be set.')
+        self.max_age = (app_settings.METRICS_MAX_AGE if max_age is None else max_age)
+
+    def save(self, worker_id, snapshot):
+        try:
+            os.makedirs(self.directory)
+        except OSError:
+            if not os.path.isdir(self.directory):
+                raise
+        fd, temp_path = tempfile.mkstemp(prefix='.', suffix='.tmp', dir=self.directory)
+        with os.fdopen(fd, 'w') as outfile:
+            json.dump(snapshot, outfile)
+        getattr(os, 'replace', os.rename)(temp_path, os.path.join(self.directory, '%s.json' % worker_id))
+
+    def load(self):
+        if not os.path.isdir(self.directory):
+            return []
+        snapshots = []
+        cutoff = time.time() - self.max_age
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    continue
+                with open(path) as infile:
+                    snapshots.append(json.load(infile))
+            except (IOError, OSError, ValueError):  # removed or unreadable
+                continue
+        return snapshots
+
+
+class MetricsCollector(object):
+    """
+    The metrics of this process.
+
+    Counters are kept as numbers and histograms as lists of the observation counts of each bucket
+    (the last one being +Inf), followed by the sum of the observations, per metric and label set.
+    """
+
+    def __init__(self, store, buckets=None, flush_interval=None):
+        self.store = store
+        self.buckets = tuple(sorted(float(bucket) for bucket in (buckets or app_settings.METRICS_BUCKETS)))
+        self.flush_interval = (app_settings.METRICS_FLUSH_INTERVAL if flush_interval is None else flush_interval)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.values = dict((name, {}) for name in METRICS)
+        self.pid = os.getpid()
+        self.worker_id = WORKER_ID_UNSAFE_CHARS_RE.sub('_', '%s-%d-%s' % (
+            socket.gethostname(), self.pid, uuid.uuid4().hex[:8]
+        ))
+        self.last_flush = time.time()
+
+    def _get_series(self, name):
+        # a forked process starts counting from scratch under its own ID
+        if self.pid != os.getpid():
+            self.reset()
+        return self.values[name]
+
+    def inc(self, name, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self._get_series(name)
+            series[key] = series.get(key, 0) + amount
+        self.maybe_flush()
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self._get_series(name)
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            histogram[index] += 1
+            histogram[-1] += value
+        self.maybe_flush()
+
+    def snapshot(self):
+        with self.lock:
+            return dict(
+                (name, [
+                    [[list(pair) for pair in key], (list(value) if isinstance(value, list) else value)]
+                    for key, value in series.items()
+                ])
+                for name, series in self.values.items()
+            )
+
+    def maybe_flush(self):
+        if time.time() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.time()
+        try:
+            self.store.save(self.worker_id, self.snapshot())
+        except Exception:  # metrics must never break a request
+            logger.exception('Could not save the form metrics to %r', self.store)
+
+    def render(self):
+        """
+        Render the metrics of all processes in the Prometheus text format.
+        """
+        self.flush()
+        return render_metrics(merge_snapshots(self.store.load()), self.buckets)
+
+
+def merge_snapshots(snapshots):
+    merged = dict((name, {}) for name in METRICS)
+    for snapshot in snapshots:
+        for name, series in snapshot.items():
+            if name not in merged:
+                continue
+            for labels, value in series:
+                key = tuple(tuple(pair) for pair in labels)
+                current = merged[name].get(key)
+                if current is None:
+                    merged[name][key] = value
+                elif isinstance(value, list):
+                    # snapshots saved with other buckets cannot be added up
+                    if len(value) == len(current):
+                        merged[name][key] = [a + b for a, b in zip(current, value)]
+                else:
+                    merged[name][key] = current + value
+    return merged
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, ('%s' % value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return '%d' % value
+
+
+def render_metrics(merged, buckets):
+    bucket_labels = ['%g' % bucket for bucket in buckets] + ['+Inf']
+    lines = []
+    for name, (metric_type, help_text) in METRICS.items():
+        lines.append('# HELP %s %s' % (name, help_text))
+        lines.append('# TYPE %s %s' % (name, metric_type))
+        series = merged.get(name, {})
+        for labels in sorted(series):
+            value = series[labels]
+            if metric_type != HISTOGRAM:
+                lines.append('%s%s %s' % (name, format_labels(labels), format_value(value)))
+                continue
+            if len(value) != len(bucket_labels) + 1:
+                continue
+            count = 0
+            for bucket_label, bucket_count in zip(bucket_labels, value):
+                count += bucket_count
+                lines.append('%s_bucket%s %d' % (name, format_labels(labels + (('le', bucket_label),)), count))
+            lines.append('%s_sum%s %s' % (name, format_labels(labels), format_value(value[-1])))
+            lines.append('%s_count%s %d' % (name, format_labels(labels), count))
+    return '\n'.join(lines) + '\n'
+
+
+def get_collector():
+    global _collector
+    if _collector is None and app_settings.METRICS_STORE:
+        _collector = MetricsCollector(import_string(app_settings.METRICS_STORE)())
+    return _collector
+
+
+def inc(name, amount=1, **labels):
+    collector = get_collector()
+    if collector is not None:
+        collector.inc(name, amount, **labels)
+
+
+def observe(name, value, **labels):
+    collector = get_collector()
+    if collector is not None:
+        collector.observe(name, value, **labels)
+
+
+def flush():
+    """
+    Save the metrics of this process now, e.g. before a management command exits.
+    """
+    collector = get_collector()
+    if collector is not None:
+        collector.flush()
@@ -7,7 +7,7 @@ from django.db import migrations, models
 class Migration(migrations.Migration):
 
     dependencies = [
-        ('form_designer', ' 0002_reply_to'),
+        ('form_designer', '0002_reply_to'),
     ]
 
     operations = [
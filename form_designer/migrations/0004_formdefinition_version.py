@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('form_designer', '0003_formdefinition_html_default_template'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='formdefinition',
+            name='version',
+            field=models.CharField(default='', editable=False, max_length=40),
+        ),
+    ]
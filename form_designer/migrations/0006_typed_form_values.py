@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import picklefield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('form_designer', '0005_outboxmail'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='formvalue',
+            old_name='value',
+            new_name='value_pickled',
+        ),
+        migrations.AlterField(
+            model_name='formvalue',
+            name='value_pickled',
+            field=picklefield.fields.PickledObjectField(blank=True, editable=False, null=True, verbose_name='pickled value'),
+        ),
+        migrations.AddField(
+            model_name='formvalue',
+            name='value_type',
+            field=models.CharField(blank=True, choices=[('none', 'empty'), ('text', 'text'), ('int', 'integer'), ('decimal', 'decimal number'), ('float', 'floating point number'), ('bool', 'yes/no'), ('date', 'date'), ('datetime', 'date & time'), ('time', 'time'), ('file', 'file'), ('json', 'list or mapping'), ('pickle', 'other')], default='', max_length=10, verbose_name='value type'),
+        ),
+        migrations.AddField(
+            model_name='formvalue',
+            name='value_text',
+            field=models.TextField(blank=True, null=True, verbose_name='text value'),
+        ),
+        migrations.AddField(
+            model_name='formvalue',
+            name='value_number',
+            field=models.DecimalField(blank=True, decimal_places=10, max_digits=28, null=True, verbose_name='numeric value'),
+        ),
+        migrations.AddField(
+            model_name='formvalue',
+            name='value_date',
+            field=models.DateField(blank=True, null=True, verbose_name='date value'),
+        ),
+        migrations.AddField(
+            model_name='formvalue',
+            name='value_datetime',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='date & time value'),
+        ),
+        migrations.AddField(
+            model_name='formvalue',
+            name='value_bool',
+            field=models.NullBooleanField(verbose_name='yes/no value'),
+        ),
+    ]
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import datetime
+import json
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings as django_settings
+from django.db import migrations
+from django.utils import six, timezone
+from django.utils.dateparse import parse_date, parse_datetime, parse_time
+from django.utils.encoding import force_text
+from django.utils.functional import Promise
+
+# Pickled file values refer to this class, so it can't be frozen like the encoding below.
+from form_designer.uploads import StoredUploadedFile
+
+CHUNK_SIZE = 1000
+
+# The encoding as of this migration, frozen so that later changes to `form_designer.typed_values`
+# don't change what the migration does.
+VALUE_TYPE_LEGACY = ''
+VALUE_TYPE_NONE = 'none'
+VALUE_TYPE_TEXT = 'text'
+VALUE_TYPE_INT = 'int'
+VALUE_TYPE_DECIMAL = 'decimal'
+VALUE_TYPE_FLOAT = 'float'
+VALUE_TYPE_BOOL = 'bool'
+VALUE_TYPE_DATE = 'date'
+VALUE_TYPE_DATETIME = 'datetime'
+VALUE_TYPE_TIME = 'time'
+VALUE_TYPE_FILE = 'file'
+VALUE_TYPE_JSON = 'json'
+VALUE_TYPE_PICKLE = 'pickle'
+
+NUMBER_MAX_DIGITS = 28
+NUMBER_DECIMAL_PLACES = 10
+NUMBER_QUANTUM = Decimal(1).scaleb(-NUMBER_DECIMAL_PLACES)
+NUMBER_LIMIT = Decimal(10) ** (NUMBER_MAX_DIGITS - NUMBER_DECIMAL_PLACES)
+
+VALUE_COLUMNS = (
+    'value_type', 'value_text', 'value_number', 'value_date', 'value_datetime', 'value_bool', 'value_pickled',
+)
+
+# Types whose values are only told apart by `isinstance`, in order (bool before int, datetime before date)
+INSTANCE_TYPES = (
+    ((six.text_type, six.binary_type, Promise), VALUE_TYPE_TEXT),
+    (bool, VALUE_TYPE_BOOL),
+    (six.integer_types, VALUE_TYPE_INT),
+    (Decimal, VALUE_TYPE_DECIMAL),
+    (float, VALUE_TYPE_FLOAT),
+    (datetime.datetime, VALUE_TYPE_DATETIME),
+    (datetime.date, VALUE_TYPE_DATE),
+    (datetime.time, VALUE_TYPE_TIME),
+    (StoredUploadedFile, VALUE_TYPE_FILE),
+)
+
+GROUPABLE_TYPES = (
+    type(None), six.text_type, six.binary_type, Decimal, float, datetime.date, datetime.time,
+) + six.integer_types
+
+TEXT_DECODERS = {
+    VALUE_TYPE_TEXT: six.text_type,
+    VALUE_TYPE_INT: int,
+    VALUE_TYPE_DECIMAL: Decimal,
+    VALUE_TYPE_FLOAT: float,
+    VALUE_TYPE_BOOL: lambda text: (text == 'True'),
+    VALUE_TYPE_DATE: parse_date,
+    VALUE_TYPE_DATETIME: parse_datetime,
+    VALUE_TYPE_TIME: parse_time,
+    VALUE_TYPE_JSON: json.loads,
+    VALUE_TYPE_FILE: StoredUploadedFile,
+}
+
+
+def to_json(value):
+    try:
+        text = json.dumps(value, sort_keys=True)
+    except (TypeError, ValueError):
+        return None
+    if json.loads(text) != value:
+        return None
+    return text
+
+
+def to_number(value):
+    try:
+        number = Decimal(repr(value) if isinstance(value, float) else value)
+    except InvalidOperation:
+        return None
+    if not number.is_finite() or abs(number) >= NUMBER_LIMIT:
+        return None
+    return number.quantize(NUMBER_QUANTUM)
+
+
+def to_db_datetime(value):
+    if django_settings.USE_TZ and timezone.is_naive(value):
+        return timezone.make_aware(value, timezone.get_default_timezone())
+    if not django_settings.USE_TZ and timezone.is_aware(value):
+        return timezone.make_naive(value, timezone.get_default_timezone())
+    return value
+
+
+def get_value_type(value):
+    if value is None:
+        return VALUE_TYPE_NONE
+    for types, value_type in INSTANCE_TYPES:
+        if isinstance(value, types):
+            return value_type
+    if isinstance(value, (list, dict)) and to_json(value) is not None:
+        return VALUE_TYPE_JSON
+    return VALUE_TYPE_PICKLE
+
+
+def get_value_text(value_type, value):
+    if value_type in (VALUE_TYPE_NONE, VALUE_TYPE_PICKLE):
+        return None
+    if value_type == VALUE_TYPE_JSON:
+        return to_json(value)
+    if value_type == VALUE_TYPE_FILE:
+        return value.name
+    if value_type == VALUE_TYPE_FLOAT:
+        return repr(value)
+    if value_type in (VALUE_TYPE_DATE, VALUE_TYPE_DATETIME, VALUE_TYPE_TIME):
+        return value.isoformat()
+    return force_text(value)
+
+
+def encode_value(value):
+    value_type = get_value_type(value)
+    columns = dict.fromkeys(VALUE_COLUMNS)
+    columns['value_type'] = value_type
+    columns['value_text'] = get_value_text(value_type, value)
+    if value_type == VALUE_TYPE_PICKLE:
+        columns['value_pickled'] = value
+    elif value_type in (VALUE_TYPE_INT, VALUE_TYPE_DECIMAL, VALUE_TYPE_FLOAT):
+        columns['value_number'] = to_number(value)
+    elif value_type == VALUE_TYPE_BOOL:
+        columns['value_bool'] = value
+    elif value_type == VALUE_TYPE_DATE:
+        columns['value_date'] = value
+    elif value_type == VALUE_TYPE_DATETIME:
+        columns['value_datetime'] = to_db_datetime(value)
+    return columns
+
+
+def decode_value(value_type, value_text, value_pickled):
+    if value_type in (VALUE_TYPE_PICKLE, VALUE_TYPE_LEGACY):
+        return value_pickled
+    if value_type == VALUE_TYPE_NONE or value_text is None:
+        return None
+    decoder = TEXT_DECODERS.get(value_type)
+    if decoder is None:
+        # A type added by a later migration (e.g. model choices), whose stored text is kept
+        return value_text
+    return decoder(value_text)
+
+
+def get_group_key(columns):
+    """
+    Get the key to group rows that get the same columns by, or None if the row must be updated on its own.
+
+    The key contains the types of the values, as e.g. `True == 1`. Containers could hide such values, so rows
+    with other pickled values than scalars are not grouped.
+    """
+    if not isinstance(columns.get('value_pickled'), GROUPABLE_TYPES):
+        return None
+    return tuple((name, type(value), value) for name, value in sorted(columns.items()))
+
+
+def update_in_chunks(apps, schema_editor, queryset_filter, get_columns):
+    FormValue = apps.get_model('form_designer', 'FormValue')
+    db = schema_editor.connection.alias
+    queryset = FormValue.objects.using(db).filter(**queryset_filter).order_by('pk')
+    last_pk = 0
+    # Walk the table in chunks of primary keys, so memory use does not depend on its size
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk)[:CHUNK_SIZE])
+        if not chunk:
+            break
+        # Rows that get the same columns (e.g. empty values, or the same choice) are updated at once
+        groups = OrderedDict()
+        for form_value in chunk:
+            columns = get_columns(form_value)
+            key = get_group_key(columns)
+            if key is None:
+                FormValue.objects.using(db).filter(pk=form_value.pk).update(**columns)
+            else:
+                groups.setdefault(key, (columns, []))[1].append(form_value.pk)
+        for columns, pks in groups.values():
+            FormValue.objects.using(db).filter(pk__in=pks).update(**columns)
+        last_pk = chunk[-1].pk
+
+
+def encode_values(apps, schema_editor):
+    update_in_chunks(
+        apps, schema_editor,
+        {'value_type': VALUE_TYPE_LEGACY},
+        lambda form_value: encode_value(form_value.value_pickled),
+    )
+
+
+def decode_values(apps, schema_editor):
+    update_in_chunks(
+        apps, schema_editor,
+        {},
+        lambda form_value: {
+            'value_type': VALUE_TYPE_LEGACY,
+            'value_pickled': decode_value(form_value.value_type, form_value.value_text, form_value.value_pickled),
+        },
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('form_designer', '0006_typed_form_values'),
+    ]
+
+    operations = [
+        migrations.RunPython(encode_values, decode_values),
+    ]
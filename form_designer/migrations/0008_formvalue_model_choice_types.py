@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('form_designer', '0007_encode_form_values'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='formvalue',
+            name='value_type',
+            field=models.CharField(blank=True, choices=[('none', 'empty'), ('text', 'text'), ('int', 'integer'), ('decimal', 'decimal number'), ('float', 'floating point number'), ('bool', 'yes/no'), ('date', 'date'), ('datetime', 'date & time'), ('time', 'time'), ('file', 'file'), ('json', 'list or mapping'), ('model', 'model choice'), ('models', 'model choices'), ('pickle', 'other')], default='', max_length=10, verbose_name='value type'),
+        ),
+    ]
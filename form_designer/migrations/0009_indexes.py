@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('form_designer', '0008_formvalue_model_choice_types'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='formdefinition',
+            name='public_hash',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=40),
+        ),
+        migrations.AlterField(
+            model_name='formlog',
+            name='created',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Created'),
+        ),
+        migrations.AlterIndexTogether(
+            name='formlog',
+            index_together=set([('form_definition', 'created')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='formvalue',
+            index_together=set([('form_log', 'field_name')]),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('form_designer', '0009_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='formlog',
+            name='summary_html',
+            field=models.TextField(blank=True, editable=False, verbose_name='summary'),
+        ),
+        migrations.AddField(
+            model_name='formlog',
+            name='summary_text',
+            field=models.TextField(blank=True, editable=False, verbose_name='plain text summary'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('form_designer', '0010_formlog_summaries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='formdefinition',
+            name='max_upload_size',
+            field=models.PositiveIntegerField(blank=True, help_text='Maximum size of each uploaded file in bytes. Leave empty to use the default.', null=True, verbose_name='maximum file size'),
+        ),
+        migrations.AddField(
+            model_name='formdefinition',
+            name='max_upload_total_size',
+            field=models.PositiveIntegerField(blank=True, help_text='Maximum size of all files uploaded with a submission in bytes. Leave empty to use the default.', null=True, verbose_name='maximum total file size'),
+        ),
+    ]
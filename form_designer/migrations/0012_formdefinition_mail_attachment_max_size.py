@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('form_designer', '0011_formdefinition_upload_limits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='formdefinition',
+            name='mail_attachment_max_size',
+            field=models.PositiveIntegerField(blank=True, help_text='Uploaded files larger than this many bytes are linked in the email instead of being attached. Leave empty to use the default.', null=True, verbose_name='maximum attachment size'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('form_designer', '0012_formdefinition_mail_attachment_max_size'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='formlog',
+            index_together=set([('form_definition', 'created'), ('form_definition', 'id')]),
+        ),
+    ]
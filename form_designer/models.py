@@ -1,21 +1,36 @@
 from __future__ import unicode_literals
 
+import hashlib
 import re
-from collections import OrderedDict
+from collections import OrderedDict, defaultdict
+from datetime import timedelta
 from decimal import Decimal
 
 import django
 from django.conf import settings as django_settings
-from django.db import models
+from django.core import checks
+from django.core.exceptions import ValidationError
+from django.db import models, router, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.template import Context, Template
+from django.template.loader import get_template
+from django.utils import timezone
 from django.utils.deprecation import warn_about_renamed_method
+from django.utils.encoding import force_bytes, force_text
+from django.utils.functional import cached_property
 from django.utils.module_loading import import_string
 from django.utils.six import python_2_unicode_compatible
 from django.utils.translation import ugettext_lazy as _
 from picklefield.fields import PickledObjectField
 
-from form_designer import settings
+from form_designer import metrics, settings, typed_values
+from form_designer.compiler import forget_compiled_form, get_compiled_form
 from form_designer.fields import ModelNameField, RegexpExpressionField, TemplateCharField, TemplateTextField
-from form_designer.utils import get_random_hash, string_template_replace
+from form_designer.utils import (
+    LRUCache, bump_cache_generation_on_commit, get_cache_generation, get_random_hash, get_shared_cache,
+    get_template_from_string, string_template_replace
+)
 
 MAIL_TEMPLATE_CONTEXT_HELP_TEXT = _(
     'Your form fields are available as template context. '
@@ -23,6 +38,30 @@ MAIL_TEMPLATE_CONTEXT_HELP_TEXT = _(
     'if you have fields named `first_name`, `last_name`, `from_email`.'
 )
 
+CHOICE_SEPARATOR_RE = re.compile(r'[\s]*\n[\s]*')
+SUMMARY_HTML_TEMPLATE = 'html/formdefinition/data_message.html'
+SUMMARY_TEXT_TEMPLATE = 'txt/formdefinition/data_message.txt'
+
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+HTML_END_TAG_RE = re.compile(r'</[^>]+>')
+
+_file_templates = LRUCache(32)
+
+
+def get_file_template(template_name):
+    """
+    Load a template by name, reusing loaded templates unless `DEBUG` is on (so template changes
+    show up without a restart).
+    """
+    if django_settings.DEBUG:
+        return get_template(template_name)
+    template = _file_templates.get(template_name)
+    if template is None:
+        template = get_template(template_name)
+        _file_templates.set(template_name, template)
+    return template
+
+
 class FormValueDict(dict):
     def __init__(self, name, value, label):
         self['name'] = name
@@ -31,12 +70,73 @@ class FormValueDict(dict):
         super(FormValueDict, self).__init__()
 
 
+class FrozenFormValueDict(FormValueDict):
+    """
+    A `FormValueDict` whose items can't be changed, as handed out by `SubmissionPayload`.
+    """
+
+    def __init__(self, name, value, label):
+        dict.__init__(self, name=name, value=value, label=label)
+
+    def __reduce__(self):
+        return (self.__class__, (self['name'], self['value'], self['label']))
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('Submission payload values are read-only')
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _read_only
+
+
+class SubmissionPayload(object):
+    """
+    The data of a valid submission, extracted from the form once and shared by everything that handles
+    the submission: logging, mailing and the receivers of the `designedform_success` signal.
+
+    Payloads are read-only. `data` is a tuple of `FrozenFormValueDict`s (see `FormDefinition.get_form_data`)
+    and `files` one of the stored uploaded files, while `values`, `labels` and `context` return new
+    dicts on every access, as e.g. templates may write to their context. The values themselves are the
+    form's cleaned data and are not copied, so e.g. lists of choices must not be changed either.
+    """
+    __slots__ = ('form_definition', 'data', 'files', '_context')
+
+    def __init__(self, form_definition, data, files=()):
+        object.__setattr__(self, 'form_definition', form_definition)
+        object.__setattr__(self, 'data', tuple(
+            FrozenFormValueDict(item['name'], item['value'], item['label']) for item in data
+        ))
+        object.__setattr__(self, 'files', tuple(files or ()))
+        object.__setattr__(self, '_context', form_definition.get_form_data_context(self.data))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Submission payloads are read-only')
+
+    def __delattr__(self, name):
+        raise AttributeError('Submission payloads are read-only')
+
+    @classmethod
+    def from_form(cls, form_definition, form, files=()):
+        return cls(form_definition, form_definition.get_form_data(form), files)
+
+    @property
+    def values(self):
+        return OrderedDict((item['name'], item['value']) for item in self.data)
+
+    @property
+    def labels(self):
+        return OrderedDict((item['name'], item['label']) for item in self.data)
+
+    @property
+    def context(self):
+        return dict(self._context)
+
+
 @python_2_unicode_compatible
 class FormDefinition(models.Model):
     name = models.SlugField(_('name'), max_length=255, unique=True)
     require_hash = models.BooleanField(_('obfuscate URL to this form'), default=False, help_text=_('If enabled, the form can only be reached via a secret URL.'))
     private_hash = models.CharField(editable=False, max_length=40, default='')
-    public_hash = models.CharField(editable=False, max_length=40, default='')
+    public_hash = models.CharField(editable=False, max_length=40, default='', db_index=True)
+    version = models.CharField(editable=False, max_length=40, default='')
     title = models.CharField(_('title'), max_length=255, blank=True, null=True)
     body = models.TextField(_('body'), help_text=_('Form description. Display on form after title.'), blank=True, null=True)
     action = models.URLField(_('target URL'), help_text=_('If you leave this empty, the page where the form resides will be requested, and you can use the mail form and logging features. You can also send data to external sites: For instance, enter "http://www.google.ch/search" to create a search form.'), max_length=255, blank=True, null=True)
@@ -45,12 +145,15 @@ class FormDefinition(models.Model):
     mail_reply_to = TemplateCharField(_('reply-to address'), max_length=255, help_text=MAIL_TEMPLATE_CONTEXT_HELP_TEXT, blank=True)
     mail_subject = TemplateCharField(_('email subject'), max_length=255, help_text=_('Your form fields are available as template context. Example: "Contact form {{ subject }}" if you have a field named `subject`.'), blank=True, null=True)
     mail_uploaded_files = models.BooleanField(_('Send uploaded files as email attachments'), default=True)
+    mail_attachment_max_size = models.PositiveIntegerField(_('maximum attachment size'), help_text=_('Uploaded files larger than this many bytes are linked in the email instead of being attached. Leave empty to use the default.'), blank=True, null=True)
     method = models.CharField(_('method'), max_length=10, default="POST", choices=(('POST', 'POST'), ('GET', 'GET')))
     success_message = models.CharField(_('success message'), max_length=255, blank=True, null=True)
     error_message = models.CharField(_('error message'), max_length=255, blank=True, null=True)
     submit_label = models.CharField(_('submit button label'), max_length=255, blank=True, null=True)
     log_data = models.BooleanField(_('log form data'), help_text=_('Logs all form submissions to the database.'), default=True)
     save_uploaded_files = models.BooleanField(_('save uploaded files'), help_text=_('Saves all uploaded files using server storage.'), default=True)
+    max_upload_size = models.PositiveIntegerField(_('maximum file size'), help_text=_('Maximum size of each uploaded file in bytes. Leave empty to use the default.'), blank=True, null=True)
+    max_upload_total_size = models.PositiveIntegerField(_('maximum total file size'), help_text=_('Maximum size of all files uploaded with a submission in bytes. Leave empty to use the default.'), blank=True, null=True)
     success_redirect = models.BooleanField(_('HTTP redirect after successful submission'), default=True)
     success_clear = models.BooleanField(_('clear form after successful submission'), default=True)
     allow_get_initial = models.BooleanField(_('allow initial values via URL'), help_text=_('If enabled, you can fill in form fields by adding them to the query string.'), default=True)
@@ -68,7 +171,11 @@ class FormDefinition(models.Model):
             self.private_hash = get_random_hash()
         if not self.public_hash:
             self.public_hash = get_random_hash()
+        self.version = get_random_hash()
         super(FormDefinition, self).save()
+        self.__dict__.pop('submit_flag_name', None)
+        self.__dict__.pop('is_template_html', None)
+        forget_compiled_form(self.pk)
 
     def get_field_dict(self):
         field_dict = OrderedDict()
@@ -85,7 +192,8 @@ class FormDefinition(models.Model):
     def get_form_data(self, form):
         # TODO: refactor, move to utils or views
         data = []
-        field_dict = self.get_field_dict()
+        # the compiled form has the field definitions at hand
+        field_dict = OrderedDict((field.name, field) for field in get_compiled_form(self).def_fields)
         form_keys = form.fields.keys()
         def_keys = field_dict.keys()
         for key in form_keys:
@@ -103,26 +211,26 @@ class FormDefinition(models.Model):
             dict[field['name']] = field['value']
         return dict
 
-    def compile_message(self, form_data, template=None):
+    def compile_message(self, form_data, template=None, context=None):
         # TODO: refactor, move to utils
-        from django.template.loader import get_template
-        from django.template import Template
-        if template:
-            t = get_template(template)
-        elif not self.message_template:
-            if self.html_default_template:
-                template_file = 'html/formdefinition/data_table_message.html'
-            else:
-                template_file = 'txt/formdefinition/data_message.txt'
-            t = get_template(template_file)
+        if context is None:
+            context = self.get_form_data_context(form_data)
         else:
-            t = Template(self.message_template)
-        context = self.get_form_data_context(form_data)
+            context = dict(context)
         context['data'] = form_data
+        if not template and self.message_template:
+            t = get_template_from_string(self.message_template)
+            if t is None:  # raise the template's syntax error
+                t = Template(self.message_template)
+            return t.render(Context(context))
+        if not template:
+            if self.html_default_template:
+                template = 'html/formdefinition/data_table_message.html'
+            else:
+                template = 'txt/formdefinition/data_message.txt'
         if django.VERSION[:2] < (1, 8):
-            from django.template import Context
             context = Context(context)
-        return t.render(context)
+        return get_file_template(template).render(context)
 
     def count_fields(self):
         return self.formdefinitionfield_set.count()
@@ -131,14 +239,13 @@ class FormDefinition(models.Model):
     def __str__(self):
         return self.title or self.name
 
-    def log(self, form, user=None):
-        form_data = self.get_form_data(form)
+    def log(self, form, user=None, payload=None):
+        if payload is None:
+            payload = SubmissionPayload.from_form(self, form)
         created_by = None
         if user and user.is_authenticated():
             created_by = user
-        flog = FormLog(form_definition=self, data=form_data, created_by=created_by)
-        flog.save()
-        return flog
+        return FormLog.objects.create_with_data(self, list(payload.data), created_by=created_by)
 
     @warn_about_renamed_method(
         'FormDefinition', 'string_template_replace', 'form_designer.utils.string_template_replace',
@@ -147,25 +254,68 @@ class FormDefinition(models.Model):
     def string_template_replace(self, text, context_dict):
         return string_template_replace(text, context_dict)
 
-    def send_mail(self, form, files=None):
+    def get_upload_limits(self):
+        """
+        Get the maximum size of each uploaded file and of all files uploaded with a submission.
+        """
+        return (
+            (settings.MAX_UPLOAD_SIZE if self.max_upload_size is None else self.max_upload_size),
+            (settings.MAX_UPLOAD_TOTAL_SIZE if self.max_upload_total_size is None else self.max_upload_total_size),
+        )
+
+    def clean(self):
+        if self.mail_attachment_max_size is not None and not settings.SITE_URL:
+            raise ValidationError({'mail_attachment_max_size': _(
+                'Files can only be linked to in mails if FORM_DESIGNER_SITE_URL has been set.'
+            )})
+
+    def get_mail_attachment_max_size(self):
+        """
+        Get the size above which uploaded files are linked instead of attached to mails, or None.
+
+        Without a `FORM_DESIGNER_SITE_URL` for the links all files are attached; the `form_designer.E001`
+        check and `clean` report such a size beforehand.
+        """
+        max_size = self.mail_attachment_max_size
+        if max_size is None:
+            max_size = settings.MAIL_ATTACHMENT_MAX_SIZE
+        if not settings.SITE_URL:
+            return None
+        return max_size
+
+    def send_mail(self, form, files=None, payload=None):
         if not self.mail_to:
             return
         from form_designer.email import build_form_mail
-        message = build_form_mail(form_definition=self, form=form, files=files)
-        message.send(fail_silently=False)
+        message = build_form_mail(form_definition=self, form=form, files=files, payload=payload)
+        if settings.MAIL_OUTBOX:
+            OutboxMail.objects.create(form_definition=self, message=message)
+        else:
+            try:
+                message.send(fail_silently=False)
+            except Exception:
+                metrics.inc('form_designer_mails_failed_total', form=self.name)
+                raise
+            metrics.inc('form_designer_mails_sent_total', form=self.name)
         return message
 
-    @property
+    @cached_property
     def is_template_html(self):
-        if self.message_template and re.search(u"<[^>]+>", self.message_template) and re.search(u"</[^>]+>", self.message_template):
+        template = self.message_template
+        if template and HTML_TAG_RE.search(template) and HTML_END_TAG_RE.search(template):
             return True
         return False
 
-    @property
+    @cached_property
     def submit_flag_name(self):
+        # resolved along with the compiled form, which has the field definitions at hand
+        return get_compiled_form(self).submit_flag_name
+
+    def get_submit_flag_name(self, field_names):
         name = settings.SUBMIT_FLAG_NAME % self.name
+        field_names = set(field_names)
         # make sure we are not overriding one of the actual form fields
-        while self.formdefinitionfield_set.filter(name__exact=name).count() > 0:
+        while name in field_names:
             name += '_'
         return name
 
@@ -247,9 +397,8 @@ class FormDefinitionField(models.Model):
         if self.field_class in ('django.forms.ChoiceField', 'django.forms.MultipleChoiceField'):
             if self.choice_values:
                 choices = []
-                regex = re.compile('[\s]*\n[\s]*')
-                values = regex.split(self.choice_values)
-                labels = regex.split(self.choice_labels) if self.choice_labels else []
+                values = CHOICE_SEPARATOR_RE.split(self.choice_values)
+                labels = CHOICE_SEPARATOR_RE.split(self.choice_labels) if self.choice_labels else []
                 for index, value in enumerate(values):
                     try:
                         label = labels[index]
@@ -281,16 +430,183 @@ class FormDefinitionField(models.Model):
         return (self.label or self.name)
 
 
+class FormLogQuerySet(models.QuerySet):
+    _prefetch_form_data = False
+
+    def create_with_data(self, form_definition, data, created_by=None):
+        """
+        Create a form log and its values in a single transaction.
+
+        :param form_definition: The form definition the data was submitted to
+        :param data: List of `FormValueDict`s, as returned by `FormDefinition.get_form_data`
+        :param created_by: The submitting user, if any
+        :rtype: FormLog
+        """
+        form_log = self.model(form_definition=form_definition, created_by=created_by, data=data)
+        form_log.save(force_insert=True, using=self.db)
+        return form_log
+
+    def bulk_create_with_data(self, form_definition, data_list, created_by=None):
+        """
+        Create several form logs in a single transaction, inserting the values of all of them at once.
+
+        :param data_list: List of form data, one per log (see `create_with_data`)
+        :rtype: list[FormLog]
+        """
+        form_logs = []
+        with transaction.atomic(using=self.db):
+            for data in data_list:
+                form_log = self.model(form_definition=form_definition, created_by=created_by)
+                form_log.render_summaries(data)
+                # `FormLog.save` would insert the values of each log separately
+                models.Model.save(form_log, force_insert=True, using=self.db)
+                form_logs.append(form_log)
+            FormValue.objects.using(self.db).bulk_create([
+                FormValue(form_log=form_log, field_name=item['name'], value=item['value'])
+                for form_log, data in zip(form_logs, data_list)
+                for item in data
+            ])
+        bump_cache_generation_on_commit(get_logs_generation_key(form_definition.pk), using=self.db)
+        return form_logs
+
+    def filter_value(self, field_name, value, lookup='exact'):
+        """
+        Filter form logs by one of their submitted values in the database, e.g.
+        `FormLog.objects.filter_value('age', 18, 'gte')`.
+
+        The typed column that is compared is chosen by the type of `value`.
+        """
+        if value is None and lookup == 'exact':
+            return self.filter(values__field_name=field_name, values__value_type=typed_values.VALUE_TYPE_NONE)
+        return self.filter(**{
+            'values__field_name': field_name,
+            'values__%s__%s' % (typed_values.get_value_column(value), lookup): value,
+        })
+
+    def get_page(self, cursor=None, size=None, newest_first=None):
+        """
+        Get a page of form logs, see `FormLogPage`.
+        """
+        return FormLogPage(self, cursor=cursor, size=size, newest_first=newest_first)
+
+    def with_data(self):
+        """
+        Return a queryset that batch-loads the data of its form logs when it is evaluated.
+
+        See `prefetch_form_data`.
+        """
+        clone = self.select_related('form_definition')
+        clone._prefetch_form_data = True
+        return clone
+
+    def _clone(self, *args, **kwargs):
+        clone = super(FormLogQuerySet, self)._clone(*args, **kwargs)
+        clone._prefetch_form_data = self._prefetch_form_data
+        return clone
+
+    def _fetch_all(self):
+        prefetch = (self._result_cache is None and self._prefetch_form_data)
+        super(FormLogQuerySet, self)._fetch_all()
+        if prefetch:
+            prefetch_form_data(self._result_cache)
+
+
+class FormLogPage(object):
+    """
+    A page of form logs with their data, paginated by primary key ("keyset pagination"), so reading
+    a page costs the same no matter how many logs there are. The logs are only read when the page
+    is iterated over.
+
+    :param cursor: The `next_cursor` of the previous page, or None for the first page
+    """
+    # query string parameter holding the cursor
+    cursor_param = 'logs_cursor'
+
+    def __init__(self, queryset, cursor=None, size=None, newest_first=None):
+        self.queryset = queryset
+        self.cursor = cursor
+        self.size = size or settings.DISPLAY_LOGGED_PAGE_SIZE
+        self.newest_first = (settings.DISPLAY_LOGGED_NEWEST_FIRST if newest_first is None else newest_first)
+
+    @classmethod
+    def get_cursor(cls, query_dict):
+        """
+        Get the cursor from a request's query string, or None if it has no valid one.
+        """
+        try:
+            return int(query_dict.get(cls.cursor_param, ''))
+        except ValueError:
+            return None
+
+    @cached_property
+    def _logs(self):
+        queryset = self.queryset
+        if self.cursor is not None:
+            queryset = queryset.filter(**{('pk__lt' if self.newest_first else 'pk__gt'): self.cursor})
+        # fetch one more log to know if there is a next page
+        return list(queryset.with_data().order_by('-pk' if self.newest_first else 'pk')[:self.size + 1])
+
+    @property
+    def logs(self):
+        return self._logs[:self.size]
+
+    @property
+    def next_cursor(self):
+        if len(self._logs) > self.size:
+            return self._logs[self.size - 1].pk
+        return None
+
+    def __iter__(self):
+        return iter(self.logs)
+
+    def __len__(self):
+        return len(self.logs)
+
+
+def prefetch_form_data(form_logs):
+    """
+    Load everything `FormLog.get_data` needs for the given form logs using two queries in total:
+    one for their values and one for the fields of their form definitions. Logs of the same form
+    definition share one field dict.
+
+    :param form_logs: Iterable of form logs
+    :return: The form logs, as a list
+    """
+    form_logs = [form_log for form_log in form_logs if isinstance(form_log, FormLog) and form_log.pk]
+    if not form_logs:
+        return form_logs
+    field_dicts = dict((form_log.form_definition_id, OrderedDict()) for form_log in form_logs)
+    for field in FormDefinitionField.objects.filter(form_definition__in=list(field_dicts)):
+        field_dicts[field.form_definition_id][field.name] = field
+    values = defaultdict(list)
+    for value in FormValue.objects.filter(form_log__in=[form_log.pk for form_log in form_logs]):
+        values[value.form_log_id].append(value)
+    for form_log in form_logs:
+        form_log._field_dict = field_dicts[form_log.form_definition_id]
+        form_log._values = values[form_log.pk]
+    return form_logs
+
+
 @python_2_unicode_compatible
 class FormLog(models.Model):
     form_definition = models.ForeignKey(FormDefinition, related_name='logs')
-    created = models.DateTimeField(_('Created'), auto_now=True)
+    created = models.DateTimeField(_('Created'), auto_now=True, db_index=True)
     created_by = models.ForeignKey(getattr(django_settings, "AUTH_USER_MODEL", "auth.User"), null=True, blank=True)
+    # rendered from the data when it is saved, see `render_summaries`
+    summary_html = models.TextField(_('summary'), blank=True, editable=False)
+    summary_text = models.TextField(_('plain text summary'), blank=True, editable=False)
     _data = None
+    # set by `prefetch_form_data`
+    _field_dict = None
+    _values = None
+
+    objects = FormLogQuerySet.as_manager()
 
     class Meta:
         verbose_name = _('form log')
         verbose_name_plural = _('form logs')
+        # (form_definition, id) serves the keyset pages of `FormLogPage`
+        index_together = [('form_definition', 'created'), ('form_definition', 'id')]
 
     def __str__(self):
         return "%s (%s)" % (
@@ -303,10 +619,13 @@ class FormLog(models.Model):
             # before instance is saved
             return self._data
         data = []
-        fields = self.form_definition.get_field_dict()
+        if self._field_dict is not None:
+            fields = self._field_dict
+        else:
+            fields = self.form_definition.get_field_dict()
         values_with_header = {}
         values_without_header = []
-        for item in self.values.all():
+        for item in (self._values if self._values is not None else self.values.all()):
             field = fields.get(item.field_name, None)
             if field:
                 # get field label if field definition still exists
@@ -340,26 +659,245 @@ class FormLog(models.Model):
 
     data = property(get_data, set_data)
 
+    def render_summaries(self, data=None):
+        """
+        Render the HTML and plain text summaries of the log's data. They are stored with the log, so
+        lists of logs can be displayed without loading and rendering each log's data.
+        """
+        if data is None:
+            data = self.data
+        self.summary_html = self.form_definition.compile_message(data, SUMMARY_HTML_TEMPLATE)
+        self.summary_text = self.form_definition.compile_message(data, SUMMARY_TEXT_TEMPLATE)
+
     def save(self, *args, **kwargs):
-        super(FormLog, self).save(*args, **kwargs)
-        if self._data:
-            # safe form data and then clear temporary variable
-            for value in self.values.all():
-                value.delete()
-            for item in self._data:
-                FormValue.objects.create(
-                    form_log=self,
-                    field_name=item['name'],
-                    value=item['value'],
-                )
-            self._data = None
+        using = kwargs.get('using') or router.db_for_write(self.__class__, instance=self)
+        adding = self._state.adding
+        if self._data is not None:
+            self.render_summaries(self._data)
+        with transaction.atomic(using=using):
+            super(FormLog, self).save(*args, **kwargs)
+            if self._data is not None:
+                # save form data and then clear temporary variable
+                if not adding:
+                    FormValue.objects.using(using).filter(form_log=self).delete()
+                FormValue.objects.using(using).bulk_create([
+                    FormValue(form_log=self, field_name=item['name'], value=item['value'])
+                    for item in self._data
+                ])
+                self._data = None
+                self._values = None
+        bump_cache_generation_on_commit(get_logs_generation_key(self.form_definition_id), using=using)
 
 
 @python_2_unicode_compatible
 class FormValue(models.Model):
     form_log = models.ForeignKey(FormLog, related_name='values')
     field_name = models.SlugField(_('field name'), max_length=255)
-    value = PickledObjectField(_('value'), null=True, blank=True)
+    # See `form_designer.typed_values` for how values are stored; use the `value` property to read and write them.
+    value_type = models.CharField(
+        _('value type'), max_length=10, choices=typed_values.VALUE_TYPE_CHOICES, blank=True, default=''
+    )
+    value_text = models.TextField(_('text value'), null=True, blank=True)
+    value_number = models.DecimalField(
+        _('numeric value'), max_digits=typed_values.NUMBER_MAX_DIGITS,
+        decimal_places=typed_values.NUMBER_DECIMAL_PLACES, null=True, blank=True
+    )
+    value_date = models.DateField(_('date value'), null=True, blank=True)
+    value_datetime = models.DateTimeField(_('date & time value'), null=True, blank=True)
+    value_bool = models.NullBooleanField(_('yes/no value'))
+    value_pickled = PickledObjectField(_('pickled value'), null=True, blank=True)
 
     def __str__(self):
         return u'%s = %s' % (self.field_name, self.value)
+
+    def get_value(self):
+        return typed_values.decode_value(self.value_type, self.value_text, self.value_pickled)
+
+    def set_value(self, value):
+        for column, column_value in typed_values.encode_value(value).items():
+            setattr(self, column, column_value)
+
+    value = property(get_value, set_value)
+
+    class Meta:
+        index_together = [('form_log', 'field_name')]
+
+
+class OutboxMailQuerySet(models.QuerySet):
+
+    def due(self, now=None):
+        return self.filter(
+            status=OutboxMail.STATUS_QUEUED,
+            next_attempt_at__lte=(now or timezone.now()),
+        ).order_by('next_attempt_at', 'pk')
+
+    def claim(self, limit, lease=None):
+        """
+        Claim up to `limit` due mails for sending.
+
+        Claimed mails are not due again until their lease runs out, so several workers can drain the
+        outbox at once, and mails claimed by a worker that died are eventually sent by another one.
+
+        :rtype: list[OutboxMail]
+        """
+        now = timezone.now()
+        lease_end = now + timedelta(seconds=(lease or settings.MAIL_OUTBOX_LEASE))
+        claimed = []
+        for mail in self.due(now).select_related('form_definition')[:limit]:
+            # only one worker can move the mail's next attempt from the value it has read
+            if OutboxMail.objects.filter(
+                pk=mail.pk, status=mail.status, next_attempt_at=mail.next_attempt_at
+            ).update(next_attempt_at=lease_end):
+                mail.next_attempt_at = lease_end
+                claimed.append(mail)
+        return claimed
+
+    def queue_failed(self, form_definition, failures):
+        """
+        Queue mails whose first delivery attempt has failed, so they are retried like queued mails.
+
+        :param failures: List of messages and the errors they failed with
+        """
+        mails = []
+        for message, error in failures:
+            mail = OutboxMail(form_definition=form_definition, message=message)
+            mail.record_failure(error)
+            mails.append(mail)
+        return self.bulk_create(mails)
+
+
+@python_2_unicode_compatible
+class OutboxMail(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_QUEUED, _('queued')),
+        (STATUS_SENT, _('sent')),
+        (STATUS_FAILED, _('failed')),
+    )
+
+    form_definition = models.ForeignKey(FormDefinition, null=True, blank=True, on_delete=models.SET_NULL)
+    message = PickledObjectField(_('message'))
+    status = models.CharField(_('status'), max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveIntegerField(_('attempts'), default=0)
+    created = models.DateTimeField(_('Created'), auto_now_add=True)
+    next_attempt_at = models.DateTimeField(_('next attempt'), default=timezone.now, db_index=True)
+    sent = models.DateTimeField(_('sent'), null=True, blank=True)
+    last_error = models.TextField(_('last error'), blank=True)
+
+    objects = OutboxMailQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = _('outbox mail')
+        verbose_name_plural = _('outbox mails')
+
+    def __str__(self):
+        return self.message.subject
+
+    def mark_sent(self):
+        self.status = self.STATUS_SENT
+        self.attempts += 1
+        self.sent = timezone.now()
+        self.last_error = ''
+        self.save(update_fields=('status', 'attempts', 'sent', 'last_error'))
+
+    def mark_failed(self, error):
+        """
+        Record a failed delivery attempt, and schedule the next one with exponential backoff.
+        """
+        self.record_failure(error)
+        self.save(update_fields=('status', 'attempts', 'next_attempt_at', 'last_error'))
+
+    def record_failure(self, error):
+        """
+        Like `mark_failed`, but without saving the mail.
+        """
+        self.attempts += 1
+        self.last_error = force_text(error)
+        if self.attempts >= settings.MAIL_OUTBOX_MAX_ATTEMPTS:
+            self.status = self.STATUS_FAILED
+        else:
+            delay = settings.MAIL_OUTBOX_RETRY_DELAY * 2 ** (self.attempts - 1)
+            self.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+
+
+@receiver(post_save, sender=FormDefinitionField)
+@receiver(post_delete, sender=FormDefinitionField)
+def update_form_definition_version(sender, instance, using=None, **kwargs):
+    """
+    Give the form definition a new version whenever one of its fields changes.
+    """
+    FormDefinition.objects.filter(pk=instance.form_definition_id).update(version=get_random_hash())
+    forget_compiled_form(instance.form_definition_id)
+    bump_cache_generation_on_commit(DEFINITIONS_GENERATION_KEY, using=using)
+
+
+@checks.register()
+def check_mail_attachment_max_size(app_configs, **kwargs):
+    """
+    Uploaded files larger than `FORM_DESIGNER_MAIL_ATTACHMENT_MAX_SIZE` are linked to, which requires absolute URLs.
+    """
+    if settings.MAIL_ATTACHMENT_MAX_SIZE is not None and not settings.SITE_URL:
+        return [checks.Error(
+            'FORM_DESIGNER_MAIL_ATTACHMENT_MAX_SIZE requires FORM_DESIGNER_SITE_URL to be set.',
+            hint='Without it, all uploaded files are attached to form mails.',
+            id='form_designer.E001',
+        )]
+    return []
+
+
+def get_logs_generation_key(form_definition_id):
+    return 'form_designer:logs:%s:generation' % form_definition_id
+
+
+@receiver(post_delete, sender=FormLog)
+def update_logs_generation(sender, instance, using=None, **kwargs):
+    bump_cache_generation_on_commit(get_logs_generation_key(instance.form_definition_id), using=using)
+
+
+@receiver(post_delete, sender=FormDefinition)
+def forget_deleted_form_definition(sender, instance, **kwargs):
+    forget_compiled_form(instance.pk)
+
+
+# Bumped whenever a form definition or one of its fields changes. Cached definitions are looked up by
+# name or hash, so they cannot be dropped one by one; their keys contain the generation instead.
+DEFINITIONS_GENERATION_KEY = 'form_designer:definitions:generation'
+
+
+@receiver(post_save, sender=FormDefinition)
+@receiver(post_delete, sender=FormDefinition)
+def update_definitions_generation(sender, instance, using=None, **kwargs):
+    bump_cache_generation_on_commit(DEFINITIONS_GENERATION_KEY, using=using)
+
+
+def get_cached_form_definition(**lookup):
+    """
+    Get the form definition with the given name or public hash, e.g.
+    `get_cached_form_definition(public_hash=public_hash)`, along with its compiled form.
+
+    If a shared cache is configured (`FORM_DESIGNER_CACHE_BACKEND`), the definition and its fields are
+    cached there, so a warm cache serves them without querying the database. Otherwise, this is a plain
+    query. Missing definitions are not cached.
+
+    :raises FormDefinition.DoesNotExist: if there is no such form definition
+    :rtype: FormDefinition
+    """
+    (lookup_name, value), = lookup.items()
+    if lookup_name not in ('name', 'public_hash'):
+        raise ValueError('Form definitions can only be looked up by name or public_hash, not %s' % lookup_name)
+    cache = get_shared_cache()
+    if cache is None:
+        return FormDefinition.objects.get(**lookup)
+    key = 'form_designer:definition:%s:%s:%s' % (
+        get_cache_generation(DEFINITIONS_GENERATION_KEY), lookup_name, hashlib.md5(force_bytes(value)).hexdigest()
+    )
+    cached = cache.get(key)
+    if cached is None:
+        form_definition = FormDefinition.objects.get(**lookup)
+        cached = (form_definition, list(form_definition.formdefinitionfield_set.all()))
+        cache.set(key, cached, settings.CACHE_TIMEOUT)
+    form_definition, def_fields = cached
+    get_compiled_form(form_definition, def_fields)
+    return form_definition
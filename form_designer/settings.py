@@ -36,7 +36,7 @@ WIDGET_CLASSES = getattr(settings, 'FORM_DESIGNER_WIDGET_CLASSES', (
 
 EXPORTER_CLASSES = getattr(settings, 'FORM_DESIGNER_EXPORTER_CLASSES', (
     'form_designer.contrib.exporters.csv_exporter.CsvExporter',
-    'form_designer.contrib.exporters.xls_exporter.XlsExporter',
+    'form_designer.contrib.exporters.xlsx_exporter.XlsxExporter',
 ))
 
 FORM_TEMPLATES = getattr(settings, 'FORM_DESIGNER_FORM_TEMPLATES', (
@@ -73,6 +73,18 @@ CSV_EXPORT_ENCODING = getattr(settings, 'FORM_DESIGNER_CSV_EXPORT_ENCODING', 'ut
 
 CSV_EXPORT_NULL_VALUE = getattr(settings, 'FORM_DESIGNER_CSV_EXPORT_NULL_VALUE', '')
 
+# stream CSV exports to the client instead of building them in memory
+CSV_EXPORT_STREAMING = getattr(settings, 'FORM_DESIGNER_CSV_EXPORT_STREAMING', False)
+
+# number of form logs loaded from the database at once when exporting
+EXPORT_CHUNK_SIZE = getattr(settings, 'FORM_DESIGNER_EXPORT_CHUNK_SIZE', 500)
+
+# XLSX exports start a new sheet after this many rows (the maximum supported by Excel)
+XLSX_EXPORT_MAX_ROWS_PER_SHEET = getattr(settings, 'FORM_DESIGNER_XLSX_EXPORT_MAX_ROWS_PER_SHEET', 1048576)
+
+# size up to which XLSX exports are kept in memory before being moved to a temporary file
+XLSX_EXPORT_SPOOL_SIZE = getattr(settings, 'FORM_DESIGNER_XLSX_EXPORT_SPOOL_SIZE', 4194304)  # 4M
+
 SUBMIT_FLAG_NAME = getattr(settings, 'FORM_DESIGNER_SUBMIT_FLAG_NAME', 'submit__%s')
 
 FILE_STORAGE_CLASS = getattr(settings, 'FORM_DESIGNER_FILE_STORAGE_CLASS', get_storage_class())
@@ -87,9 +99,100 @@ ALLOWED_FILE_TYPES = getattr(settings, 'FORM_DESIGNER_ALLOWED_FILE_TYPES', (
     'tif', 'tiff', 'ttf', 'txt', 'wav', 'wma', 'wmv', 'xls', 'xlsx', 'xml', 'zip'
 ))
 
+# Store uploaded files under an HMAC of their content keyed with the SECRET_KEY, so files uploaded repeatedly are
+# only stored once. Files stored this way are not named after the form and the uploaded file any more, and are shared
+# by all forms. Nothing keeps track of which logs refer to a stored file, so such files can never be deleted along
+# with a log; changing the SECRET_KEY makes new uploads get new names.
+CONTENT_ADDRESSED_UPLOADS = getattr(settings, 'FORM_DESIGNER_CONTENT_ADDRESSED_UPLOADS', False)
+
+# Number of threads per process that store the files of submissions with several files at once.
+# Set to 1 to store them one by one. Python 2 requires the `futures` package for this.
+UPLOAD_WORKERS = getattr(settings, 'FORM_DESIGNER_UPLOAD_WORKERS', 4)
+
 MAX_UPLOAD_SIZE = getattr(settings, 'MAX_UPLOAD_SIZE', 5242880)  # 5M
 MAX_UPLOAD_TOTAL_SIZE = getattr(settings, 'MAX_UPLOAD_TOTAL_SIZE', 10485760)  # 10M
 
 VALUE_PICKLEFIELD = True
 
+# Alias of a Django cache (see the CACHES setting) shared by all processes, used to cache form definition
+# data. Leave as None to only use per-process caches.
+CACHE_BACKEND = getattr(settings, 'FORM_DESIGNER_CACHE_BACKEND', None)
+
+CACHE_TIMEOUT = getattr(settings, 'FORM_DESIGNER_CACHE_TIMEOUT', 3600)
+
+# number of compiled form classes kept in memory by each process
+COMPILED_FORM_CACHE_SIZE = getattr(settings, 'FORM_DESIGNER_COMPILED_FORM_CACHE_SIZE', 128)
+
+# number of compiled templates for mail addresses and subjects kept in memory by each process
+TEMPLATE_CACHE_SIZE = getattr(settings, 'FORM_DESIGNER_TEMPLATE_CACHE_SIZE', 256)
+
+# number of logged submissions shown per page on forms with `display_logged` enabled
+DISPLAY_LOGGED_PAGE_SIZE = getattr(settings, 'FORM_DESIGNER_DISPLAY_LOGGED_PAGE_SIZE', 20)
+
+DISPLAY_LOGGED_NEWEST_FIRST = getattr(settings, 'FORM_DESIGNER_DISPLAY_LOGGED_NEWEST_FIRST', True)
+
+# Dotted paths of classes that are reported the time and query count of each stage of form submissions,
+# e.g. 'form_designer.instrumentation.LoggingSink' or 'form_designer.instrumentation.SlowSubmissionSink'
+INSTRUMENTATION_SINKS = getattr(settings, 'FORM_DESIGNER_INSTRUMENTATION_SINKS', ())
+
+# submissions taking at least this many seconds are logged by `SlowSubmissionSink`
+SLOW_SUBMISSION_THRESHOLD = getattr(settings, 'FORM_DESIGNER_SLOW_SUBMISSION_THRESHOLD', 1.0)
+
+# Dotted path of the store the metrics of each process are saved to, to be exposed in the Prometheus text format
+# by the `form_designer.views.metrics` view: 'form_designer.metrics.CacheMetricsStore' (uses the shared cache),
+# 'form_designer.metrics.FileMetricsStore' or 'form_designer.metrics.LocalMetricsStore' (single process only).
+# Leave as None to not collect metrics.
+METRICS_STORE = getattr(settings, 'FORM_DESIGNER_METRICS_STORE', None)
+
+# directory used by `FileMetricsStore`, shared by all processes
+METRICS_DIRECTORY = getattr(settings, 'FORM_DESIGNER_METRICS_DIRECTORY', None)
+
+# seconds between saving the metrics of a process to the store
+METRICS_FLUSH_INTERVAL = getattr(settings, 'FORM_DESIGNER_METRICS_FLUSH_INTERVAL', 15)
+
+# seconds after which the saved metrics of a process that stopped saving them (e.g. because it exited) are
+# dropped from the store. Processes only save their metrics when they count something, so keep this well
+# above the time a process may sit idle.
+METRICS_MAX_AGE = getattr(settings, 'FORM_DESIGNER_METRICS_MAX_AGE', 24 * 60 * 60)
+
+# upper bounds in seconds of the buckets of the latency histograms
+METRICS_BUCKETS = getattr(settings, 'FORM_DESIGNER_METRICS_BUCKETS', (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+))
+
+# if set, the metrics view requires an "Authorization: Bearer <token>" header with this token
+METRICS_TOKEN = getattr(settings, 'FORM_DESIGNER_METRICS_TOKEN', None)
+
+# Uploaded files larger than this many bytes are not attached to form mails, but linked to with an expiring link
+# to the `form_designer.views.download` view. Can be set per form definition. None attaches all files.
+MAIL_ATTACHMENT_MAX_SIZE = getattr(settings, 'FORM_DESIGNER_MAIL_ATTACHMENT_MAX_SIZE', None)
+
+# seconds for which links to uploaded files in form mails are valid
+DOWNLOAD_LINK_MAX_AGE = getattr(settings, 'FORM_DESIGNER_DOWNLOAD_LINK_MAX_AGE', 604800)  # 7 days
+
+# scheme and host prepended to links in form mails, e.g. 'https://www.example.com'
+SITE_URL = getattr(settings, 'FORM_DESIGNER_SITE_URL', '')
+
+# Token that clients have to send as an "Authorization: Bearer <token>" header to submit batches of submissions
+# as JSON to the `form_designer.views.batch` view. Leave as None to disable the view.
+BATCH_SUBMISSION_TOKEN = getattr(settings, 'FORM_DESIGNER_BATCH_SUBMISSION_TOKEN', None)
+
+# maximum number of submissions per batch
+BATCH_SUBMISSION_MAX_ITEMS = getattr(settings, 'FORM_DESIGNER_BATCH_SUBMISSION_MAX_ITEMS', 500)
+
+# Queue form mails in the database instead of sending them while handling the submission.
+# Queued mails are sent by the `form_designer_send_mail` management command.
+MAIL_OUTBOX = getattr(settings, 'FORM_DESIGNER_MAIL_OUTBOX', False)
+
+# number of queued mails sent over one connection
+MAIL_OUTBOX_BATCH_SIZE = getattr(settings, 'FORM_DESIGNER_MAIL_OUTBOX_BATCH_SIZE', 100)
+
+MAIL_OUTBOX_MAX_ATTEMPTS = getattr(settings, 'FORM_DESIGNER_MAIL_OUTBOX_MAX_ATTEMPTS', 5)
+
+# seconds until a failed mail is retried; doubled after each further failure
+MAIL_OUTBOX_RETRY_DELAY = getattr(settings, 'FORM_DESIGNER_MAIL_OUTBOX_RETRY_DELAY', 60)
+
+# seconds after which mails claimed by a worker that did not finish sending them are claimed again
+MAIL_OUTBOX_LEASE = getattr(settings, 'FORM_DESIGNER_MAIL_OUTBOX_LEASE', 600)
+
 DESIGNED_FORM_CLASS = getattr(settings, 'FORM_DESIGNER_DESIGNED_FORM_CLASS', 'form_designer.forms.DesignedForm')
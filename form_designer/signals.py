@@ -1,6 +1,9 @@
 from django import dispatch
 
 designedform_submit = dispatch.Signal(providing_args=["designed_form"])
-designedform_success = dispatch.Signal(providing_args=["designed_form"])
+# `payload` is the `SubmissionPayload` of the valid submission. It is taken from the form before the signal
+# is sent and is what gets logged and mailed, so receivers can't change the logged or mailed data by
+# changing `form.cleaned_data`.
+designedform_success = dispatch.Signal(providing_args=["designed_form", "payload"])
 designedform_error = dispatch.Signal(providing_args=["designed_form"])
 designedform_render = dispatch.Signal(providing_args=["designed_form"])
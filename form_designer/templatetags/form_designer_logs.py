@@ -0,0 +1,44 @@
+import hashlib
+
+from django import template
+from django.template.loader import render_to_string
+from django.utils.encoding import force_bytes
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
+
+from form_designer import settings as app_settings
+from form_designer.models import FormLogPage, get_logs_generation_key
+from form_designer.utils import get_cache_generation, get_shared_cache
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def logged_submissions(context, template_name):
+    """
+    Render the page of logged submissions in the context (`logs`) with the given template.
+
+    If a shared cache has been configured, the rendered page is cached until a form log is written
+    or deleted, or the form definition changes.
+    """
+    logs = context.get('logs')
+    if logs is None:
+        return ''
+    form_definition = context.get('form_definition')
+    fragment_context = {'logs': logs, 'form_definition': form_definition}
+    generation = None
+    if isinstance(logs, FormLogPage) and form_definition is not None:
+        generation = get_cache_generation(get_logs_generation_key(form_definition.pk))
+    if generation is None:
+        return mark_safe(render_to_string(template_name, fragment_context))
+
+    key = 'form_designer:logs_html:%s' % hashlib.md5(force_bytes('|'.join('%s' % part for part in (
+        form_definition.pk, form_definition.version, generation, template_name,
+        logs.cursor, logs.size, logs.newest_first, get_language(),
+    )))).hexdigest()
+    cache = get_shared_cache()
+    html = cache.get(key)
+    if html is None:
+        html = render_to_string(template_name, fragment_context)
+        cache.set(key, html, app_settings.CACHE_TIMEOUT)
+    return mark_safe(html)
@@ -23,3 +23,19 @@ def greeting_form():
         required=False,
     )
     return fd
+
+
+@pytest.fixture()
+def submit_form(rf):
+    """
+    Submit data to a form definition with `process_form`, and return its context.
+    """
+    from django.contrib.auth.models import AnonymousUser
+    from form_designer.views import process_form
+
+    def submit(form_definition, **data):
+        data[form_definition.submit_flag_name] = 'true'
+        request = rf.post('/', data)
+        request.user = AnonymousUser()
+        return process_form(request, form_definition, push_messages=False, disable_redirection=True)
+    return submit
@@ -1,8 +1,11 @@
+from django.core.management import call_command
+from django.db import connection
 from django.forms.models import model_to_dict
+from django.test.utils import CaptureQueriesContext
 from django.utils.crypto import get_random_string
 
 import pytest
-from form_designer.models import FormDefinition
+from form_designer.models import FormDefinition, FormLog
 
 
 @pytest.mark.django_db
@@ -76,3 +79,46 @@ def test_admin_create_view_creates_form(admin_client, n_fields):
             assert data[key] == 'on'
         else:
             assert data[key] == value
+
+
+@pytest.mark.django_db
+def test_admin_log_list_view_renders(admin_client, greeting_form):
+    for n in range(3):
+        FormLog.objects.create_with_data(greeting_form, [{'name': 'greeting', 'value': 'hi %d' % n, 'label': None}])
+    content = admin_client.get("/admin/form_designer/formlog/").content.decode("utf8")
+    assert "hi 2" in content
+
+
+@pytest.mark.django_db
+def test_admin_log_list_uses_stored_summaries(admin_client, greeting_form):
+    for n in range(5):
+        FormLog.objects.create_with_data(
+            greeting_form, [{'name': 'greeting', 'value': 'hi %d' % n, 'label': 'Greeting'}]
+        )
+    log = FormLog.objects.first()
+    assert 'Greeting</strong>: hi 0' in log.summary_html
+    assert log.summary_text.strip() == 'Greeting: hi 0'
+    FormLog.objects.filter(pk=log.pk).update(summary_html='', summary_text='')
+    call_command('form_designer_render_summaries', verbosity=0)
+    assert FormLog.objects.get(pk=log.pk).summary_text.startswith('Greeting: hi 0')
+
+    def get_changelist():
+        with CaptureQueriesContext(connection) as queries:
+            content = admin_client.get("/admin/form_designer/formlog/").content.decode("utf8")
+        return content, len(queries)
+
+    content, n_queries = get_changelist()
+    assert all("hi %d" % n in content for n in range(5))
+    # The values of logs with stored summaries are not read at all
+    with CaptureQueriesContext(connection) as queries:
+        admin_client.get("/admin/form_designer/formlog/")
+    assert not [query for query in queries.captured_queries if 'form_designer_formvalue' in query['sql']]
+    for n in range(5, 10):
+        FormLog.objects.create_with_data(greeting_form, [{'name': 'greeting', 'value': 'hi %d' % n, 'label': None}])
+    # No queries per log
+    assert get_changelist()[1] == n_queries
+    # not even for logs without stored summaries, whose values and fields are loaded in a batch
+    FormLog.objects.update(summary_html='', summary_text='')
+    content, n_unrendered_queries = get_changelist()
+    assert all("hi %d" % n in content for n in range(10))
+    assert n_unrendered_queries == n_queries + 2
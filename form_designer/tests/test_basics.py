@@ -1,12 +1,17 @@
 # -- encoding: UTF-8 --
 from __future__ import unicode_literals
 
+import pickle
+import zipfile
 from base64 import b64decode
+from io import BytesIO
 
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.messages.storage.base import BaseStorage
 from django.core import mail
 from django.core.files.base import ContentFile, File
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils.crypto import get_random_string
 
 import pytest
@@ -14,8 +19,10 @@ import pytest
 from form_designer import settings as fd_settings
 from form_designer.contrib.exporters.csv_exporter import CsvExporter
 from form_designer.contrib.exporters.xls_exporter import XlsExporter
+from form_designer.contrib.exporters.xlsx_exporter import XlsxExporter
 from form_designer.forms import DesignedForm
-from form_designer.models import FormDefinition, FormDefinitionField, FormLog, FormValue
+from form_designer.models import FormDefinition, FormDefinitionField, FormLog, FormValue, SubmissionPayload
+from form_designer.signals import designedform_success
 from form_designer.views import process_form
 
 # https://raw.githubusercontent.com/mathiasbynens/small/master/jpeg.jpg
@@ -107,6 +114,7 @@ def test_simple_form(
 @pytest.mark.parametrize('exporter', [
     CsvExporter,
     XlsExporter,
+    XlsxExporter,
 ])
 @pytest.mark.parametrize('n_logs', range(5))
 def test_export(rf, greeting_form, exporter, n_logs):
@@ -134,3 +142,168 @@ def test_export(rf, greeting_form, exporter, n_logs):
             for i in range(1, n_logs):
                 assert message in csv_data[i]
                 assert ("%s" % i) in csv_data[i]
+    if 'spreadsheetml' in resp['content-type']:
+        sheet = read_xlsx_sheets(resp)[0]
+        assert sheet.count('<row ') == (n_logs + 1 if n_logs else 0)
+        for n in range(n_logs):
+            assert "%s %d" % (message, n + 1) in sheet
+
+
+def read_xlsx_sheets(response):
+    workbook = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+    assert workbook.testzip() is None
+    names = sorted(name for name in workbook.namelist() if name.startswith('xl/worksheets/'))
+    return [workbook.read(name).decode('utf8') for name in names]
+
+
+@pytest.mark.django_db
+def test_xlsx_export_types_and_sheets(monkeypatch, rf, greeting_form):
+    monkeypatch.setattr(XlsxExporter, 'max_rows_per_sheet', 3)
+    FormDefinitionField.objects.create(
+        form_definition=greeting_form, name='count', field_class='django.forms.IntegerField', position=1,
+    )
+    for n in range(4):
+        FormLog.objects.create_with_data(greeting_form, [
+            {'name': 'greeting', 'value': 'hi <%d>' % n, 'label': None},
+            {'name': 'count', 'value': n, 'label': None},
+        ])
+    resp = XlsxExporter(FormLog).export(request=rf.get("/"), queryset=FormLog.objects.all())
+    sheets = read_xlsx_sheets(resp)
+    # 4 logs plus a header on each sheet, 3 rows per sheet
+    assert [sheet.count('<row ') for sheet in sheets] == [3, 3]
+    assert sheets[1].count('Greeting') == 1
+    assert 'hi &lt;3&gt;' in sheets[1]
+    assert '<c><v>3</v></c>' in sheets[1]
+
+
+@pytest.mark.django_db
+def test_log_values_are_written_in_bulk(greeting_form, django_assert_num_queries):
+    data = [{'name': 'greeting', 'value': 'hello', 'label': 'Greeting'}]
+    data.extend({'name': 'extra_%d' % n, 'value': n, 'label': None} for n in range(10))
+    # One insert for the log and one for all of its values, within a savepoint
+    with django_assert_num_queries(4):
+        flog = FormLog.objects.create_with_data(greeting_form, data)
+    assert flog.values.count() == 11
+    flog.data = data[:1]
+    flog.save()
+    assert [value.field_name for value in flog.values.all()] == ['greeting']
+
+
+@pytest.mark.django_db
+def test_submission_data_is_extracted_once(rf, greeting_form):
+    payloads = []
+
+    def receiver(sender, payload, **kwargs):
+        payloads.append(payload)
+
+    designedform_success.connect(receiver)
+    try:
+        for greeting in ('hello', 'hi'):
+            request = rf.post('/', {'greeting': greeting, greeting_form.submit_flag_name: 'true'})
+            request.user = AnonymousUser()
+            with CaptureQueriesContext(connection) as queries:
+                context = process_form(request, greeting_form, push_messages=False, disable_redirection=True)
+    finally:
+        designedform_success.disconnect(receiver)
+
+    # the field definitions were loaded by the first submission only
+    assert not [query for query in queries.captured_queries if 'formdefinitionfield' in query['sql']]
+    payload = payloads[-1]
+    assert isinstance(payload, SubmissionPayload)
+    assert payload.values == {'greeting': 'hi', 'upload': None}
+    assert payload.labels['greeting'] == 'Greeting'
+    assert [(item['name'], item['value']) for item in context['form_log'].data] == list(payload.values.items())
+    assert 'hi' in context['form_mail_message'].body
+    with pytest.raises(AttributeError):
+        payload.data = ()
+    with pytest.raises(TypeError):
+        payload.data[0]['value'] = 'changed'
+    assert pickle.loads(pickle.dumps(payload.data[0])) == payload.data[0]
+    payload.context['greeting'] = 'changed'
+    assert payload.context['greeting'] == 'hi'
+
+
+@pytest.mark.django_db
+def test_batched_log_data(greeting_form, django_assert_num_queries):
+    for n in range(10):
+        FormLog.objects.create_with_data(greeting_form, [{'name': 'greeting', 'value': 'hi %d' % n, 'label': None}])
+    # One query for the logs and one each for their values and form definition fields
+    with django_assert_num_queries(3):
+        logs = list(FormLog.objects.with_data().order_by('pk'))
+        data = [log.data for log in logs]
+    assert [d[0]['value'] for d in data] == ['hi %d' % n for n in range(10)]
+    assert [d[0]['label'] for d in data] == ['Greeting'] * 10
+    assert data[0][1]['name'] == 'upload'
+
+
+@pytest.mark.django_db
+def test_streaming_csv_export(monkeypatch, rf, greeting_form):
+    monkeypatch.setattr(CsvExporter, 'streaming', True)
+    monkeypatch.setattr(fd_settings, 'EXPORT_CHUNK_SIZE', 3)
+    for n in range(10):
+        FormLog.objects.create_with_data(greeting_form, [{'name': 'greeting', 'value': 'hi %d' % n, 'label': None}])
+    resp = CsvExporter(FormLog).export(
+        request=rf.get("/"),
+        queryset=FormLog.objects.filter(form_definition=greeting_form).order_by('pk')
+    )
+    assert resp.streaming
+    csv_data = b''.join(resp.streaming_content).decode("utf8").splitlines()
+    assert len(csv_data) == 11
+    assert "Greeting" in csv_data[0]
+    for n in range(10):
+        assert "hi %d" % n in csv_data[n + 1]
+
+
+@pytest.mark.django_db
+def test_export_formats_columns_by_field_class(rf, greeting_form):
+    for name, field_class in (
+        ('agree', 'django.forms.BooleanField'),
+        ('colors', 'django.forms.MultipleChoiceField'),
+    ):
+        FormDefinitionField.objects.create(
+            form_definition=greeting_form, name=name, field_class=field_class, position=1,
+        )
+    FormLog.objects.create_with_data(greeting_form, [
+        {'name': 'greeting', 'value': 'hi', 'label': None},
+        {'name': 'agree', 'value': True, 'label': None},
+        {'name': 'colors', 'value': ['red', 'blue'], 'label': None},
+    ])
+    resp = CsvExporter(FormLog).export(request=rf.get("/"), queryset=FormLog.objects.all())
+    header, row = resp.content.decode("utf8").splitlines()
+    assert header.split(';')[2:] == ['Greeting', 'upload', 'agree', 'colors']
+    assert row.split(';')[2:] == ['hi', '', 'yes', 'red, blue']
+
+
+def test_string_template_replace_caches_templates():
+    from form_designer.utils import string_template_replace, template_cache
+    template_cache.clear()
+    assert string_template_replace('no tags here', {'a': 1}) == 'no tags here'
+    assert template_cache.info()['misses'] == 0
+    for n in range(3):
+        assert string_template_replace('Hello {{ name }}', {'name': n}) == 'Hello %d' % n
+        assert string_template_replace('{% broken', {}) == '{% broken'
+    assert template_cache.info() == {'hits': 4, 'misses': 2, 'size': 2, 'maxsize': fd_settings.TEMPLATE_CACHE_SIZE}
+
+
+def test_string_template_replace_falls_back_on_render_errors():
+    from form_designer.utils import string_template_replace
+    # widthratio only checks its arguments when it is rendered
+    text = 'Ratio {% widthratio a b "wide" %}'
+    assert string_template_replace(text, {'a': 1, 'b': 2}) == text
+
+
+@pytest.mark.django_db
+def test_message_template_is_compiled_once(greeting_form):
+    from form_designer.utils import template_cache
+    greeting_form.message_template = '<p>{{ greeting }}</p>'
+    greeting_form.save()
+    assert greeting_form.is_template_html
+    template_cache.clear()
+    for n in range(3):
+        data = [{'name': 'greeting', 'value': 'hi %d' % n, 'label': None}]
+        assert greeting_form.compile_message(data) == '<p>hi %d</p>' % n
+    assert template_cache.info()['misses'] == 1
+    greeting_form.message_template = 'Greeting: {{ greeting }}'
+    greeting_form.save()
+    assert not greeting_form.is_template_html
+    assert greeting_form.compile_message(data) == 'Greeting: hi 2'
@@ -0,0 +1,97 @@
+import json
+
+from django.contrib.auth.models import AnonymousUser
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.db import connection
+from django.http import Http404
+from django.test.utils import CaptureQueriesContext
+
+import pytest
+from form_designer import settings as fd_settings
+from form_designer.models import FormLog, FormValue, OutboxMail
+from form_designer.views import batch
+
+
+def post_batch(rf, form_definition, payload, token='s3cret'):
+    request = rf.post(
+        '/', json.dumps(payload), content_type='application/json', HTTP_AUTHORIZATION='Bearer %s' % token
+    )
+    request.user = AnonymousUser()
+    response = batch(request, form_definition.name)
+    if response['Content-Type'] != 'application/json':
+        return response, None
+    return response, json.loads(response.content.decode('utf-8'))
+
+
+@pytest.fixture()
+def batch_token(monkeypatch):
+    monkeypatch.setattr(fd_settings, 'BATCH_SUBMISSION_TOKEN', 's3cret')
+
+
+@pytest.mark.django_db
+def test_batch_is_validated_and_logged_at_once(rf, greeting_form, batch_token):
+    submissions = [{'greeting': 'hi %d' % n} for n in range(5)]
+    submissions.insert(2, {'greeting': ''})
+    submissions.append('hi')
+    with CaptureQueriesContext(connection) as queries:
+        response, content = post_batch(rf, greeting_form, {'submissions': submissions})
+    assert response.status_code == 200
+    statuses = [result['status'] for result in content['results']]
+    assert statuses == ['ok', 'ok', 'invalid', 'ok', 'ok', 'ok', 'invalid']
+    assert 'greeting' in content['results'][2]['errors']
+    assert content['mails'] == {'queued': 0, 'sent': 5, 'failed': 0}
+    assert len(mail.outbox) == 5
+
+    logs = FormLog.objects.filter(form_definition=greeting_form).order_by('pk')
+    assert [result['id'] for result in content['results'] if 'id' in result] == [log.pk for log in logs]
+    assert [log.data[0]['value'] for log in logs] == ['hi %d' % n for n in range(5)]
+    assert 'hi 4' in logs.last().summary_text
+    value_inserts = [
+        query for query in queries.captured_queries
+        if query['sql'].startswith('INSERT INTO "%s"' % FormValue._meta.db_table)
+    ]
+    assert len(value_inserts) == 1
+
+
+@pytest.mark.django_db
+def test_batch_mails_are_queued(monkeypatch, rf, greeting_form, batch_token):
+    monkeypatch.setattr(fd_settings, 'MAIL_OUTBOX', True)
+    response, content = post_batch(rf, greeting_form, {'submissions': [{'greeting': 'hi'}, {'greeting': 'ho'}]})
+    assert content['mails'] == {'queued': 2, 'sent': 0, 'failed': 0}
+    assert not mail.outbox
+    assert sorted(mail.message.subject for mail in OutboxMail.objects.all()) == [
+        'Someone sent you a greeting: hi', 'Someone sent you a greeting: ho'
+    ]
+
+
+@pytest.mark.django_db
+def test_unsent_batch_mails_are_queued(monkeypatch, rf, greeting_form, batch_token):
+    send_messages = EmailBackend.send_messages
+
+    def flaky_send_messages(backend, messages):
+        if any('ho' in message.subject for message in messages):
+            raise IOError('Connection reset by peer')
+        return send_messages(backend, messages)
+    monkeypatch.setattr(EmailBackend, 'send_messages', flaky_send_messages)
+
+    submissions = [{'greeting': 'hi'}, {'greeting': 'ho'}, {'greeting': 'hu'}]
+    response, content = post_batch(rf, greeting_form, {'submissions': submissions})
+    assert content['mails'] == {'queued': 1, 'sent': 2, 'failed': 0}
+    assert [message.subject[-2:] for message in mail.outbox] == ['hi', 'hu']
+    queued_mail = OutboxMail.objects.get()
+    assert queued_mail.message.subject.endswith('ho')
+    assert queued_mail.attempts == 1
+    assert 'Connection reset by peer' in queued_mail.last_error
+
+
+@pytest.mark.django_db
+def test_batch_requests_are_checked(monkeypatch, rf, greeting_form):
+    with pytest.raises(Http404):
+        post_batch(rf, greeting_form, {'submissions': []})
+    monkeypatch.setattr(fd_settings, 'BATCH_SUBMISSION_TOKEN', 's3cret')
+    assert post_batch(rf, greeting_form, {'submissions': []}, token='guess')[0].status_code == 403
+    assert post_batch(rf, greeting_form, [{'greeting': 'hi'}])[0].status_code == 400
+    monkeypatch.setattr(fd_settings, 'BATCH_SUBMISSION_MAX_ITEMS', 1)
+    assert post_batch(rf, greeting_form, {'submissions': [{}, {}]})[0].status_code == 400
+    assert not FormLog.objects.exists()
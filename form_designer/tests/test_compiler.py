@@ -0,0 +1,135 @@
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.db import transaction
+from django.http import Http404, QueryDict
+
+import pytest
+from form_designer import compiler
+from form_designer import settings as fd_settings
+from form_designer.compiler import get_compiled_form
+from form_designer.forms import DesignedForm
+from form_designer.models import DEFINITIONS_GENERATION_KEY, FormDefinition, FormDefinitionField
+from form_designer.utils import get_cache_generation
+from form_designer.views import detail, detail_by_hash
+
+
+@pytest.mark.django_db
+def test_compiled_form_is_reused(greeting_form, django_assert_num_queries):
+    compiled_form = get_compiled_form(greeting_form)
+    assert list(compiled_form.base_fields) == ['greeting', 'upload', greeting_form.submit_flag_name]
+    with django_assert_num_queries(0):
+        assert get_compiled_form(greeting_form) is compiled_form
+        form = DesignedForm(greeting_form)
+    assert [field.name for field in form.file_fields] == ['upload']
+    # Each form must get its own copies of the fields
+    assert form.fields['greeting'] is not compiled_form.base_fields['greeting']
+
+
+@pytest.mark.django_db
+def test_compiled_form_invalidation(greeting_form):
+    compiled_form = get_compiled_form(greeting_form)
+    FormDefinitionField.objects.create(
+        form_definition=greeting_form,
+        name='name',
+        field_class='django.forms.CharField',
+        position=-1,
+    )
+    assert get_compiled_form(greeting_form) is not compiled_form
+    fd = FormDefinition.objects.get(pk=greeting_form.pk)
+    assert list(DesignedForm(fd).fields)[:2] == ['name', 'greeting']
+    fd.formdefinitionfield_set.get(name='name').delete()
+    fd = FormDefinition.objects.get(pk=greeting_form.pk)
+    assert 'name' not in DesignedForm(fd).fields
+
+
+@pytest.mark.django_db
+def test_initial_data_from_query_string(greeting_form):
+    form = DesignedForm(greeting_form, initial_data=QueryDict('greeting=hello&other=1'))
+    assert form['greeting'].value() == 'hello'
+    assert DesignedForm(greeting_form)['greeting'].value() is None
+
+
+@pytest.mark.django_db
+def test_submit_flag_name(greeting_form, django_assert_num_queries):
+    fd = FormDefinition.objects.get(pk=greeting_form.pk)
+    get_compiled_form(fd)
+    with django_assert_num_queries(0):
+        assert fd.submit_flag_name == 'submit__%s' % fd.name
+    FormDefinitionField.objects.create(
+        form_definition=fd,
+        name=fd.submit_flag_name,
+        field_class='django.forms.CharField',
+    )
+    fd = FormDefinition.objects.get(pk=greeting_form.pk)
+    assert fd.submit_flag_name == 'submit__%s_' % fd.name
+    assert fd.submit_flag_name in DesignedForm(fd).fields
+
+
+# The shared cache generations are only bumped once the changes are committed
+@pytest.mark.django_db(transaction=True)
+def test_cached_form_definition_lookups(monkeypatch, rf, greeting_form, django_assert_num_queries):
+    monkeypatch.setattr(fd_settings, 'CACHE_BACKEND', 'default')
+    cache.clear()
+
+    def render(view, *args):
+        request = rf.get('/')
+        request.user = AnonymousUser()
+        return view(request, *args).content.decode('utf-8')
+
+    assert 'Greeting' in render(detail, greeting_form.name)
+    assert 'Greeting' in render(detail_by_hash, greeting_form.public_hash)
+    # a new process only has the shared cache to go by
+    monkeypatch.setattr(compiler, '_compiled_forms', compiler.LRUCache())
+    with django_assert_num_queries(0):
+        assert 'Greeting' in render(detail, greeting_form.name)
+        assert 'Greeting' in render(detail_by_hash, greeting_form.public_hash)
+
+    field = greeting_form.formdefinitionfield_set.get(name='greeting')
+    field.label = 'Salutation'
+    field.save()
+    assert 'Salutation' in render(detail, greeting_form.name)
+    assert 'Salutation' in render(detail_by_hash, greeting_form.public_hash)
+
+    old_name = greeting_form.name
+    greeting_form = FormDefinition.objects.get(pk=greeting_form.pk)
+    greeting_form.name = 'salutation'
+    greeting_form.require_hash = True
+    greeting_form.save()
+    for name in (old_name, greeting_form.name):
+        with pytest.raises(Http404):
+            render(detail, name)
+    assert 'Salutation' in render(detail_by_hash, greeting_form.public_hash)
+    greeting_form.delete()
+    with pytest.raises(Http404):
+        render(detail_by_hash, greeting_form.public_hash)
+
+
+@pytest.mark.skipif(not hasattr(transaction, 'on_commit'), reason='Django < 1.9 has no on_commit')
+@pytest.mark.django_db(transaction=True)
+def test_definitions_generation_is_bumped_on_commit(monkeypatch, greeting_form):
+    monkeypatch.setattr(fd_settings, 'CACHE_BACKEND', 'default')
+    cache.clear()
+    generation = get_cache_generation(DEFINITIONS_GENERATION_KEY)
+    with transaction.atomic():
+        greeting_form.save()
+        greeting_form.formdefinitionfield_set.get(name='greeting').save()
+        # other processes would still read the old definition, and cache it under a new generation
+        assert get_cache_generation(DEFINITIONS_GENERATION_KEY) == generation
+    assert get_cache_generation(DEFINITIONS_GENERATION_KEY) == generation + 2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_definitions_generation_is_bumped_again_without_on_commit(monkeypatch, greeting_form):
+    monkeypatch.setattr(fd_settings, 'CACHE_BACKEND', 'default')
+    if hasattr(transaction, 'on_commit'):
+        monkeypatch.delattr(transaction, 'on_commit')
+    cache.clear()
+    generation = get_cache_generation(DEFINITIONS_GENERATION_KEY)
+    with transaction.atomic():
+        greeting_form.save()
+        assert get_cache_generation(DEFINITIONS_GENERATION_KEY) == generation + 1
+    request_finished.send(sender=None)
+    assert get_cache_generation(DEFINITIONS_GENERATION_KEY) == generation + 2
+    request_finished.send(sender=None)
+    assert get_cache_generation(DEFINITIONS_GENERATION_KEY) == generation + 2
@@ -0,0 +1,61 @@
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+
+import pytest
+from form_designer import settings as fd_settings
+from form_designer.models import FormLog
+from form_designer.views import detail
+
+
+def create_logs(form_definition, n):
+    return [
+        FormLog.objects.create_with_data(form_definition, [{'name': 'greeting', 'value': 'hi %d' % i, 'label': None}])
+        for i in range(n)
+    ]
+
+
+def render_detail(rf, form_definition, query=None):
+    request = rf.get('/', query or {})
+    request.user = AnonymousUser()
+    request._messages = CookieStorage(request)
+    return detail(request, form_definition.name).content.decode('utf8')
+
+
+@pytest.mark.django_db
+def test_log_pages(greeting_form):
+    logs = create_logs(greeting_form, 5)
+    page = greeting_form.logs.get_page(size=2)
+    assert list(page) == logs[:2:-1]
+    assert page.next_cursor == logs[3].pk
+    page = greeting_form.logs.get_page(cursor=page.next_cursor, size=2)
+    assert list(page) == logs[2:0:-1]
+    assert list(greeting_form.logs.get_page(cursor=page.next_cursor, size=2)) == logs[:1]
+    assert greeting_form.logs.get_page(cursor=page.next_cursor, size=2).next_cursor is None
+    oldest_first = greeting_form.logs.get_page(size=3, newest_first=False)
+    assert list(oldest_first) == logs[:3]
+
+
+# The shared cache generations are only bumped once the changes are committed
+@pytest.mark.django_db(transaction=True)
+def test_display_logged_is_paginated_and_cached(monkeypatch, rf, greeting_form, django_assert_num_queries):
+    monkeypatch.setattr(fd_settings, 'CACHE_BACKEND', 'default')
+    monkeypatch.setattr(fd_settings, 'DISPLAY_LOGGED_PAGE_SIZE', 2)
+    cache.clear()
+    greeting_form.display_logged = True
+    greeting_form.save()
+    logs = create_logs(greeting_form, 3)
+
+    content = render_detail(rf, greeting_form)
+    assert 'hi 2' in content and 'hi 1' in content and 'hi 0' not in content
+    assert '?logs_cursor=%d' % logs[1].pk in content
+    content = render_detail(rf, greeting_form, {'logs_cursor': logs[1].pk})
+    assert 'hi 0' in content and 'hi 1' not in content
+
+    # The page and the form definition are read from the cache
+    with django_assert_num_queries(0):
+        assert 'hi 2' in render_detail(rf, greeting_form)
+    # ... until a new log is written
+    FormLog.objects.create_with_data(greeting_form, [{'name': 'greeting', 'value': 'hello', 'label': None}])
+    content = render_detail(rf, greeting_form)
+    assert 'hello' in content and 'hi 2' in content and 'hi 1' not in content
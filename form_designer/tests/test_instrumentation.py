@@ -0,0 +1,64 @@
+import logging
+
+from django.db import connection
+
+import pytest
+from form_designer import instrumentation
+
+
+class RecordingSink(object):
+
+    def __init__(self):
+        self.reports = []
+
+    def report(self, form_definition, stages, total):
+        self.reports.append((form_definition, stages, total))
+
+
+class FailingSink(object):
+
+    def report(self, form_definition, stages, total):
+        raise ValueError('oops')
+
+
+@pytest.mark.django_db
+def test_submission_stages_are_reported(monkeypatch, submit_form, greeting_form):
+    sink = RecordingSink()
+    monkeypatch.setattr(instrumentation, '_sinks', [FailingSink(), sink])
+    assert submit_form(greeting_form, greeting='hello')['form_success']
+    assert not submit_form(greeting_form)['form_success']
+    (form_definition, stages, total), (_, invalid_stages, _) = sink.reports
+    assert form_definition == greeting_form
+    assert [stage.name for stage in stages] == ['validate', 'files', 'log', 'mail']
+    assert [stage.name for stage in invalid_stages] == ['validate']
+    log_stage = stages[2]
+    assert log_stage.queries > 0
+    assert total >= sum(stage.seconds for stage in stages)
+
+
+@pytest.mark.django_db
+def test_slow_submission_sink(monkeypatch, submit_form, caplog, greeting_form):
+    monkeypatch.setattr(instrumentation, '_sinks', [
+        instrumentation.SlowSubmissionSink(threshold=0),
+        instrumentation.LoggingSink(),
+    ])
+    with caplog.at_level(logging.DEBUG, logger='form_designer'):
+        submit_form(greeting_form, greeting='hello')
+    messages = [
+        (record.name, record.levelno) for record in caplog.records
+        if record.getMessage().startswith('Form %s submitted in' % greeting_form.name)
+    ]
+    assert messages == [
+        ('form_designer.slow_submissions', logging.WARNING),
+        ('form_designer.instrumentation', logging.DEBUG),
+    ]
+    assert 'mail ' in caplog.records[-1].getMessage()
+
+
+def test_stages_neither_connect_nor_log_queries():
+    # Database access is blocked outside of `django_db` tests, so connecting would fail
+    timer = instrumentation.SubmissionTimer(None, sinks=[RecordingSink()])
+    with timer.stage('validate'):
+        assert not connection.queries_logged
+    assert timer.stages[0].queries == 0
+    assert 'make_cursor' not in connection.__dict__
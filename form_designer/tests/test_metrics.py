@@ -0,0 +1,111 @@
+import os
+import time
+
+from django.core.cache import cache
+from django.http import Http404
+
+import pytest
+from form_designer import metrics
+from form_designer import settings as fd_settings
+from form_designer.contrib.exporters.csv_exporter import CsvExporter
+from form_designer.models import FormLog
+from form_designer.views import metrics as metrics_view
+
+
+def test_render_counters_and_histograms():
+    collector = metrics.MetricsCollector(metrics.LocalMetricsStore(), buckets=(0.1, 1), flush_interval=60)
+    collector.inc('form_designer_submissions_total', form='contact')
+    collector.inc('form_designer_submissions_total', form='contact')
+    collector.inc('form_designer_upload_bytes_total', 1024, form='say "hi"\\')
+    collector.observe('form_designer_process_form_seconds', 0.05, form='contact')
+    collector.observe('form_designer_process_form_seconds', 0.5, form='contact')
+    collector.observe('form_designer_process_form_seconds', 5, form='contact')
+    lines = collector.render().splitlines()
+    assert '# TYPE form_designer_submissions_total counter' in lines
+    assert 'form_designer_submissions_total{form="contact"} 2' in lines
+    assert 'form_designer_upload_bytes_total{form="say \\"hi\\"\\\\"} 1024' in lines
+    assert '# TYPE form_designer_process_form_seconds histogram' in lines
+    start = lines.index('form_designer_process_form_seconds_bucket{form="contact",le="0.1"} 1')
+    assert lines[start:start + 5] == [
+        'form_designer_process_form_seconds_bucket{form="contact",le="0.1"} 1',
+        'form_designer_process_form_seconds_bucket{form="contact",le="1"} 2',
+        'form_designer_process_form_seconds_bucket{form="contact",le="+Inf"} 3',
+        'form_designer_process_form_seconds_sum{form="contact"} 5.55',
+        'form_designer_process_form_seconds_count{form="contact"} 3',
+    ]
+
+
+def test_file_store_adds_up_processes(tmpdir):
+    directory = str(tmpdir.join('metrics'))
+    workers = [
+        metrics.MetricsCollector(metrics.FileMetricsStore(directory), buckets=(1,), flush_interval=0)
+        for _ in range(2)
+    ]
+    workers[1].reset()  # tell the "processes" apart
+    for n, worker in enumerate(workers, 1):
+        worker.inc('form_designer_submissions_total', n, form='contact')
+        worker.observe('form_designer_export_seconds', n, exporter='CSV')
+    lines = workers[0].render().splitlines()
+    assert 'form_designer_submissions_total{form="contact"} 3' in lines
+    assert 'form_designer_export_seconds_bucket{exporter="CSV",le="1"} 1' in lines
+    assert 'form_designer_export_seconds_count{exporter="CSV"} 2' in lines
+    assert len(tmpdir.join('metrics').listdir()) == 2
+
+
+def test_cache_store_adds_up_processes(monkeypatch):
+    monkeypatch.setattr(fd_settings, 'CACHE_BACKEND', 'default')
+    cache.clear()
+    workers = [metrics.MetricsCollector(metrics.CacheMetricsStore(), flush_interval=60) for _ in range(2)]
+    workers[1].reset()
+    for worker in workers:
+        worker.inc('form_designer_mails_sent_total', form='contact')
+        worker.flush()
+    assert 'form_designer_mails_sent_total{form="contact"} 2' in workers[0].render().splitlines()
+
+
+def test_stores_drop_stale_processes(monkeypatch, tmpdir):
+    monkeypatch.setattr(fd_settings, 'CACHE_BACKEND', 'default')
+    cache.clear()
+    stores = [metrics.CacheMetricsStore(), metrics.FileMetricsStore(str(tmpdir))]
+    for store in stores:
+        store.save('gone', {'form_designer_submissions_total': [[[], 1]]})
+        store.save('alive', {'form_designer_submissions_total': [[[], 2]]})
+    # the snapshots of the first process expire
+    cache.delete(stores[0].key_prefix + 'gone')
+    old = time.time() - fd_settings.METRICS_MAX_AGE - 1
+    os.utime(str(tmpdir.join('gone.json')), (old, old))
+
+    for store in stores:
+        assert store.load() == [{'form_designer_submissions_total': [[[], 2]]}]
+    assert cache.get(stores[0].workers_key) == ['alive']
+    assert tmpdir.listdir() == [tmpdir.join('alive.json')]
+
+
+@pytest.mark.django_db
+def test_form_traffic_is_exposed(monkeypatch, rf, submit_form, greeting_form):
+    collector = metrics.MetricsCollector(metrics.LocalMetricsStore(), flush_interval=60)
+    monkeypatch.setattr(metrics, '_collector', collector)
+    assert submit_form(greeting_form, greeting='hello')['form_success']
+    assert not submit_form(greeting_form)['form_success']
+    CsvExporter(FormLog).export(None, FormLog.objects.all())
+
+    response = metrics_view(rf.get('/'))
+    assert response['Content-Type'] == metrics.CONTENT_TYPE
+    lines = response.content.decode('utf-8').splitlines()
+    labels = '{form="%s"}' % greeting_form.name
+    assert 'form_designer_submissions_total%s 2' % labels in lines
+    assert 'form_designer_validation_errors_total%s 1' % labels in lines
+    assert 'form_designer_mails_sent_total%s 1' % labels in lines
+    assert 'form_designer_process_form_seconds_count%s 2' % labels in lines
+    assert 'form_designer_export_seconds_count{exporter="CSV"} 1' in lines
+
+
+def test_metrics_view_access(monkeypatch, rf):
+    monkeypatch.setattr(metrics, '_collector', None)
+    monkeypatch.setattr(fd_settings, 'METRICS_STORE', None)
+    with pytest.raises(Http404):
+        metrics_view(rf.get('/'))
+    monkeypatch.setattr(metrics, '_collector', metrics.MetricsCollector(metrics.LocalMetricsStore()))
+    monkeypatch.setattr(fd_settings, 'METRICS_TOKEN', 's3cret')
+    assert metrics_view(rf.get('/')).status_code == 403
+    assert metrics_view(rf.get('/', HTTP_AUTHORIZATION='Bearer s3cret')).status_code == 200
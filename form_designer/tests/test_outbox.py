@@ -0,0 +1,62 @@
+from django.contrib.auth.models import AnonymousUser
+from django.core import mail
+from django.core.management import call_command
+from django.utils import timezone
+
+import pytest
+from form_designer import settings as fd_settings
+from form_designer.email import send_queued_mail
+from form_designer.models import OutboxMail
+from form_designer.views import process_form
+
+
+@pytest.mark.django_db
+def test_mail_is_queued_and_sent_by_command(monkeypatch, rf, greeting_form):
+    monkeypatch.setattr(fd_settings, 'MAIL_OUTBOX', True)
+    request = rf.post('/', {'greeting': 'hello', greeting_form.submit_flag_name: 'true'})
+    request.user = AnonymousUser()
+    context = process_form(request, greeting_form, push_messages=False, disable_redirection=True)
+    assert context['form_success']
+    assert not mail.outbox
+    queued_mail = OutboxMail.objects.get()
+    assert queued_mail.form_definition == greeting_form
+    assert 'hello' in queued_mail.message.subject
+
+    call_command('form_designer_send_mail', verbosity=0)
+    assert [message.subject for message in mail.outbox] == [queued_mail.message.subject]
+    queued_mail = OutboxMail.objects.get()
+    assert queued_mail.status == OutboxMail.STATUS_SENT
+    assert queued_mail.attempts == 1
+    # Nothing left to send
+    assert send_queued_mail() == (0, 0)
+
+
+@pytest.mark.django_db
+def test_failed_mail_is_retried_with_backoff(monkeypatch, greeting_form):
+    from django.core.mail.backends.locmem import EmailBackend
+    send_messages = EmailBackend.send_messages
+    smtp_down = [True]
+
+    def flaky_send_messages(self, messages):
+        if smtp_down[0]:
+            raise IOError('Connection refused')
+        return send_messages(self, messages)
+
+    monkeypatch.setattr(EmailBackend, 'send_messages', flaky_send_messages)
+    monkeypatch.setattr(fd_settings, 'MAIL_OUTBOX_MAX_ATTEMPTS', 2)
+    for n in range(3):
+        OutboxMail.objects.create(form_definition=greeting_form, message=mail.EmailMessage('mail %d' % n))
+    assert send_queued_mail(batch_size=2) == (0, 3)
+    queued_mail = OutboxMail.objects.first()
+    assert queued_mail.status == OutboxMail.STATUS_QUEUED
+    assert queued_mail.last_error == 'Connection refused'
+    assert queued_mail.next_attempt_at > timezone.now()
+    # The mails are not due again before their retry delay has passed
+    assert send_queued_mail() == (0, 0)
+
+    OutboxMail.objects.update(next_attempt_at=timezone.now())
+    assert send_queued_mail(limit=1) == (0, 1)
+    assert OutboxMail.objects.filter(status=OutboxMail.STATUS_FAILED).count() == 1
+    smtp_down[0] = False
+    assert send_queued_mail() == (2, 0)
+    assert len(mail.outbox) == 2
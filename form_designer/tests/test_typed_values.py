@@ -0,0 +1,137 @@
+# -- encoding: UTF-8 --
+from __future__ import unicode_literals
+
+import datetime
+import json
+from decimal import Decimal
+from importlib import import_module
+
+from django.apps import apps
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.encoding import force_text
+
+import pytest
+from form_designer.models import FormLog, FormValue
+from form_designer.typed_values import VALUE_TYPE_LEGACY, VALUE_TYPE_PICKLE, ModelChoiceValue
+from form_designer.uploads import StoredUploadedFile
+
+VALUES = [
+    None,
+    'hëllo',
+    '',
+    42,
+    -10 ** 30,
+    Decimal('3.50'),
+    0.1,
+    True,
+    False,
+    datetime.date(2016, 2, 29),
+    datetime.datetime(2016, 2, 29, 12, 30, 15, 5, tzinfo=timezone.utc),
+    datetime.time(8, 15),
+    ['red', 'blue'],
+    {'a': [1, 2]},
+    ('not', 'json'),
+]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('value', VALUES)
+def test_value_round_trip(greeting_form, value):
+    form_log = FormLog.objects.create(form_definition=greeting_form)
+    FormValue.objects.create(form_log=form_log, field_name='greeting', value=value)
+    stored_value = FormValue.objects.get().value
+    assert stored_value == value
+    assert type(stored_value) is type(value)
+
+
+@pytest.mark.django_db
+def test_file_value(greeting_form):
+    form_log = FormLog.objects.create(form_definition=greeting_form)
+    FormValue.objects.create(form_log=form_log, field_name='upload', value=StoredUploadedFile('form_uploads/x.jpg'))
+    form_value = FormValue.objects.get()
+    assert form_value.value_text == 'form_uploads/x.jpg'
+    assert isinstance(form_value.value, StoredUploadedFile)
+
+
+@pytest.mark.django_db
+def test_filter_value(greeting_form):
+    for n in range(5):
+        FormLog.objects.create_with_data(greeting_form, [
+            {'name': 'greeting', 'value': 'hi %d' % n, 'label': None},
+            {'name': 'count', 'value': n, 'label': None},
+            {'name': 'day', 'value': datetime.date(2016, 1, n + 1), 'label': None},
+            {'name': 'upload', 'value': None, 'label': None},
+        ])
+    assert FormLog.objects.filter_value('count', 3, 'gte').count() == 2
+    assert FormLog.objects.filter_value('count', Decimal('1.5'), 'lt').count() == 2
+    assert FormLog.objects.filter_value('greeting', 'hi 4').get().values.get(field_name='count').value == 4
+    assert FormLog.objects.filter_value('day', datetime.date(2016, 1, 2), 'lte').count() == 2
+    assert FormLog.objects.filter_value('upload', None).count() == 5
+    assert not FormLog.objects.filter_value('greeting', None).exists()
+
+
+@pytest.mark.django_db
+def test_legacy_values_are_encoded(greeting_form):
+    form_log = FormLog.objects.create(form_definition=greeting_form)
+    for name, value in (('greeting', 'hello'), ('count', 7), ('colors', ['red'])):
+        FormValue.objects.create(form_log=form_log, field_name=name, value_type=VALUE_TYPE_LEGACY, value_pickled=value)
+    # Legacy values can be read before they have been converted
+    assert FormValue.objects.get(field_name='count').value == 7
+
+    for n in range(5):
+        FormValue.objects.create(form_log=form_log, field_name='extra_%d' % n, value_type=VALUE_TYPE_LEGACY,
+                                 value_pickled=(True if n % 2 else 1))
+
+    migration = import_module('form_designer.migrations.0007_encode_form_values')
+    with CaptureQueriesContext(connection) as queries:
+        migration.encode_values(apps, connection.schema_editor())
+    # rows that get the same columns are updated together
+    assert len([query for query in queries.captured_queries if query['sql'].startswith('UPDATE')]) == 5
+    assert dict(FormValue.objects.values_list('field_name', 'value_type')) == {
+        'greeting': 'text', 'count': 'int', 'colors': 'json',
+        'extra_0': 'int', 'extra_1': 'bool', 'extra_2': 'int', 'extra_3': 'bool', 'extra_4': 'int',
+    }
+    assert not FormValue.objects.filter(value_pickled__isnull=False).exists()
+    assert FormValue.objects.get(field_name='count').value_number == 7
+    assert [item['value'] for item in form_log.data[2:5]] == [7, ['red'], 1]
+
+
+@pytest.mark.django_db
+def test_values_of_later_types_are_decoded_as_text(greeting_form, admin_user):
+    form_log = FormLog.objects.create_with_data(greeting_form, [
+        {'name': 'user', 'value': admin_user, 'label': 'User'},
+        {'name': 'count', 'value': 7, 'label': 'Count'},
+    ])
+    migration = import_module('form_designer.migrations.0007_encode_form_values')
+    migration.decode_values(apps, connection.schema_editor())
+    values = dict((value.field_name, value) for value in form_log.values.all())
+    assert values['user'].value_type == values['count'].value_type == VALUE_TYPE_LEGACY
+    assert json.loads(values['user'].value_pickled) == ModelChoiceValue.from_instance(admin_user).as_dict()
+    assert values['count'].value_pickled == 7
+
+
+@pytest.mark.django_db
+def test_model_choices_are_snapshotted(greeting_form, admin_user, django_assert_num_queries):
+    from django.contrib.auth.models import User
+    FormLog.objects.create_with_data(greeting_form, [
+        {'name': 'user', 'value': admin_user, 'label': None},
+        {'name': 'users', 'value': User.objects.all(), 'label': None},
+    ])
+    with django_assert_num_queries(3):  # no queries for the users
+        data = {item['name']: item['value'] for item in FormLog.objects.with_data().get().data}
+        assert data['user'] == ModelChoiceValue('auth.user', admin_user.pk, 'admin')
+        assert [force_text(user) for user in data['users']] == ['admin']
+    assert data['user'].get_object() == admin_user
+
+
+@pytest.mark.django_db
+def test_snapshot_model_choices_command(greeting_form, admin_user):
+    form_log = FormLog.objects.create(form_definition=greeting_form)
+    for name, value in (('user', admin_user), ('other', ('a', 'b'))):
+        FormValue.objects.create(form_log=form_log, field_name=name, value_type=VALUE_TYPE_PICKLE, value_pickled=value)
+    call_command('form_designer_snapshot_model_choices', verbosity=0)
+    assert dict(FormValue.objects.values_list('field_name', 'value_type')) == {'user': 'model', 'other': 'pickle'}
+    assert FormValue.objects.get(field_name='user').value.label == 'admin'
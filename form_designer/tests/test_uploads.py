@@ -0,0 +1,251 @@
+import hashlib
+import os
+import threading
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core import mail
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.forms.forms import NON_FIELD_ERRORS
+from django.http import Http404
+from django.utils.crypto import salted_hmac
+
+import pytest
+from form_designer import settings as fd_settings
+from form_designer import uploads
+from form_designer.forms import DesignedForm
+from form_designer.models import FormDefinition, FormDefinitionField, FormLog, check_mail_attachment_max_size
+from form_designer.tests.test_basics import VERY_SMALL_JPEG
+from form_designer.uploads import (
+    CONTENT_HASH_SALT, StoredUploadedFile, UploadStorageError, add_upload_handler, get_storage, handle_uploaded_files
+)
+from form_designer.views import detail, download
+
+
+class SlowStorage(FileSystemStorage):
+    """
+    A local storage with the latency of a remote one.
+    """
+    threads = set()
+
+    def _save(self, name, content):
+        time.sleep(0.1)
+        self.threads.add(threading.current_thread().ident)
+        return super(SlowStorage, self)._save(name, content)
+
+
+class PartlyBrokenStorage(FileSystemStorage):
+
+    def _save(self, name, content):
+        if 'broken' in name:
+            raise IOError('No space left on device')
+        return super(PartlyBrokenStorage, self)._save(name, content)
+
+
+@pytest.fixture()
+def attachment_form(greeting_form):
+    for n in range(2, 5):
+        FormDefinitionField.objects.create(
+            form_definition=greeting_form,
+            name='upload_%d' % n,
+            field_class='django.forms.FileField',
+            required=False,
+        )
+    return FormDefinition.objects.get(pk=greeting_form.pk)
+
+
+def get_valid_form(form_definition, file_names):
+    field_names = ['upload', 'upload_2', 'upload_3', 'upload_4']
+    files = dict(
+        (field_name, SimpleUploadedFile(file_name, file_name.encode('utf-8')))
+        for field_name, file_name in zip(field_names, file_names)
+    )
+    form = DesignedForm(form_definition, None, {'greeting': 'hi'}, files)
+    assert form.is_valid(), form.errors
+    return form
+
+
+def get_stored_files(root):
+    return sorted(
+        os.path.relpath(os.path.join(path, filename), root)
+        for path, dirnames, filenames in os.walk(root)
+        for filename in filenames
+    )
+
+
+@pytest.mark.django_db
+def test_content_addressed_uploads_are_stored_once(monkeypatch, settings, tmpdir, submit_form, greeting_form):
+    settings.MEDIA_ROOT = str(tmpdir)
+    monkeypatch.setattr(fd_settings, 'CONTENT_ADDRESSED_UPLOADS', True)
+    uploads = [
+        ContentFile(VERY_SMALL_JPEG, name='hello.jpg'),
+        ContentFile(VERY_SMALL_JPEG, name='HELLO AGAIN.JPG'),
+        ContentFile(VERY_SMALL_JPEG + b'\0', name='other.jpg'),
+    ]
+    stored = []
+    for upload in uploads:
+        form_log = submit_form(greeting_form, greeting='hi', upload=upload)['form_log']
+        value = dict((item['name'], item['value']) for item in form_log.data)['upload']
+        assert isinstance(value, StoredUploadedFile)
+        stored.append(value.name)
+
+    content_hash = salted_hmac(CONTENT_HASH_SALT, VERY_SMALL_JPEG).hexdigest()
+    assert hashlib.sha256(VERY_SMALL_JPEG).hexdigest() not in stored[0]
+    assert stored[0] == stored[1] == os.path.join(
+        'form_uploads', 'blobs', content_hash[:2], content_hash[2:4], content_hash + '.jpg'
+    )
+    assert stored[2] != stored[0]
+    assert get_stored_files(str(tmpdir)) == sorted(set(stored))
+    with open(os.path.join(str(tmpdir), stored[0]), 'rb') as infile:
+        assert infile.read() == VERY_SMALL_JPEG
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('file_name, limits, error_key, error', [
+    ('hello.jpg', {}, None, None),
+    ('hello.exe', {}, 'upload', 'This file type is not allowed.'),
+    ('hello.jpg', {'max_upload_size': 100}, 'upload', 'Please keep file size under 100'),
+    ('hello.jpg', {'max_upload_total_size': 100}, NON_FIELD_ERRORS, 'Please keep total file size under 100'),
+])
+def test_upload_limits_are_enforced_while_receiving(rf, greeting_form, file_name, limits, error_key, error):
+    for name, value in limits.items():
+        setattr(greeting_form, name, value)
+    greeting_form.save()
+    request = rf.post('/', {
+        'greeting': 'hi',
+        'upload': ContentFile(VERY_SMALL_JPEG, name=file_name),
+        greeting_form.submit_flag_name: 'true',
+    })
+    request.user = AnonymousUser()
+    request._messages = CookieStorage(request)
+    request._dont_enforce_csrf_checks = True
+    response = detail(request, greeting_form.name)
+    if error is None:
+        assert response.status_code == 302
+        assert request.upload_errors == {}
+        assert request.FILES['upload'].size == len(VERY_SMALL_JPEG)
+        assert FormLog.objects.filter(form_definition=greeting_form).exists()
+    else:
+        assert response.status_code == 200
+        # the file was dropped while it was received
+        assert 'upload' not in request.FILES
+        assert list(request.upload_errors) == [error_key]
+        assert error in response.content.decode('utf-8')
+        assert not FormLog.objects.exists()
+
+
+@pytest.mark.django_db
+def test_skipped_files_leave_earlier_uploads_open(rf, attachment_form):
+    request = rf.post('/', {
+        'greeting': 'hi',
+        'upload': ContentFile(VERY_SMALL_JPEG, name='hello.jpg'),
+        'upload_2': ContentFile(b'MZ', name='hello.exe'),
+        attachment_form.submit_flag_name: 'true',
+    })
+    add_upload_handler(request, attachment_form)
+    assert list(request.FILES) == ['upload']
+    assert request.FILES['upload'].read() == VERY_SMALL_JPEG
+    assert list(request.upload_errors) == ['upload_2']
+
+
+@pytest.mark.django_db
+def test_files_are_stored_in_parallel(monkeypatch, settings, tmpdir, attachment_form):
+    settings.MEDIA_ROOT = str(tmpdir)
+    monkeypatch.setattr(fd_settings, 'FILE_STORAGE_CLASS', SlowStorage)
+    SlowStorage.threads.clear()
+    file_names = ['a.txt', 'b.txt', 'c.txt', 'a.txt']
+    form = get_valid_form(attachment_form, file_names)
+    stored_files = handle_uploaded_files(attachment_form, form)
+    assert len(set(stored_file.name for stored_file in stored_files)) == 4
+    for stored_file, file_name in zip(stored_files, file_names):
+        with get_storage().open(stored_file.name) as infile:
+            assert infile.read() == file_name.encode('utf-8')
+    assert form.cleaned_data['upload_4'] is stored_files[3]
+    if uploads.get_executor() is not None:
+        assert len(SlowStorage.threads) > 1
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('workers', (1, 4))
+def test_storage_errors_are_aggregated(monkeypatch, settings, tmpdir, attachment_form, workers):
+    settings.MEDIA_ROOT = str(tmpdir)
+    monkeypatch.setattr(fd_settings, 'FILE_STORAGE_CLASS', PartlyBrokenStorage)
+    monkeypatch.setattr(fd_settings, 'UPLOAD_WORKERS', workers)
+    monkeypatch.setattr(uploads, '_executor', None)
+    form = get_valid_form(attachment_form, ['broken.txt', 'ok.txt', 'broken.txt', 'ok.txt'])
+    with pytest.raises(UploadStorageError) as excinfo:
+        handle_uploaded_files(attachment_form, form)
+    assert [field_name for field_name, error in excinfo.value.errors] == ['upload', 'upload_3']
+    assert 'No space left on device' in str(excinfo.value)
+    # the other files were stored all the same
+    assert len(get_stored_files(str(tmpdir))) == 2
+
+
+def test_storage_is_reused(settings, tmpdir):
+    storage = get_storage()
+    assert get_storage() is storage
+    assert StoredUploadedFile('x.txt').storage is storage
+    settings.MEDIA_ROOT = str(tmpdir)
+    assert get_storage() is not storage
+    assert get_storage().location == str(tmpdir)
+
+
+@pytest.mark.django_db
+def test_large_files_are_linked_instead_of_attached(monkeypatch, settings, tmpdir, rf, submit_form, attachment_form):
+    settings.MEDIA_ROOT = str(tmpdir)
+    monkeypatch.setattr(fd_settings, 'SITE_URL', 'https://forms.example.com')
+    attachment_form.mail_attachment_max_size = 100
+    attachment_form.save()
+    large_content = b'x' * 101
+    submit_form(
+        attachment_form, greeting='hi',
+        upload=SimpleUploadedFile('small.txt', b'small'),
+        upload_2=SimpleUploadedFile('large.txt', large_content),
+    )
+    message = mail.outbox[-1]
+    assert [(name, content) for name, content, mimetype in message.attachments] == [
+        (os.path.basename(form_value.value.name), 'small')
+        for form_value in FormLog.objects.get().values.filter(field_name='upload')
+    ]
+    url = message.body.splitlines()[-1].split(': ', 1)[1]
+    assert url.startswith('https://forms.example.com/forms/files/')
+    url = url[len(fd_settings.SITE_URL):]
+    token = url.split('/')[-2]
+    response = download(rf.get(url), token=token)
+    assert response['Content-Disposition'].startswith('attachment; filename="large_')
+    assert b''.join(response.streaming_content) == large_content
+
+    with pytest.raises(Http404):
+        download(rf.get(url), token=token[:-1])
+    monkeypatch.setattr(fd_settings, 'DOWNLOAD_LINK_MAX_AGE', -1)
+    with pytest.raises(Http404):
+        download(rf.get(url), token=token)
+
+
+@pytest.mark.django_db
+def test_file_links_in_html_mails(monkeypatch, settings, tmpdir, submit_form, attachment_form):
+    settings.MEDIA_ROOT = str(tmpdir)
+    attachment_form.mail_attachment_max_size = 1
+    attachment_form.message_template = '<html><body><p>{{ greeting }}</p></body></html>'
+    attachment_form.save()
+    # relative links would not work in mails, so files are attached without a site URL
+    assert [error.id for error in check_mail_attachment_max_size(None)] == []
+    monkeypatch.setattr(fd_settings, 'MAIL_ATTACHMENT_MAX_SIZE', 1)
+    assert [error.id for error in check_mail_attachment_max_size(None)] == ['form_designer.E001']
+    with pytest.raises(ValidationError) as excinfo:
+        attachment_form.clean()
+    assert list(excinfo.value.message_dict) == ['mail_attachment_max_size']
+    submit_form(attachment_form, greeting='hi', upload=SimpleUploadedFile('large.txt', b'large'))
+    assert [content for name, content, mimetype in mail.outbox[-1].attachments] == ['large']
+    assert 'href=' not in mail.outbox[-1].body
+    monkeypatch.setattr(fd_settings, 'SITE_URL', 'https://forms.example.com')
+    attachment_form.clean()
+    submit_form(attachment_form, greeting='hi', upload=SimpleUploadedFile('large.txt', b'large'))
+    body = mail.outbox[-1].body
+    assert body.startswith('<html><body><p>hi</p>\n<p>')
+    assert body.endswith('</ul>\n</body></html>')
+    assert 'href="https://forms.example.com/forms/files/' in body
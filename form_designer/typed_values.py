@@ -0,0 +1,276 @@
+"""
+Typed storage of submitted form values.
+
+Each `FormValue` stores its value's type and a text representation that the value can be restored
+from exactly. Depending on the type, the value is also stored in a typed column (`value_number`,
+`value_date`, `value_datetime` or `value_bool`), so the database can filter, sort and aggregate on
+submitted values. Model instances chosen in model choice fields are stored as snapshots of their
+primary key and label (see `ModelChoiceValue`). Any other values that can't be stored as text are
+pickled.
+"""
+from __future__ import unicode_literals
+
+import datetime
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.apps import apps
+from django.conf import settings as django_settings
+from django.db import models
+from django.db.models.query import QuerySet
+from django.utils import six, timezone
+from django.utils.dateparse import parse_date, parse_datetime, parse_time
+from django.utils.encoding import force_text, python_2_unicode_compatible
+from django.utils.functional import Promise
+from django.utils.translation import ugettext_lazy as _
+
+from form_designer.uploads import StoredUploadedFile
+
+VALUE_TYPE_LEGACY = ''  # pickled by an older version, not converted yet
+VALUE_TYPE_NONE = 'none'
+VALUE_TYPE_TEXT = 'text'
+VALUE_TYPE_INT = 'int'
+VALUE_TYPE_DECIMAL = 'decimal'
+VALUE_TYPE_FLOAT = 'float'
+VALUE_TYPE_BOOL = 'bool'
+VALUE_TYPE_DATE = 'date'
+VALUE_TYPE_DATETIME = 'datetime'
+VALUE_TYPE_TIME = 'time'
+VALUE_TYPE_FILE = 'file'
+VALUE_TYPE_JSON = 'json'
+VALUE_TYPE_MODEL = 'model'
+VALUE_TYPE_MODELS = 'models'
+VALUE_TYPE_PICKLE = 'pickle'
+
+VALUE_TYPE_CHOICES = (
+    (VALUE_TYPE_NONE, _('empty')),
+    (VALUE_TYPE_TEXT, _('text')),
+    (VALUE_TYPE_INT, _('integer')),
+    (VALUE_TYPE_DECIMAL, _('decimal number')),
+    (VALUE_TYPE_FLOAT, _('floating point number')),
+    (VALUE_TYPE_BOOL, _('yes/no')),
+    (VALUE_TYPE_DATE, _('date')),
+    (VALUE_TYPE_DATETIME, _('date & time')),
+    (VALUE_TYPE_TIME, _('time')),
+    (VALUE_TYPE_FILE, _('file')),
+    (VALUE_TYPE_JSON, _('list or mapping')),
+    (VALUE_TYPE_MODEL, _('model choice')),
+    (VALUE_TYPE_MODELS, _('model choices')),
+    (VALUE_TYPE_PICKLE, _('other')),
+)
+
+# Numbers outside of the range of `FormValue.value_number` are only stored as text
+NUMBER_MAX_DIGITS = 28
+NUMBER_DECIMAL_PLACES = 10
+NUMBER_QUANTUM = Decimal(1).scaleb(-NUMBER_DECIMAL_PLACES)
+NUMBER_LIMIT = Decimal(10) ** (NUMBER_MAX_DIGITS - NUMBER_DECIMAL_PLACES)
+
+VALUE_COLUMNS = (
+    'value_type', 'value_text', 'value_number', 'value_date', 'value_datetime', 'value_bool', 'value_pickled'
+)
+
+
+@python_2_unicode_compatible
+class ModelChoiceValue(object):
+    """
+    A snapshot of a model instance chosen in a model choice field, taken when the form was submitted.
+
+    It renders as the instance's label, so reading logged values never queries the chosen model's table.
+    """
+
+    def __init__(self, model, pk, label):
+        self.model = model
+        self.pk = pk
+        self.label = label
+
+    @classmethod
+    def from_instance(cls, instance):
+        opts = instance._meta
+        pk = instance.pk
+        if not isinstance(pk, six.integer_types + (six.text_type,)):
+            pk = force_text(pk)
+        return cls('%s.%s' % (opts.app_label, opts.model_name), pk, force_text(instance))
+
+    def as_dict(self):
+        return {'model': self.model, 'pk': self.pk, 'label': self.label}
+
+    def get_object(self):
+        """
+        Get the chosen model instance, if it still exists.
+        """
+        return apps.get_model(self.model)._default_manager.filter(pk=self.pk).first()
+
+    def __eq__(self, other):
+        return isinstance(other, ModelChoiceValue) and self.as_dict() == other.as_dict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.model, self.pk))
+
+    def __str__(self):
+        return self.label
+
+    def __repr__(self):
+        return '<ModelChoiceValue %s %r: %r>' % (self.model, self.pk, self.label)
+
+
+def _to_model_choice(value):
+    if isinstance(value, ModelChoiceValue):
+        return value
+    return ModelChoiceValue.from_instance(value)
+
+
+def _from_model_choice_json(text):
+    data = json.loads(text)
+    if isinstance(data, list):
+        return [ModelChoiceValue(**item) for item in data]
+    return ModelChoiceValue(**data)
+
+
+def _is_model_choice(value):
+    return isinstance(value, (models.Model, ModelChoiceValue))
+
+
+TEXT_DECODERS = {
+    VALUE_TYPE_TEXT: six.text_type,
+    VALUE_TYPE_INT: int,
+    VALUE_TYPE_DECIMAL: Decimal,
+    VALUE_TYPE_FLOAT: float,
+    VALUE_TYPE_BOOL: lambda text: (text == 'True'),
+    VALUE_TYPE_DATE: parse_date,
+    VALUE_TYPE_DATETIME: parse_datetime,
+    VALUE_TYPE_TIME: parse_time,
+    VALUE_TYPE_JSON: json.loads,
+    VALUE_TYPE_MODEL: _from_model_choice_json,
+    VALUE_TYPE_MODELS: _from_model_choice_json,
+}
+
+
+# Types of values that are stored by their class, in the order they are checked in
+# (`bool` is a subclass of `int`, and `datetime` one of `date`)
+INSTANCE_VALUE_TYPES = (
+    ((six.text_type, six.binary_type, Promise), VALUE_TYPE_TEXT),
+    (bool, VALUE_TYPE_BOOL),
+    (six.integer_types, VALUE_TYPE_INT),
+    (Decimal, VALUE_TYPE_DECIMAL),
+    (float, VALUE_TYPE_FLOAT),
+    (datetime.datetime, VALUE_TYPE_DATETIME),
+    (datetime.date, VALUE_TYPE_DATE),
+    (datetime.time, VALUE_TYPE_TIME),
+    (StoredUploadedFile, VALUE_TYPE_FILE),
+)
+
+
+def get_value_type(value):
+    """
+    Get the type a value is stored as.
+    """
+    if value is None:
+        return VALUE_TYPE_NONE
+    for types, value_type in INSTANCE_VALUE_TYPES:
+        if isinstance(value, types):
+            return value_type
+    if _is_model_choice(value):
+        return VALUE_TYPE_MODEL
+    if isinstance(value, QuerySet) or (isinstance(value, list) and value and all(map(_is_model_choice, value))):
+        return VALUE_TYPE_MODELS
+    if isinstance(value, (list, dict)) and _to_json(value) is not None:
+        return VALUE_TYPE_JSON
+    return VALUE_TYPE_PICKLE
+
+
+def _to_json(value):
+    try:
+        text = json.dumps(value, sort_keys=True)
+    except (TypeError, ValueError):
+        return None
+    # Only use JSON if the value survives the round trip (e.g. no tuples or non-string keys)
+    if json.loads(text) != value:
+        return None
+    return text
+
+
+def _to_number(value):
+    try:
+        number = Decimal(repr(value) if isinstance(value, float) else value)
+    except InvalidOperation:
+        return None
+    if not number.is_finite() or abs(number) >= NUMBER_LIMIT:
+        return None
+    return number.quantize(NUMBER_QUANTUM)
+
+
+def _to_db_datetime(value):
+    if django_settings.USE_TZ and timezone.is_naive(value):
+        return timezone.make_aware(value, timezone.get_default_timezone())
+    if not django_settings.USE_TZ and timezone.is_aware(value):
+        return timezone.make_naive(value, timezone.get_default_timezone())
+    return value
+
+
+def _get_value_text(value_type, value):
+    if value_type in (VALUE_TYPE_NONE, VALUE_TYPE_PICKLE):
+        return None
+    if value_type == VALUE_TYPE_JSON:
+        return _to_json(value)
+    if value_type == VALUE_TYPE_FILE:
+        return value.name
+    if value_type == VALUE_TYPE_MODEL:
+        return json.dumps(_to_model_choice(value).as_dict(), sort_keys=True)
+    if value_type == VALUE_TYPE_MODELS:
+        return json.dumps([_to_model_choice(item).as_dict() for item in value], sort_keys=True)
+    if value_type == VALUE_TYPE_FLOAT:
+        return repr(value)
+    if value_type in (VALUE_TYPE_DATE, VALUE_TYPE_DATETIME, VALUE_TYPE_TIME):
+        return value.isoformat()
+    return force_text(value)
+
+
+def encode_value(value):
+    """
+    Get the values of the `FormValue` columns (see `VALUE_COLUMNS`) to store `value` in.
+
+    :rtype: dict
+    """
+    value_type = get_value_type(value)
+    columns = dict.fromkeys(VALUE_COLUMNS)
+    columns['value_type'] = value_type
+    columns['value_text'] = _get_value_text(value_type, value)
+    if value_type == VALUE_TYPE_PICKLE:
+        columns['value_pickled'] = value
+    elif value_type in (VALUE_TYPE_INT, VALUE_TYPE_DECIMAL, VALUE_TYPE_FLOAT):
+        columns['value_number'] = _to_number(value)
+    elif value_type == VALUE_TYPE_BOOL:
+        columns['value_bool'] = value
+    elif value_type == VALUE_TYPE_DATE:
+        columns['value_date'] = value
+    elif value_type == VALUE_TYPE_DATETIME:
+        columns['value_datetime'] = _to_db_datetime(value)
+    return columns
+
+
+def decode_value(value_type, value_text, value_pickled):
+    """
+    Restore a value from the columns it was stored in.
+    """
+    if value_type in (VALUE_TYPE_PICKLE, VALUE_TYPE_LEGACY):
+        return value_pickled
+    if value_type == VALUE_TYPE_NONE or value_text is None:
+        return None
+    if value_type == VALUE_TYPE_FILE:
+        return StoredUploadedFile(value_text)
+    return TEXT_DECODERS[value_type](value_text)
+
+
+def get_value_column(value):
+    """
+    Get the name of the column to compare with `value` when filtering on stored values.
+    """
+    value_type = get_value_type(value)
+    if value_type in (VALUE_TYPE_INT, VALUE_TYPE_DECIMAL, VALUE_TYPE_FLOAT):
+        return 'value_number'
+    if value_type in (VALUE_TYPE_BOOL, VALUE_TYPE_DATE, VALUE_TYPE_DATETIME):
+        return 'value_%s' % value_type
+    return 'value_text'
@@ -1,79 +1,331 @@
 from __future__ import unicode_literals
 
-import hashlib
+import mimetypes
 import os
+import threading
 import uuid
 
+from django.core import signing
 from django.core.files.base import File
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.core.urlresolvers import reverse
 from django.db.models.fields.files import FieldFile
+from django.dispatch import receiver
 from django.forms.forms import NON_FIELD_ERRORS
 from django.template.defaultfilters import filesizeformat
-from django.utils.encoding import python_2_unicode_compatible
+from django.utils.crypto import salted_hmac
+from django.utils.encoding import force_text, python_2_unicode_compatible
 from django.utils.translation import ugettext_lazy as _
 
+from form_designer import metrics as app_metrics
 from form_designer import settings as app_settings
+from form_designer.compiler import get_compiled_form
 from form_designer.utils import get_random_hash
 
+try:
+    from django.core.signals import setting_changed
+except ImportError:  # Django 1.7
+    from django.test.signals import setting_changed
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:  # Python 2 without the `futures` backport
+    ThreadPoolExecutor = None
+
+DOWNLOAD_SALT = 'form_designer.download'
+CONTENT_HASH_SALT = 'form_designer.uploads.content'
+
+STORAGE_SETTINGS = ('MEDIA_ROOT', 'MEDIA_URL', 'FILE_UPLOAD_PERMISSIONS', 'FILE_UPLOAD_DIRECTORY_PERMISSIONS')
+
+_storage = None
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class UploadStorageError(Exception):
+    """
+    Raised when some of the files of a submission could not be stored, after all of them were tried.
+
+    :ivar errors: List of (field name, exception) tuples
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        super(UploadStorageError, self).__init__('Could not store %s' % ', '.join(
+            '%s (%s)' % (field_name, force_text(error)) for field_name, error in errors
+        ))
+
 
 def get_storage():
-    return app_settings.FILE_STORAGE_CLASS()
+    """
+    Get the storage of uploaded files, which is created once per process.
+    """
+    global _storage
+    storage_class = app_settings.FILE_STORAGE_CLASS
+    if _storage is None or _storage.__class__ is not storage_class:
+        _storage = storage_class()
+    return _storage
+
+
+@receiver(setting_changed)
+def forget_storage(sender, setting, **kwargs):
+    global _storage
+    if setting in STORAGE_SETTINGS:
+        _storage = None
+
+
+def get_executor():
+    """
+    Get the thread pool that stores the files of submissions, or None if files are stored one by one.
+    """
+    global _executor
+    if _executor is None and ThreadPoolExecutor is not None and app_settings.UPLOAD_WORKERS > 1:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=app_settings.UPLOAD_WORKERS)
+    return _executor
+
+
+def call_for_each(func, items):
+    """
+    Call `func` for each of the (key, item) pairs in `items`, in the upload thread pool if there is
+    more than one, and return the results in order.
+
+    :raises UploadStorageError: if any of the calls failed, once all of them have finished
+    """
+    executor = (get_executor() if len(items) > 1 else None)
+    if executor is None:
+        outcomes = []
+        for key, item in items:
+            try:
+                outcomes.append((func(item), None))
+            except Exception as exc:
+                outcomes.append((None, exc))
+    else:
+        futures = [executor.submit(func, item) for key, item in items]
+        outcomes = [
+            (None, future.exception()) if future.exception() else (future.result(), None)
+            for future in futures
+        ]
+    errors = [(key, exc) for (key, item), (result, exc) in zip(items, outcomes) if exc is not None]
+    if errors:
+        raise UploadStorageError(errors)
+    return [result for result, exc in outcomes]
+
+
+def is_allowed_file_type(file_name):
+    return os.path.splitext(file_name)[1].lstrip('.').lower() in app_settings.ALLOWED_FILE_TYPES
+
+
+def get_upload_limits(form):
+    form_definition = getattr(form, 'form_definition', None)
+    if form_definition is None:
+        return (app_settings.MAX_UPLOAD_SIZE, app_settings.MAX_UPLOAD_TOTAL_SIZE)
+    return form_definition.get_upload_limits()
+
+
+def add_form_error(form, field_name, msg):
+    if field_name == NON_FIELD_ERRORS and NON_FIELD_ERRORS in form._errors:
+        form._errors[NON_FIELD_ERRORS].append(msg)
+    else:
+        form._errors[field_name] = form.error_class([msg])
 
 
 def clean_files(form):
+    max_upload_size, max_upload_total_size = get_upload_limits(form)
+    # errors of files rejected by `FormUploadHandler` while they were being received
+    upload_errors = getattr(form, 'upload_errors', {})
     total_upload_size = 0
     for field in form.file_fields:
         uploaded_file = form.cleaned_data.get(field.name, None)
         msg = None
-        if uploaded_file is None:
+        if field.name in upload_errors:
+            msg = upload_errors[field.name]
+        elif uploaded_file is None:
             if field.required:
                 msg = _('This field is required.')
             else:
                 continue
         else:
             total_upload_size += uploaded_file._size
-            if not os.path.splitext(uploaded_file.name)[1].lstrip('.').lower() in  \
-                    app_settings.ALLOWED_FILE_TYPES:
+            if not is_allowed_file_type(uploaded_file.name):
                 msg = _('This file type is not allowed.')
-            elif uploaded_file._size > app_settings.MAX_UPLOAD_SIZE:
+            elif uploaded_file._size > max_upload_size:
                 msg = _('Please keep file size under %(max_size)s. Current size is %(size)s.') %  \
-                    {'max_size': filesizeformat(app_settings.MAX_UPLOAD_SIZE),
+                    {'max_size': filesizeformat(max_upload_size),
                      'size': filesizeformat(uploaded_file._size)}
         if msg:
-            form._errors[field.name] = form.error_class([msg])
+            add_form_error(form, field.name, msg)
 
-    if total_upload_size > app_settings.MAX_UPLOAD_TOTAL_SIZE:
+    if NON_FIELD_ERRORS in upload_errors:
+        add_form_error(form, NON_FIELD_ERRORS, upload_errors[NON_FIELD_ERRORS])
+    elif total_upload_size > max_upload_total_size:
         msg = _('Please keep total file size under %(max)s. Current total size is %(current)s.') %  \
-            {"max": filesizeformat(app_settings.MAX_UPLOAD_TOTAL_SIZE), "current": filesizeformat(total_upload_size)}
-
-        if NON_FIELD_ERRORS in form._errors:
-            form._errors[NON_FIELD_ERRORS].append(msg)
-        else:
-            form._errors[NON_FIELD_ERRORS] = form.error_class([msg])
+            {"max": filesizeformat(max_upload_total_size), "current": filesizeformat(total_upload_size)}
+        add_form_error(form, NON_FIELD_ERRORS, msg)
 
     return form.cleaned_data
 
 
+class FormUploadHandler(FileUploadHandler):
+    """
+    Enforce the file type and size limits of a form definition while the request is being received.
+
+    A file is skipped as soon as it turns out to be of a type that is not allowed or too large, so
+    its data is never kept in memory or written to disk; the rest of the request is still read, so
+    that the form can be shown again with the errors. The errors are stored as `request.upload_errors`,
+    from where `process_form` hands them on to `clean_files`.
+    """
+
+    def __init__(self, request, form_definition):
+        super(FormUploadHandler, self).__init__(request)
+        self.max_size, self.max_total_size = form_definition.get_upload_limits()
+        self.total_size = 0
+        self.file_size = 0
+        self.rejected = False
+        self.errors = request.upload_errors = {}
+
+    def skip(self, msg, field_name=None):
+        self.errors[field_name or self.field_name] = msg
+        self.total_size -= self.file_size
+        raise SkipFile()
+
+    def new_file(self, field_name, file_name, *args, **kwargs):
+        super(FormUploadHandler, self).new_file(field_name, file_name, *args, **kwargs)
+        self.file_size = 0
+        # Skipping a file closes the `file` of every handler, so it has to wait until the following
+        # handlers have started this file; until then, theirs is the previous, accepted one.
+        self.rejected = (NON_FIELD_ERRORS in self.errors)
+        if not is_allowed_file_type(file_name):
+            self.errors[field_name] = _('This file type is not allowed.')
+            self.rejected = True
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.rejected:
+            raise SkipFile()
+        self.file_size += len(raw_data)
+        self.total_size += len(raw_data)
+        if self.file_size > self.max_size:
+            self.skip(_('Please keep file size under %(max_size)s.') % {'max_size': filesizeformat(self.max_size)})
+        if self.total_size > self.max_total_size:
+            self.skip(
+                _('Please keep total file size under %(max)s.') % {'max': filesizeformat(self.max_total_size)},
+                field_name=NON_FIELD_ERRORS,
+            )
+        # the data is stored by the next handler
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def add_upload_handler(request, form_definition):
+    """
+    Make the request enforce the upload limits of the form definition while its files are received.
+
+    This has to happen before the request's POST data or files are accessed, which the CSRF middleware
+    does before calling views that are not `csrf_exempt`.
+    """
+    if request.method == 'POST' and get_compiled_form(form_definition).file_fields:
+        request.upload_handlers.insert(0, FormUploadHandler(request, form_definition))
+
+
+def get_content_hash(uploaded_file):
+    """
+    Get the hex digest of an HMAC of the file's content keyed with the `SECRET_KEY`, reading it in chunks.
+
+    Unlike a plain hash of the content, it can't be computed by whoever has the file, so the names of
+    content addressed files can't be guessed to find out whether a file was submitted.
+    """
+    content_hash = salted_hmac(CONTENT_HASH_SALT, '')
+    for chunk in uploaded_file.chunks():
+        content_hash.update(chunk)
+    uploaded_file.seek(0)
+    return content_hash.hexdigest()
+
+
+def save_content_addressed(storage, uploaded_file):
+    """
+    Save the file under a name derived from its content, unless a file with the same content has
+    been saved before. Returns the name of the stored file.
+
+    Should the same content be saved concurrently, the storage picks another name for one of the files,
+    so the content is stored twice; both files work, only the space is wasted.
+    """
+    content_hash = get_content_hash(uploaded_file)
+    ext = os.path.splitext(uploaded_file.name)[1].lower()
+    filename = os.path.join(
+        app_settings.FILE_STORAGE_DIR, 'blobs', content_hash[:2], content_hash[2:4], content_hash + ext
+    )
+    if storage.exists(filename):
+        return filename
+    return storage.save(filename, uploaded_file)
+
+
+def save_uploaded_file(storage, form_definition, uploaded_file):
+    """
+    Save the file and return the name of the stored file.
+    """
+    if app_settings.CONTENT_ADDRESSED_UPLOADS:
+        return save_content_addressed(storage, uploaded_file)
+    valid_file_name = storage.get_valid_name(uploaded_file.name)
+    root, ext = os.path.splitext(valid_file_name)
+    # every file gets its own hash, as files saved at the same time cannot make way for each other
+    filename = storage.get_available_name(
+        os.path.join(app_settings.FILE_STORAGE_DIR,
+                     form_definition.name,
+                     '%s_%s%s' % (root, get_random_hash(10), ext)))
+    return storage.save(filename, uploaded_file)
+
+
 def handle_uploaded_files(form_definition, form):
+    """
+    Store the files uploaded with the form, several at once if there are several, and replace them
+    in the form's cleaned data with `StoredUploadedFile`s.
+
+    :raises UploadStorageError: if any of the files could not be stored
+    :return: The stored files
+    :rtype: list[StoredUploadedFile]
+    """
     files = []
     if form_definition.save_uploaded_files and len(form.file_fields):
         storage = get_storage()
-        secret_hash = get_random_hash(10)
-        for field in form.file_fields:
-            uploaded_file = form.cleaned_data.get(field.name, None)
-            if uploaded_file is None:
-                continue
-            valid_file_name = storage.get_valid_name(uploaded_file.name)
-            root, ext = os.path.splitext(valid_file_name)
-            filename = storage.get_available_name(
-                os.path.join(app_settings.FILE_STORAGE_DIR,
-                             form_definition.name,
-                             '%s_%s%s' % (root, secret_hash, ext)))
-            storage.save(filename, uploaded_file)
-            form.cleaned_data[field.name] = StoredUploadedFile(filename)
-            files.append(storage.path(filename))
+        uploads = [
+            (field.name, form.cleaned_data[field.name]) for field in form.file_fields
+            if form.cleaned_data.get(field.name) is not None
+        ]
+        filenames = call_for_each(
+            lambda uploaded_file: save_uploaded_file(storage, form_definition, uploaded_file), uploads
+        )
+        for (field_name, uploaded_file), filename in zip(uploads, filenames):
+            app_metrics.inc('form_designer_upload_bytes_total', uploaded_file.size, form=form_definition.name)
+            form.cleaned_data[field_name] = StoredUploadedFile(filename)
+            files.append(form.cleaned_data[field_name])
     return files
 
 
+def get_download_url(name):
+    """
+    Get an absolute URL of the `download` view for the stored file, valid for
+    `settings.DOWNLOAD_LINK_MAX_AGE` seconds.
+    """
+    token = signing.dumps(name, salt=DOWNLOAD_SALT, compress=True)
+    return app_settings.SITE_URL + reverse('form_designer_download', kwargs={'token': token})
+
+
+def get_download_name(token):
+    """
+    Get the name of the stored file a download URL token was made for.
+
+    :raises django.core.signing.BadSignature: if the token is invalid or has expired
+    """
+    return signing.loads(token, salt=DOWNLOAD_SALT, max_age=app_settings.DOWNLOAD_LINK_MAX_AGE)
+
+
+def guess_content_type(name):
+    return mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+
 @python_2_unicode_compatible
 class StoredUploadedFile(FieldFile):
     """
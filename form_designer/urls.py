@@ -1,6 +1,10 @@
 from django.conf.urls import url
 
 urlpatterns = [
+    url(r'^files/(?P<token>[-\w:.]+)/$', 'form_designer.views.download', name='form_designer_download'),
+    url(r'^metrics/prometheus/$', 'form_designer.views.metrics', name='form_designer_metrics'),
     url(r'^(?P<object_name>[-\w]+)/$', 'form_designer.views.detail', name='form_designer_detail'),
+    url(r'^(?P<object_name>[-\w]+)/batch/$', 'form_designer.views.batch', name='form_designer_batch'),
     url(r'^h/(?P<public_hash>[-\w]+)/$', 'form_designer.views.detail_by_hash', name='form_designer_detail_by_hash'),
+    url(r'^h/(?P<public_hash>[-\w]+)/batch/$', 'form_designer.views.batch_by_hash', name='form_designer_batch_by_hash'),
 ]
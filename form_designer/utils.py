@@ -1,16 +1,186 @@
 import hashlib
+import threading
+import time
+from collections import OrderedDict
 
+from django.core.signals import request_finished
+from django.db import transaction
+from django.dispatch import receiver
 from django.utils.crypto import get_random_string
 from django.template import Context, Template, TemplateSyntaxError
 
+from form_designer import settings as app_settings
+
+TEMPLATE_TOKENS = ('{{', '{%', '{#')
+
 
 def get_random_hash(length=32):
     return hashlib.sha1(get_random_string().encode("utf8")).hexdigest()[:length]
 
 
 def string_template_replace(text, context_dict):
+    """
+    Render `text` as a Django template with the given context.
+
+    Texts that contain no template tags are returned as they are, and compiled templates are kept
+    in `template_cache`. Texts that are not valid templates, or fail to render, are returned as they are, too.
+    """
+    if not any(token in text for token in TEMPLATE_TOKENS):
+        return text
+    template = get_template_from_string(text)
+    if template is None:
+        return text
     try:
-        t = Template(text)
-        return t.render(Context(context_dict))
+        return template.render(Context(context_dict))
     except TemplateSyntaxError:
         return text
+
+
+def get_template_from_string(text):
+    """
+    Compile `text` into a `django.template.Template`, reusing the compiled templates in `template_cache`.
+
+    Returns None if the text is not a valid template.
+    """
+    template = template_cache.get(text)
+    if template is None:
+        try:
+            template = Template(text)
+        except TemplateSyntaxError:
+            template = False
+        template_cache.set(text, template)
+    return (template or None)
+
+
+def chunked(iterable, size):
+    """
+    Split an iterable into lists of at most `size` items.
+    """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def get_shared_cache():
+    """
+    Return the Django cache configured as form_designer's shared cache tier,
+    or None if no shared cache has been configured.
+    """
+    if not app_settings.CACHE_BACKEND:
+        return None
+    from django.core.cache import caches
+    return caches[app_settings.CACHE_BACKEND]
+
+
+def get_cache_generation(key):
+    """
+    Get the current value of a generation counter kept in the shared cache, for use in the keys of
+    cached data that must be dropped whenever the counter is bumped. Returns None if no shared
+    cache has been configured.
+    """
+    cache = get_shared_cache()
+    if cache is None:
+        return None
+    generation = cache.get(key)
+    if generation is None:
+        # Start from the current time, so data cached under an evicted counter is not reused.
+        cache.add(key, int(time.time() * 1000), None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_cache_generation(key):
+    cache = get_shared_cache()
+    if cache is None:
+        return
+    try:
+        cache.incr(key)
+    except ValueError:  # the counter does not exist yet, so there is nothing to invalidate
+        pass
+
+
+# Generation counters bumped inside a transaction on Django < 1.9, to be bumped again once the request is finished
+_pending_generations = threading.local()
+
+
+def bump_cache_generation_on_commit(key, using=None):
+    """
+    Bump a generation counter once the current transaction is committed. Bumping it earlier would let
+    other processes cache the data they still read from before the commit under the new generation.
+
+    Django 1.7 and 1.8 have no `transaction.on_commit`, so the counter is bumped right away and, if
+    that happened inside a transaction, again when the request is finished.
+    """
+    if hasattr(transaction, 'on_commit'):
+        transaction.on_commit(lambda: bump_cache_generation(key), using=using)
+        return
+    bump_cache_generation(key)
+    if transaction.get_connection(using).in_atomic_block:
+        if not hasattr(_pending_generations, 'keys'):
+            _pending_generations.keys = set()
+        _pending_generations.keys.add(key)
+
+
+@receiver(request_finished)
+def bump_pending_cache_generations(**kwargs):
+    keys = getattr(_pending_generations, 'keys', ())
+    _pending_generations.keys = set()
+    for key in keys:
+        bump_cache_generation(key)
+
+
+class LRUCache(object):
+    """
+    A thread-safe mapping holding at most `maxsize` entries, evicting the least recently used one first.
+
+    Lookups are counted in `hits` and `misses`.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._data[key] = value
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data), 'maxsize': self.maxsize}
+
+    def __len__(self):
+        return len(self._data)
+
+
+# compiled templates used by `get_template_from_string`, keyed by their source text
+template_cache = LRUCache(app_settings.TEMPLATE_CACHE_SIZE)
@@ -1,26 +1,69 @@
+import json
+import os
+import time
+from wsgiref.util import FileWrapper
 
 from django.contrib import messages
+from django.core import signing
 from django.core.context_processors import csrf
-from django.http import HttpResponseRedirect
+from django.http import (
+    Http404, HttpResponse, HttpResponseForbidden, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+)
 from django.shortcuts import get_object_or_404, render_to_response
 from django.template import RequestContext
+from django.utils.crypto import constant_time_compare
 from django.utils.module_loading import import_string
 from django.utils.translation import ugettext_lazy as _
+from django.views.decorators.cache import never_cache
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import require_POST
 
+from form_designer import metrics as app_metrics
 from form_designer import settings as app_settings
-from form_designer.models import FormDefinition
+from form_designer.batch import process_batch
+from form_designer.instrumentation import SubmissionTimer
+from form_designer.models import FormDefinition, FormLogPage, SubmissionPayload, get_cached_form_definition
 from form_designer.signals import designedform_error, designedform_render, designedform_submit, designedform_success
-from form_designer.uploads import handle_uploaded_files
+from form_designer.uploads import (
+    add_upload_handler, get_download_name, get_storage, guess_content_type, handle_uploaded_files
+)
 
 
 def get_designed_form_class():
     return import_string(app_settings.DESIGNED_FORM_CLASS)
 
 
+def _process_valid_form(request, form_definition, form, context, timer, push_messages, success_message):
+    """
+    Store the files of a valid submission, then announce, log and mail it.
+    """
+    # Handle file uploads using storage object
+    with timer.stage('files'):
+        files = handle_uploaded_files(form_definition, form)
+    # Extract the submitted data once, for the signal receivers, the log and the mail
+    payload = SubmissionPayload.from_form(form_definition, form, files)
+
+    # Successful submission
+    if push_messages:
+        messages.success(request, success_message)
+
+    designedform_success.send(sender=process_form, context=context,
+                              form_definition=form_definition, request=request, payload=payload)
+
+    if form_definition.log_data:
+        with timer.stage('log'):
+            context['form_log'] = form_definition.log(form, request.user, payload=payload)
+    if form_definition.mail_to:
+        with timer.stage('mail'):
+            context['form_mail_message'] = form_definition.send_mail(form, files, payload=payload)
+    timer.finish()
+
+
 def process_form(
     request, form_definition, extra_context=None, disable_redirection=False, push_messages=True,
     form_class=None
 ):
+    start = time.time()
     if extra_context is None:
         extra_context = {}
     if form_class is None:
@@ -34,35 +77,32 @@ def process_form(
     # If the form has been submitted...
     if request.method == 'POST' and request.POST.get(form_definition.submit_flag_name):
         form = form_class(form_definition, None, request.POST, request.FILES)
+        form.upload_errors = getattr(request, 'upload_errors', {})
         is_submit = True
     if request.method == 'GET' and request.GET.get(form_definition.submit_flag_name):
         form = form_class(form_definition, None, request.GET)
         is_submit = True
 
     if is_submit:
+        timer = SubmissionTimer(form_definition)
+        app_metrics.inc('form_designer_submissions_total', form=form_definition.name)
         designedform_submit.send(sender=process_form, context=context,
                                  form_definition=form_definition, request=request)
-        if form.is_valid():
-            # Handle file uploads using storage object
-            files = handle_uploaded_files(form_definition, form)
-
-            # Successful submission
-            if push_messages:
-                messages.success(request, success_message)
+        with timer.stage('validate'):
+            is_valid = form.is_valid()
+        if is_valid:
+            _process_valid_form(request, form_definition, form, context, timer, push_messages, success_message)
             form_success = True
-
-            designedform_success.send(sender=process_form, context=context,
-                                      form_definition=form_definition, request=request)
-
-            if form_definition.log_data:
-                context['form_log'] = form_definition.log(form, request.user)
-            if form_definition.mail_to:
-                context['form_mail_message'] = form_definition.send_mail(form, files)
             if form_definition.success_redirect and not disable_redirection:
+                app_metrics.observe(
+                    'form_designer_process_form_seconds', time.time() - start, form=form_definition.name
+                )
                 return HttpResponseRedirect(form_definition.action or '?')
             if form_definition.success_clear:
                 form = form_class(form_definition)  # clear form
         else:
+            timer.finish()
+            app_metrics.inc('form_designer_validation_errors_total', form=form_definition.name)
             form_error = True
             designedform_error.send(sender=process_form, context=context,
                                     form_definition=form_definition, request=request)
@@ -87,12 +127,13 @@ def process_form(
     context.update(csrf(request))
 
     if form_definition.display_logged:
-        logs = form_definition.logs.all().order_by('created')
-        context.update({'logs': logs})
+        context.update({'logs': form_definition.logs.get_page(cursor=FormLogPage.get_cursor(request.GET))})
 
+    app_metrics.observe('form_designer_process_form_seconds', time.time() - start, form=form_definition.name)
     return context
 
 
+@csrf_protect
 def _form_detail_view(request, form_definition):
     result = process_form(request, form_definition)
     if isinstance(result, HttpResponseRedirect):
@@ -104,11 +145,89 @@ def _form_detail_view(request, form_definition):
                               context_instance=RequestContext(request))
 
 
+def get_form_definition_or_404(**lookup):
+    try:
+        return get_cached_form_definition(**lookup)
+    except FormDefinition.DoesNotExist:
+        raise Http404()
+
+
+# The detail views are exempt from the CSRF middleware, which would read the request's files before the
+# upload limits of the form are set up; the CSRF check is done by `_form_detail_view` instead.
+@csrf_exempt
 def detail(request, object_name):
-    form_definition = get_object_or_404(FormDefinition, name=object_name, require_hash=False)
+    form_definition = get_form_definition_or_404(name=object_name)
+    if form_definition.require_hash:
+        raise Http404()
+    add_upload_handler(request, form_definition)
     return _form_detail_view(request, form_definition)
 
 
+@csrf_exempt
 def detail_by_hash(request, public_hash):
-    form_definition = get_object_or_404(FormDefinition, public_hash=public_hash)
+    form_definition = get_form_definition_or_404(public_hash=public_hash)
+    add_upload_handler(request, form_definition)
     return _form_detail_view(request, form_definition)
+
+
+def has_bearer_token(request, token):
+    return constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), 'Bearer %s' % token)
+
+
+@never_cache
+def metrics(request):
+    collector = app_metrics.get_collector()
+    if collector is None:
+        raise Http404()
+    if app_settings.METRICS_TOKEN and not has_bearer_token(request, app_settings.METRICS_TOKEN):
+        return HttpResponseForbidden()
+    return HttpResponse(collector.render(), content_type=app_metrics.CONTENT_TYPE)
+
+
+def download(request, token):
+    """
+    Serve an uploaded file linked to from a form mail.
+    """
+    try:
+        name = get_download_name(token)
+    except signing.BadSignature:
+        raise Http404()
+    storage = get_storage()
+    if not storage.exists(name):
+        raise Http404()
+    response = StreamingHttpResponse(FileWrapper(storage.open(name)), content_type=guess_content_type(name))
+    response['Content-Length'] = storage.size(name)
+    response['Content-Disposition'] = 'attachment; filename="%s"' % os.path.basename(name)
+    return response
+
+
+def _batch_view(request, **lookup):
+    if not app_settings.BATCH_SUBMISSION_TOKEN:
+        raise Http404()
+    if not has_bearer_token(request, app_settings.BATCH_SUBMISSION_TOKEN):
+        return HttpResponseForbidden()
+    form_definition = get_object_or_404(FormDefinition, **lookup)
+    try:
+        items = json.loads(request.body.decode(request.encoding or 'utf-8'))['submissions']
+    except (ValueError, KeyError, TypeError):
+        items = None
+    if not isinstance(items, list):
+        return JsonResponse({'error': 'Expected a JSON object with a list of "submissions".'}, status=400)
+    if len(items) > app_settings.BATCH_SUBMISSION_MAX_ITEMS:
+        return JsonResponse({
+            'error': 'At most %d submissions can be sent at once.' % app_settings.BATCH_SUBMISSION_MAX_ITEMS
+        }, status=400)
+    return JsonResponse(process_batch(request, form_definition, items, form_class=get_designed_form_class()))
+
+
+# Batches are authenticated by their token instead of a CSRF token.
+@csrf_exempt
+@require_POST
+def batch(request, object_name):
+    return _batch_view(request, name=object_name, require_hash=False)
+
+
+@csrf_exempt
+@require_POST
+def batch_by_hash(request, public_hash):
+    return _batch_view(request, public_hash=public_hash)